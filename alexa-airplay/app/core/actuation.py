@@ -0,0 +1,222 @@
+"""
+Actuation Tracker
+Measures how long it takes from sending a command to HA until the
+DeviceManager cache actually shows the expected result (paused, new
+volume, new track), per device and per command type.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+from .device_manager import DeviceManager
+
+logger = logging.getLogger(__name__)
+
+ACTUATION_TIMEOUT = float(os.getenv("ACTUATION_TIMEOUT", "15"))
+# While a command is pending we re-read that one entity at this pace
+# (backing off to POLL_MAX) instead of waiting for the 30 s full refresh.
+POLL_MIN = 0.25
+POLL_MAX = 2.0
+SAMPLES_PER_KEY = 200
+
+
+def _attrs(state: Optional[Dict]) -> Dict:
+    return (state or {}).get("attributes", {})
+
+
+def _expectation(command: str, value, before: Optional[Dict]) -> Callable[[Dict], bool]:
+    """Build the predicate that says a command has taken effect."""
+    if command == "play":
+        return lambda s: s.get("state") == "playing"
+    if command == "pause":
+        return lambda s: s.get("state") in ("paused", "idle", "standby")
+    if command == "stop":
+        return lambda s: s.get("state") in ("idle", "paused", "standby", "off")
+    if command == "volume":
+        target = float(value)
+        return lambda s: (
+            _attrs(s).get("volume_level") is not None
+            and abs(float(_attrs(s)["volume_level"]) - target) < 0.015
+        )
+    # next / previous / play_media: the track has to change
+    prev_track = (_attrs(before).get("media_title"), _attrs(before).get("media_content_id"))
+    return lambda s: (
+        s.get("state") == "playing"
+        and (_attrs(s).get("media_title"), _attrs(s).get("media_content_id")) != prev_track
+    )
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class _Pending:
+    __slots__ = ("correlation_id", "entity_id", "command", "issued_at",
+                 "issued_wall", "accepted_ms", "predicate")
+
+    def __init__(self, correlation_id, entity_id, command, issued_at,
+                 accepted_ms, predicate):
+        self.correlation_id = correlation_id
+        self.entity_id = entity_id
+        self.command = command
+        self.issued_at = issued_at
+        self.issued_wall = time.time() - (time.monotonic() - issued_at)
+        self.accepted_ms = accepted_ms
+        self.predicate = predicate
+
+
+class _Stats:
+    __slots__ = ("samples", "ok", "timeouts")
+
+    def __init__(self):
+        self.samples: Deque[float] = deque(maxlen=SAMPLES_PER_KEY)
+        self.ok = 0
+        self.timeouts = 0
+
+    def to_dict(self) -> Dict:
+        return _summary(self.samples, self.ok, self.timeouts)
+
+
+def _summary(samples: Iterable[float], ok: int, timeouts: int) -> Dict:
+    ordered = sorted(samples)
+    total = ok + timeouts
+    return {
+        "count": total,
+        "timeouts": timeouts,
+        "failure_rate": round(timeouts / total, 3) if total else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000),
+        "p90_ms": round(_percentile(ordered, 0.90) * 1000),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000),
+        "max_ms": round(ordered[-1] * 1000) if ordered else 0,
+    }
+
+
+class ActuationTracker:
+    """Correlates commands with the state change they should cause."""
+
+    def __init__(self, device_manager: DeviceManager, timeout: float = ACTUATION_TIMEOUT):
+        self.dm = device_manager
+        self.timeout = timeout
+        self._pending: Dict[str, _Pending] = {}          # entity_id -> latest pending
+        self._watchers: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[tuple, _Stats] = {}            # (entity_id, command) -> stats
+        self._recent: Deque[Dict] = deque(maxlen=100)
+        self.dm.add_listener(self._on_state_change)
+
+    # ── public API ────────────────────────────────────────────
+    def track(self, correlation_id: str, entity_id: str, command: str,
+              issued_at: float, value=None) -> None:
+        """Start watching for the effect of a command HA has accepted.
+
+        ``issued_at`` is the ``time.monotonic()`` taken just before the
+        service call, so the latency includes the HA round trip.
+        """
+        before = self.dm.devices.get(entity_id)
+        try:
+            predicate = _expectation(command, value, before)
+        except (TypeError, ValueError):
+            return
+        superseded = self._pending.get(entity_id)
+        if superseded:
+            self._finish(superseded, "superseded")
+        pending = _Pending(correlation_id, entity_id, command, issued_at,
+                           round((time.monotonic() - issued_at) * 1000), predicate)
+        self._pending[entity_id] = pending
+        if before is not None and predicate(before) and command in ("play", "pause", "stop", "volume"):
+            # Already in the target state – nothing observable will change.
+            self._finish(pending, "noop")
+            return
+        if entity_id not in self._watchers or self._watchers[entity_id].done():
+            self._watchers[entity_id] = asyncio.create_task(self._watch(entity_id))
+
+    def to_dict(self, entity_id: str = None, correlation_id: str = None) -> Dict:
+        devices: Dict[str, Dict] = {}
+        # Per-command totals over every sample of the selected devices.
+        commands: Dict[str, List] = {}
+        for (eid, cmd), st in self._stats.items():
+            if entity_id and eid != entity_id:
+                continue
+            devices.setdefault(eid, {})[cmd] = st.to_dict()
+            agg = commands.setdefault(cmd, [[], 0, 0])
+            agg[0].extend(st.samples)
+            agg[1] += st.ok
+            agg[2] += st.timeouts
+        recent = list(self._recent)
+        if correlation_id:
+            recent = [r for r in recent if r["correlation_id"] == correlation_id]
+        return {
+            "devices": devices,
+            "commands": {cmd: _summary(*agg) for cmd, agg in commands.items()},
+            "pending": [
+                {"correlation_id": p.correlation_id, "entity_id": p.entity_id,
+                 "command": p.command, "issued_at": p.issued_wall}
+                for p in self._pending.values()
+            ],
+            "recent": recent,
+            "timeout_s": self.timeout,
+        }
+
+    async def stop(self):
+        self.dm.remove_listener(self._on_state_change)
+        for task in self._watchers.values():
+            task.cancel()
+        self._watchers.clear()
+
+    # ── internals ─────────────────────────────────────────────
+    def _on_state_change(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        pending = self._pending.get(entity_id)
+        if pending and new is not None and pending.predicate(new):
+            self._finish(pending, "ok")
+
+    async def _watch(self, entity_id: str):
+        """Poll one entity while it has a command in flight."""
+        delay = POLL_MIN
+        try:
+            while True:
+                pending = self._pending.get(entity_id)
+                if pending is None:
+                    return
+                if time.monotonic() - pending.issued_at >= self.timeout:
+                    self._finish(pending, "timeout")
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, POLL_MAX)
+                await self.dm.refresh_entity(entity_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Actuation watch for %s failed: %s", entity_id, e)
+        finally:
+            self._watchers.pop(entity_id, None)
+
+    def _finish(self, pending: _Pending, outcome: str):
+        if self._pending.get(pending.entity_id) is pending:
+            del self._pending[pending.entity_id]
+        latency = time.monotonic() - pending.issued_at
+        if outcome in ("ok", "timeout"):
+            st = self._stats.setdefault((pending.entity_id, pending.command), _Stats())
+            if outcome == "ok":
+                st.ok += 1
+                st.samples.append(latency)
+            else:
+                st.timeouts += 1
+        self._recent.append({
+            "correlation_id": pending.correlation_id,
+            "entity_id": pending.entity_id,
+            "command": pending.command,
+            "issued_at": pending.issued_wall,
+            "accepted_ms": pending.accepted_ms,
+            "latency_ms": round(latency * 1000) if outcome == "ok" else None,
+            "outcome": outcome,
+        })
+        logger.debug("Actuation %s %s %s: %s after %.0f ms", pending.correlation_id,
+                     pending.entity_id, pending.command, outcome, latency * 1000)
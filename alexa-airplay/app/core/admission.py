@@ -0,0 +1,160 @@
+"""
+Admission Control
+Keeps the web server responsive when the event loop falls behind
+(slow armv7 hosts, a refresh and several dashboards at once).
+
+A monitor task measures how late the loop wakes it up.  Every request
+is put in a route class with its own in-flight limit and a loop-lag
+threshold above which new requests of that class are turned away with
+503 + Retry-After.  Polling-type reads go first; health checks and
+playback commands (stop/pause included) are never shed for lag, so the
+Supervisor watchdog and the user's "stop" still get through.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LAG_SAMPLES = 600
+SHED_LAG_NORMAL = float(os.getenv("SHED_LAG_NORMAL", "1.0"))
+SHED_LAG_LOW = float(os.getenv("SHED_LAG_LOW", "0.25"))
+
+# class -> (max in flight or None, shed above this loop lag in s or None)
+ROUTE_CLASSES: Dict[str, Tuple[Optional[int], Optional[float]]] = {
+    "critical": (None, None),
+    "control": (32, None),
+    "normal": (16, SHED_LAG_NORMAL),
+    "stream": (None, SHED_LAG_NORMAL),
+    "low": (8, SHED_LAG_LOW),
+}
+# Anything not listed: GETs under /api/ and /debug/ are "low", the rest
+# "normal".
+_ROUTE_CLASS = {
+    "/health": "critical",
+    "/api/command": "control",
+    "/api/restore": "control",
+    "/api/fade": "control",
+    "/stream/live": "stream",
+}
+_LEADING_SLASHES = re.compile(r"^/{2,}")
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag by timing a short periodic sleep.
+
+    ``current()`` rises immediately with a bad sample and decays slowly,
+    and also counts a stall that is still in progress, so the very
+    first request served after a blocked loop already sees it.
+    """
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._samples: deque = deque(maxlen=LAG_SAMPLES)
+        self._due: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - self._due)
+            self._samples.append(sample)
+            self.max_lag = max(self.max_lag, sample)
+            self.lag = sample if sample > self.lag else 0.8 * self.lag + 0.2 * sample
+
+    def current(self) -> float:
+        if self._due is None:
+            return self.lag
+        stalled = asyncio.get_event_loop().time() - self._due
+        return max(self.lag, stalled)
+
+    def to_dict(self) -> Dict:
+        samples = sorted(self._samples)
+        return {
+            "lag_ms": round(self.current() * 1000, 1),
+            "p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 1) if samples else None,
+            "max_ms": round(self.max_lag * 1000, 1),
+        }
+
+
+class AdmissionController:
+    """Per-route-class in-flight limits and lag-based shedding."""
+
+    def __init__(self, monitor: LoopLagMonitor,
+                 classes: Dict[str, Tuple[Optional[int], Optional[float]]] = None):
+        self.monitor = monitor
+        self.classes = classes or ROUTE_CLASSES
+        self.in_flight: Dict[str, int] = {name: 0 for name in self.classes}
+        self.admitted: Dict[str, int] = {name: 0 for name in self.classes}
+        self.shed: Dict[str, int] = {name: 0 for name in self.classes}
+        # class -> shed count when its current shedding spell began; logged
+        # on entering and leaving a spell, not per request.
+        self._shedding: Dict[str, int] = {}
+
+    @staticmethod
+    def classify(method: str, path: str) -> str:
+        path = _LEADING_SLASHES.sub("/", path)
+        cls = _ROUTE_CLASS.get(path)
+        if cls is not None:
+            return cls
+        if method == "GET" and path.startswith(("/api/", "/debug/")):
+            return "low"
+        return "normal"
+
+    def try_admit(self, cls: str) -> Optional[int]:
+        """Take an in-flight slot for ``cls``; on refusal return the
+        Retry-After seconds instead."""
+        limit, shed_lag = self.classes[cls]
+        if shed_lag is not None:
+            lag = self.monitor.current()
+            if lag > shed_lag:
+                self._refuse(cls, "loop lag %dms", lag * 1000)
+                return max(1, math.ceil(lag))
+        if limit is not None and self.in_flight[cls] >= limit:
+            self._refuse(cls, "%d in flight", limit)
+            return 1
+        if cls in self._shedding:
+            logger.info("Admitting %s requests again (%d shed)", cls,
+                        self.shed[cls] - self._shedding.pop(cls))
+        self.in_flight[cls] += 1
+        self.admitted[cls] += 1
+        return None
+
+    def _refuse(self, cls: str, reason: str, arg):
+        if cls not in self._shedding:
+            self._shedding[cls] = self.shed[cls]
+            logger.warning("Shedding %s requests: " + reason, cls, arg)
+        self.shed[cls] += 1
+
+    def release(self, cls: str):
+        self.in_flight[cls] -= 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "loop": self.monitor.to_dict(),
+            "classes": {
+                name: {"limit": limit, "shed_above_lag_ms": None if lag is None else lag * 1000,
+                       "in_flight": self.in_flight[name], "admitted": self.admitted[name],
+                       "shed": self.shed[name]}
+                for name, (limit, lag) in self.classes.items()
+            },
+        }
@@ -0,0 +1,96 @@
+"""
+Announcements
+Sends one message to many Echo devices with as few HA service calls as
+possible so that whole-house announcements arrive together.
+
+Alexa Media Player's ``notify.alexa_media`` takes a list of media_player
+targets, so Echo targets are grouped into batches and the batches are
+dispatched concurrently.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List
+
+from .device_manager import DeviceManager
+from .fanout import fan_out
+from .ha_integration import HARouter
+
+logger = logging.getLogger(__name__)
+
+ANNOUNCE_SERVICE = os.getenv("ANNOUNCE_SERVICE", "alexa_media")
+ANNOUNCE_BATCH_SIZE = int(os.getenv("ANNOUNCE_BATCH_SIZE", "10"))
+ANNOUNCE_TYPES = ("announce", "tts")
+
+
+class Announcer:
+    """Batched notify.alexa_media dispatcher."""
+
+    def __init__(self, ha_client: HARouter, device_manager: DeviceManager,
+                 batch_size: int = ANNOUNCE_BATCH_SIZE):
+        self.ha = ha_client
+        self.dm = device_manager
+        self.batch_size = max(1, batch_size)
+
+    def resolve_group(self, group: str) -> List[str]:
+        """Expand a named group into entity ids.  "all" is every device
+        that can receive an announcement – only Alexa Media Player
+        devices can – so it is the same set as "echo"."""
+        if group in ("all", "echo"):
+            return sorted(d["entity_id"] for d in self.dm.get_echo_devices())
+        return []
+
+    async def announce(self, message: str, entity_ids: List[str],
+                       kind: str = "announce") -> Dict:
+        start = time.monotonic()
+        echo_ids = {d["entity_id"] for d in self.dm.get_echo_devices()}
+        targets: Dict[str, Dict] = {}
+        eligible = []
+        for eid in dict.fromkeys(entity_ids):        # de-dupe, keep order
+            if eid in echo_ids:
+                eligible.append(eid)
+            else:
+                targets[eid] = {"ok": False, "error": "not an Alexa Media Player device"}
+
+        batches = {
+            str(i // self.batch_size): eligible[i:i + self.batch_size]
+            for i in range(0, len(eligible), self.batch_size)
+        }
+
+        async def send(key: str) -> bool:
+            return await self.ha.notify(ANNOUNCE_SERVICE, message,
+                                        batches[key], {"type": kind})
+
+        results = await fan_out(batches, send)
+
+        for key, res in results.items():
+            for eid in batches[key]:
+                targets[eid] = {"ok": res["ok"], "batch": int(key),
+                                "acked_ms": res["done_at_ms"] if res["ok"] else None}
+
+        # A batch can fail because of a single bad member – retry those
+        # members one by one (concurrently) so the rest still hear it.
+        retry = [eid for key, res in results.items()
+                 if not res["ok"] and len(batches[key]) > 1 for eid in batches[key]]
+        if retry:
+            offset = round((time.monotonic() - start) * 1000)
+
+            async def send_one(eid: str) -> bool:
+                return await self.ha.notify(ANNOUNCE_SERVICE, message, [eid], {"type": kind})
+
+            for eid, res in (await fan_out(retry, send_one)).items():
+                targets[eid].update(
+                    ok=res["ok"], retried=True,
+                    acked_ms=offset + res["done_at_ms"] if res["ok"] else None,
+                )
+
+        acks = [t["acked_ms"] for t in targets.values() if t.get("ok")]
+        calls = len(batches) + len(retry)
+        logger.info("Announcement to %d target(s) in %d call(s)", len(eligible), calls)
+        return {
+            "targets": targets,
+            "service_calls": calls,
+            "spread_ms": (max(acks) - min(acks)) if acks else None,
+            "total_ms": round((time.monotonic() - start) * 1000),
+        }
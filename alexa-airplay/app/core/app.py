@@ -5,10 +5,25 @@ Wires together the HA client, device manager, and web UI.
 
 import asyncio
 import logging
+import os
 
-from .ha_integration import HAClient
-from .device_manager import DeviceManager
+from .ha_integration import HA_POOL_SIZE, HAClient, HARouter, load_backends
+from .device_manager import REFRESH_INTERVAL, DeviceManager
+from .fade import FadeEngine
+from .actuation import ActuationTracker
+from .announce import Announcer
+from .browse import MediaBrowser
+from .logging_setup import LOG_FORMAT, set_format
+from .options import OptionsWatcher
+from .raop import RAOPServer
+from .registry import RegistryWatcher
+from .scheduler import Scheduler
+from .snapshot import SnapshotManager
+from .stream import AirPlayStreamSource, StreamHub
+from .traffic import HA_RECORD_FILE, HA_REPLAY_FILE, TrafficRecorder, load_replay
 from .web_ui import WebUIServer
+from .webhooks import WebhookDispatcher
+from .workers import LEADER_SOCKET, WEB_WORKERS, SnapshotPublisher, WorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -18,25 +33,114 @@ class AlexaMusicController:
     send playback commands via the HA media_player service."""
 
     def __init__(self):
-        self.ha = HAClient()
+        self.recorder = None
+        if HA_REPLAY_FILE:
+            self.ha = HARouter(*load_replay(HA_REPLAY_FILE))
+        else:
+            self.ha = HARouter(HAClient(), load_backends())
+            if HA_RECORD_FILE:
+                self.recorder = TrafficRecorder(HA_RECORD_FILE)
+                for client in self.ha.clients.values():
+                    client.recorder = self.recorder
         self.device_manager = DeviceManager(self.ha)
-        self.web_ui = WebUIServer(self.ha, self.device_manager)
+        # A recording has no websocket traffic to replay.
+        self.registries = [] if HA_REPLAY_FILE else [
+            RegistryWatcher(client, self.device_manager.apply_registry)
+            for client in self.ha.clients.values()
+        ]
+        self.actuation = ActuationTracker(self.device_manager)
+        self.snapshots = SnapshotManager(self.ha, self.device_manager)
+        self.announcer = Announcer(self.ha, self.device_manager)
+        self.browser = MediaBrowser(self.ha)
+        self.webhooks = WebhookDispatcher(self.device_manager)
+        self.fades = FadeEngine(self.ha, self.device_manager)
+        self.scheduler = Scheduler(self.ha, self.device_manager, self.fades)
+        self.airplay = RAOPServer()
+        self.stream = StreamHub()
+        self._stream_source = AirPlayStreamSource(self.stream)
+        self.airplay.on_format = self._stream_source.on_format
+        self.airplay.sink = self._stream_source.sink
+        # Worker mode: this process becomes the leader behind WEB_WORKERS
+        # web workers that share the public port.
+        self.workers = WorkerPool(WEB_WORKERS) if WEB_WORKERS > 0 else None
+        self.web_ui = WebUIServer(self.ha, self.device_manager,
+                                  actuation=self.actuation,
+                                  snapshots=self.snapshots,
+                                  announcer=self.announcer,
+                                  airplay=self.airplay,
+                                  stream=self.stream,
+                                  browser=self.browser,
+                                  webhooks=self.webhooks,
+                                  scheduler=self.scheduler,
+                                  fades=self.fades,
+                                  workers=self.workers,
+                                  unix_socket=LEADER_SOCKET if self.workers else None)
+        self.publisher = (SnapshotPublisher(self.device_manager, self.web_ui.devices_snapshot)
+                          if self.workers else None)
+        self.options = OptionsWatcher()
+        self.options.on("refresh_interval", self.device_manager.set_refresh_interval,
+                        REFRESH_INTERVAL)
+        self.options.on("ha_pool_size", self.ha.set_pool_size, HA_POOL_SIZE)
+        self.options.on("debug_logging", self._set_debug_logging, False)
+        self.options.on("log_format", set_format, LOG_FORMAT)
+        self.options.on("webhooks", self.webhooks.configure, [])
         self.running = False
 
+    @staticmethod
+    def _set_debug_logging(enabled):
+        base = os.getenv("LOG_LEVEL", "INFO").upper()
+        if base == "DEBUG":          # start.sh derives it from debug_logging
+            base = "INFO"
+        level = logging.DEBUG if enabled else getattr(logging, base, logging.INFO)
+        root = logging.getLogger()
+        if root.level != level:
+            root.setLevel(level)
+            logger.info("Log level set to %s", logging.getLevelName(level))
+
     async def start(self):
         """Launch all services concurrently."""
         self.running = True
         logger.info("Starting Alexa Music Controller...")
 
+        try:
+            await self.airplay.start()
+        except OSError as e:
+            logger.error("AirPlay receiver could not bind port %d: %s",
+                         self.airplay.port, e)
+
+        await self.webhooks.start()
         web_task = asyncio.create_task(self.web_ui.start())
         device_task = asyncio.create_task(self.device_manager.start())
+        options_task = asyncio.create_task(self.options.start())
+        scheduler_task = asyncio.create_task(self.scheduler.start())
+        fade_task = asyncio.create_task(self.fades.start())
+        background = [asyncio.create_task(r.start()) for r in self.registries]
+        if self.workers:
+            background += [asyncio.create_task(self.publisher.start()),
+                           asyncio.create_task(self.workers.start())]
 
-        await asyncio.gather(web_task, device_task)
+        await asyncio.gather(web_task, device_task, options_task, scheduler_task, fade_task,
+                             *background)
 
     async def shutdown(self):
         logger.info("Shutting down Alexa Music Controller...")
         self.running = False
+        await self.options.stop()
+        if self.workers:
+            await self.workers.stop()
+            await self.publisher.stop()
+        for registry in self.registries:
+            await registry.stop()
+        await self.scheduler.stop()
+        await self.fades.stop()
         await self.device_manager.stop()
+        await self.actuation.stop()
+        await self.webhooks.stop()
+        self.browser.stop()
+        self.stream.stop()
         await self.web_ui.stop()
+        await self.airplay.stop()
         await self.ha.close()
+        if self.recorder:
+            self.recorder.close()
         logger.info("Shutdown complete")
@@ -0,0 +1,127 @@
+"""
+Media Browsing
+Walks a media_player's browse_media tree through HA and caches every
+node, so moving around a library is instant after the first visit.
+
+Identical concurrent browses share one HA call, and after a node is
+fetched its first few expandable children are prefetched in the
+background (one level only, at low concurrency).
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, Optional, Set
+
+from .cache import SingleFlight, TTLCache
+from .ha_integration import HARouter
+
+logger = logging.getLogger(__name__)
+
+BROWSE_CACHE_SIZE = int(os.getenv("BROWSE_CACHE_SIZE", "500"))
+BROWSE_TTL = float(os.getenv("BROWSE_TTL", "600"))
+# The root lists sources/services, which change more often than a playlist.
+BROWSE_ROOT_TTL = float(os.getenv("BROWSE_ROOT_TTL", "120"))
+BROWSE_PREFETCH = int(os.getenv("BROWSE_PREFETCH", "4"))
+PREFETCH_CONCURRENCY = 2
+
+_NODE_FIELDS = ("title", "media_class", "media_content_type", "media_content_id",
+                "can_play", "can_expand", "thumbnail")
+
+
+def _slim(node: Dict) -> Dict:
+    return {k: node.get(k) for k in _NODE_FIELDS}
+
+
+class MediaBrowser:
+    """Cached, single-flight browse_media for WebUIServer."""
+
+    def __init__(self, ha_client: HARouter):
+        self.ha = ha_client
+        self.cache = TTLCache(BROWSE_CACHE_SIZE, BROWSE_TTL)
+        self._flights = SingleFlight()
+        self._prefetch_sem = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        self._prefetching: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(entity_id: str, content_type: Optional[str], content_id: Optional[str]) -> tuple:
+        if not (content_type and content_id):
+            content_type = content_id = None
+        return entity_id, content_type, content_id
+
+    def is_cached(self, entity_id: str, content_type: str = None,
+                  content_id: str = None) -> bool:
+        return self._key(entity_id, content_type, content_id) in self.cache
+
+    async def browse(self, entity_id: str, content_type: str = None,
+                     content_id: str = None) -> Optional[Dict]:
+        """One node with its children; None if HA couldn't browse it.
+
+        The result carries ``cached`` so callers can see what was served
+        from memory.
+        """
+        key = self._key(entity_id, content_type, content_id)
+        node = self.cache.get(key)
+        if node is not None:
+            return {**node, "cached": True}
+        node = await self._flights.do(key, lambda: self._fetch(key))
+        if node is None:
+            return None
+        self._prefetch(entity_id, node)
+        return {**node, "cached": False}
+
+    async def _fetch(self, key: tuple) -> Optional[Dict]:
+        entity_id, content_type, content_id = key
+        raw = await self.ha.browse_media(entity_id, content_type, content_id)
+        if not isinstance(raw, dict):
+            return None
+        node = _slim(raw)
+        node["children"] = [_slim(c) for c in raw.get("children") or []]
+        self.cache.set(key, node, BROWSE_ROOT_TTL if content_id is None else None)
+        return node
+
+    # ── prefetch ──────────────────────────────────────────────
+    def _prefetch(self, entity_id: str, node: Dict):
+        if BROWSE_PREFETCH <= 0:
+            return
+        wanted = []
+        for child in node["children"]:
+            if not child.get("can_expand"):
+                continue
+            key = self._key(entity_id, child.get("media_content_type"),
+                            child.get("media_content_id"))
+            if key[2] is None or key in self.cache or key in self._flights:
+                continue
+            wanted.append(key)
+            if len(wanted) >= BROWSE_PREFETCH:
+                break
+        for key in wanted:
+            task = asyncio.ensure_future(self._prefetch_one(key))
+            self._prefetching.add(task)
+            task.add_done_callback(self._prefetching.discard)
+
+    async def _prefetch_one(self, key: tuple):
+        async with self._prefetch_sem:
+            if key in self.cache or self.ha.breaker_for(key[0]).rejecting():
+                return
+            try:
+                await self._flights.do(key, lambda: self._fetch(key))
+            except Exception as e:
+                logger.debug("Prefetch of %s failed: %s", key, e)
+
+    def invalidate(self, entity_id: str = None) -> int:
+        if entity_id is None:
+            n = len(self.cache)
+            self.cache.clear()
+            return n
+        return self.cache.invalidate(lambda k: k[0] == entity_id)
+
+    def stop(self):
+        for task in list(self._prefetching):
+            task.cancel()
+        self._flights.cancel_all()
+
+    def to_dict(self) -> Dict:
+        return {**self.cache.to_dict(),
+                "shared_fetches": self._flights.shared,
+                "prefetching": len(self._prefetching)}
@@ -0,0 +1,108 @@
+"""
+Caching Helpers
+A bounded LRU cache with per-entry TTLs and a single-flight helper that
+lets concurrent callers share one in-progress fetch.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """LRU-bounded mapping whose entries expire after their own TTL.
+
+    Expired entries are dropped lazily on access; when full, the least
+    recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (expires, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every key for which ``predicate(key)`` is true."""
+        doomed = [k for k in self._data if predicate(k)]
+        for k in doomed:
+            del self._data[k]
+        return len(doomed)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def to_dict(self) -> Dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one awaitable.
+
+    The first caller starts ``fn()``; callers arriving while it runs
+    await the same task.  A caller being cancelled does not cancel the
+    shared work for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f, k=key: self._forget(k, f))
+        else:
+            self.shared += 1
+        return await asyncio.shield(fut)
+
+    def _forget(self, key: Hashable, fut: asyncio.Future):
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def cancel_all(self):
+        for fut in list(self._inflight.values()):
+            fut.cancel()
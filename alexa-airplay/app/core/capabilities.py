@@ -0,0 +1,62 @@
+"""
+Capabilities
+Decodes a media_player's ``supported_features`` bitmask
+(HA's MediaPlayerEntityFeature) into named capabilities, so unsupported
+commands can be rejected locally instead of costing an HA round trip.
+"""
+
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+
+# MediaPlayerEntityFeature values from homeassistant.components.media_player
+FEATURES = {
+    "pause": 1,
+    "seek": 2,
+    "volume_set": 4,
+    "volume_mute": 8,
+    "previous_track": 16,
+    "next_track": 32,
+    "turn_on": 128,
+    "turn_off": 256,
+    "play_media": 512,
+    "volume_step": 1024,
+    "select_source": 2048,
+    "stop": 4096,
+    "clear_playlist": 8192,
+    "play": 16384,
+    "shuffle_set": 32768,
+    "select_sound_mode": 65536,
+    "browse_media": 131072,
+    "repeat_set": 262144,
+    "grouping": 524288,
+    "media_announce": 1048576,
+    "media_enqueue": 2097152,
+}
+
+# API command name -> capability it needs
+COMMAND_CAPABILITY = {
+    "play": "play",
+    "pause": "pause",
+    "stop": "stop",
+    "next": "next_track",
+    "previous": "previous_track",
+    "volume": "volume_set",
+    "play_media": "play_media",
+    "select_source": "select_source",
+    "browse": "browse_media",
+}
+
+
+@lru_cache(maxsize=512)
+def decode(mask: int) -> FrozenSet[str]:
+    """Capability names set in ``mask`` (cached – masks repeat a lot)."""
+    return frozenset(name for name, bit in FEATURES.items() if mask & bit)
+
+
+@lru_cache(maxsize=512)
+def as_list(mask: int) -> Tuple[str, ...]:
+    return tuple(sorted(decode(mask)))
+
+
+def required(command: str) -> Optional[str]:
+    return COMMAND_CAPABILITY.get(command)
@@ -0,0 +1,124 @@
+"""
+Circuit Breaker
+Tracks consecutive Home Assistant failures so callers can fail fast
+while HA (or the Supervisor proxy in front of it) is restarting.
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Classic closed → open → half-open breaker.
+
+    closed     every request is allowed; consecutive failures are counted
+    open       requests are rejected until ``reset_timeout`` has passed
+    half_open  exactly one probe request is let through; its outcome
+               decides whether we close again or re-open
+    """
+
+    def __init__(self, name: str = "ha",
+                 failure_threshold: int = None,
+                 reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = max(1, int(
+            failure_threshold if failure_threshold is not None
+            else os.getenv("HA_BREAKER_FAILURES", "5")
+        ))
+        self.reset_timeout = max(0.1, float(
+            reset_timeout if reset_timeout is not None
+            else os.getenv("HA_BREAKER_RESET", "15")
+        ))
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    # ── state ─────────────────────────────────────────────────
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._probe_due():
+            return HALF_OPEN
+        return self._state
+
+    def _probe_due(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def rejecting(self) -> bool:
+        """True if a request made right now would be refused.
+
+        Unlike :meth:`allow` this does not claim the half-open probe slot,
+        so the web layer can use it to fail fast before doing any work.
+        """
+        if self._state == CLOSED:
+            return False
+        if self._state == OPEN and not self._probe_due():
+            return True
+        return self._probe_in_flight
+
+    def retry_after(self) -> int:
+        """Seconds until the next probe is allowed (at least 1)."""
+        if self._state == CLOSED:
+            return 0
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    # ── request accounting ────────────────────────────────────
+    def allow(self) -> bool:
+        """Decide whether a request may go upstream, claiming the probe
+        slot when the breaker is half-open."""
+        if self._state == CLOSED:
+            return True
+        if self._state == OPEN:
+            if not self._probe_due():
+                return False
+            self._state = HALF_OPEN
+            logger.info("Circuit %s half-open, probing HA", self.name)
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self._state != CLOSED:
+            logger.info("Circuit %s closed, HA reachable again", self.name)
+        self._state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Give the probe slot back without judging HA (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN:
+            self._trip()
+            return
+        self._failures += 1
+        if self._state == CLOSED and self._failures >= self.failure_threshold:
+            self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        logger.warning(
+            "Circuit %s open after %d failure(s); failing fast for %.0fs",
+            self.name, self._failures, self.reset_timeout,
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "retry_after": self.retry_after(),
+        }
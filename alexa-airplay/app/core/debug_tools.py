@@ -0,0 +1,256 @@
+"""
+Debug Tools
+On-demand CPU / memory / asyncio introspection for the running add-on.
+
+Everything here is opt-in: the routes are only registered when
+DEBUG_ENDPOINTS is enabled, and profilers, tracemalloc and loop debug
+mode are only switched on for the duration of an explicit request.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+
+# The add-on is only reachable through HA ingress (panel_admin: true),
+# which always connects from the Supervisor's fixed ingress address.
+_ADMIN_PEERS = ("172.30.32.2", "127.0.0.1", "::1")
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Collects asyncio's "Executing <Handle ...> took N seconds" warnings."""
+
+    def __init__(self, sink: deque):
+        super().__init__(logging.WARNING)
+        self.sink = sink
+
+    def emit(self, record):
+        msg = record.getMessage()
+        if msg.startswith("Executing "):
+            self.sink.append({"at": record.created, "message": msg})
+
+
+class DebugTools:
+    """Admin-only profiling endpoints for WebUIServer."""
+
+    def __init__(self):
+        self._profile_lock = asyncio.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._slow: deque = deque(maxlen=200)
+        self._slow_handler: Optional[_SlowCallbackHandler] = None
+
+    def register(self, add_route):
+        add_route('GET', '/debug/profile', self._profile)
+        add_route('GET', '/debug/memory', self._memory)
+        add_route('GET', '/debug/tasks', self._tasks)
+
+    @staticmethod
+    def _forbidden(request) -> Optional[web.Response]:
+        if request.remote in _ADMIN_PEERS:
+            return None
+        return web.json_response({"error": "Forbidden"}, status=403)
+
+    # ── CPU ───────────────────────────────────────────────────
+    async def _profile(self, request):
+        """GET /debug/profile?seconds=5&mode=cprofile|sample
+
+        cprofile  deterministic profile of everything the loop runs,
+                  returned as pstats text (sort=, limit=)
+        sample    wall-clock stack sampling of the loop thread, returned
+                  as collapsed stacks ready for flamegraph.pl / speedscope
+        """
+        denied = self._forbidden(request)
+        if denied:
+            return denied
+        try:
+            seconds = min(float(request.query.get("seconds", 5)), MAX_PROFILE_SECONDS)
+            interval = max(float(request.query.get("interval", 0.005)), 0.001)
+            limit = int(request.query.get("limit", 50))
+        except ValueError:
+            return web.json_response({"error": "Invalid numeric parameter"}, status=400)
+        mode = request.query.get("mode", "cprofile")
+        if mode not in ("cprofile", "sample"):
+            return web.json_response({"error": f"Unknown mode: {mode}"}, status=400)
+        if self._profile_lock.locked():
+            return web.json_response({"error": "A profile is already running"}, status=409)
+
+        async with self._profile_lock:
+            logger.info("Debug %s profile for %.1fs", mode, seconds)
+            if mode == "cprofile":
+                text = await self._run_cprofile(seconds, request.query.get("sort", "cumulative"), limit)
+            else:
+                text = await self._run_sampler(seconds, interval)
+        return web.Response(text=text, content_type="text/plain")
+
+    @staticmethod
+    async def _run_cprofile(seconds: float, sort: str, limit: int) -> str:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(prof, stream=out)
+        try:
+            stats.sort_stats(sort)
+        except KeyError:
+            stats.sort_stats("cumulative")
+        stats.print_stats(limit)
+        return out.getvalue()
+
+    @staticmethod
+    async def _run_sampler(seconds: float, interval: float) -> str:
+        loop_thread = threading.get_ident()
+        stacks: Counter = Counter()
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(interval):
+                frame = sys._current_frames().get(loop_thread)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+
+        sampler = threading.Thread(target=sample, name="debug-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+        return "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+
+    # ── memory ────────────────────────────────────────────────
+    async def _memory(self, request):
+        """GET /debug/memory?action=start|snapshot|diff|stop
+
+        snapshot stores a baseline and returns the top allocation sites;
+        diff compares against the baseline and then replaces it.
+        """
+        denied = self._forbidden(request)
+        if denied:
+            return denied
+        action = request.query.get("action", "snapshot")
+        try:
+            limit = int(request.query.get("limit", 25))
+            frames = int(request.query.get("frames", 1))
+        except ValueError:
+            return web.json_response({"error": "Invalid numeric parameter"}, status=400)
+
+        if action == "start":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = None
+            return web.json_response({"tracing": True})
+        if action == "stop":
+            tracemalloc.stop()
+            self._baseline = None
+            return web.json_response({"tracing": False})
+        if action not in ("snapshot", "diff"):
+            return web.json_response({"error": f"Unknown action: {action}"}, status=400)
+        if not tracemalloc.is_tracing():
+            return web.json_response({"error": "tracemalloc not started (action=start)"}, status=409)
+
+        snap = await asyncio.get_running_loop().run_in_executor(None, tracemalloc.take_snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+        if action == "diff" and self._baseline is not None:
+            stats = snap.compare_to(self._baseline, "lineno")[:limit]
+            top = [{
+                "where": str(s.traceback),
+                "size_kb": round(s.size / 1024, 1),
+                "size_diff_kb": round(s.size_diff / 1024, 1),
+                "count_diff": s.count_diff,
+            } for s in stats]
+        else:
+            top = [{
+                "where": str(s.traceback),
+                "size_kb": round(s.size / 1024, 1),
+                "count": s.count,
+            } for s in snap.statistics("lineno")[:limit]]
+        self._baseline = snap
+        return web.json_response({
+            "action": action,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": top,
+        })
+
+    # ── asyncio ───────────────────────────────────────────────
+    async def _tasks(self, request):
+        """GET /debug/tasks?slow_ms=100
+
+        Dumps every pending task with its stack.  slow_ms switches loop
+        debug mode on with that slow-callback threshold (0 turns it off
+        again); slow callbacks seen since then are included.
+        """
+        denied = self._forbidden(request)
+        if denied:
+            return denied
+        loop = asyncio.get_running_loop()
+        if "slow_ms" in request.query:
+            try:
+                slow_ms = float(request.query["slow_ms"])
+            except ValueError:
+                return web.json_response({"error": "Invalid slow_ms"}, status=400)
+            self._set_slow_callback_threshold(loop, slow_ms)
+        try:
+            depth = int(request.query.get("depth", 10))
+        except ValueError:
+            depth = 10
+
+        tasks = []
+        for task in asyncio.all_tasks(loop):
+            stack = []
+            for frame in task.get_stack(limit=depth):
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{frame.f_lineno} in {code.co_name}")
+            tasks.append({
+                "name": task.get_name(),
+                "coro": repr(task.get_coro()),
+                "done": task.done(),
+                "stack": stack,
+            })
+        return web.json_response({
+            "count": len(tasks),
+            "loop_debug": loop.get_debug(),
+            "slow_callback_ms": loop.slow_callback_duration * 1000 if loop.get_debug() else None,
+            "slow_callbacks": list(self._slow),
+            "tasks": tasks,
+            "at": time.time(),
+        })
+
+    def _set_slow_callback_threshold(self, loop, slow_ms: float):
+        asyncio_logger = logging.getLogger("asyncio")
+        if slow_ms <= 0:
+            loop.set_debug(False)
+            if self._slow_handler:
+                asyncio_logger.removeHandler(self._slow_handler)
+                self._slow_handler = None
+            logger.info("Loop debug mode disabled")
+            return
+        loop.slow_callback_duration = slow_ms / 1000
+        loop.set_debug(True)
+        if self._slow_handler is None:
+            self._slow_handler = _SlowCallbackHandler(self._slow)
+            asyncio_logger.addHandler(self._slow_handler)
+        logger.info("Loop debug mode enabled, slow callback threshold %.0f ms", slow_ms)
@@ -5,10 +5,14 @@ provides a curated list of controllable Echo/Alexa devices.
 """
 
 import asyncio
+import bisect
 import logging
-from typing import Dict, List, Optional
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from .ha_integration import HAClient
+from . import capabilities
+from .ha_integration import HARouter
+from .name_index import NameIndex
 
 logger = logging.getLogger(__name__)
 
@@ -18,47 +22,301 @@ _ECHO_MARKERS = (
     "show", "dot", "studio", "plus", "pop", "sub",
 )
 
+REFRESH_INTERVAL = 30
+
 
 class DeviceManager:
-    """Discovers and caches Alexa media_player entities from HA."""
+    """Discovers and caches Alexa media_player entities from every
+    configured HA backend."""
 
-    def __init__(self, ha_client: HAClient):
+    def __init__(self, ha_client: HARouter):
         self.ha = ha_client
-        self.devices: Dict[str, Dict] = {}   # entity_id -> state dict
+        self.devices: Dict[str, Dict] = {}   # (namespaced) entity_id -> state dict
         self.running = False
+        self.refresh_interval = REFRESH_INTERVAL
+        self._wake = asyncio.Event()
+        # per-backend freshness: last_refresh (epoch), ok, count, error, duration_ms
+        self.backend_status: Dict[str, Dict] = {
+            name: {"last_refresh": None, "ok": None, "count": 0,
+                   "error": None, "duration_ms": None}
+            for name in self.ha.clients
+        }
+        self._owned: Dict[str, set] = {name: set() for name in self.ha.clients}
+        # entity_id -> supported_features mask (None = not reported)
+        self._features: Dict[str, Optional[int]] = {}
+        # called as listener(entity_id, old_state, new_state) on every change;
+        # old_state is None for new entities, new_state None for removed ones
+        self._listeners: List[Callable[[str, Optional[Dict], Optional[Dict]], None]] = []
+        # fuzzy friendly_name / entity_id lookup, kept current by a listener
+        self.names = NameIndex()
+        self.add_listener(self._index_name)
+        # HA registries (namespaced ids), fed by RegistryWatcher
+        self.areas: Dict[str, Dict] = {}          # area_id -> {"name", "floor_id"}
+        self.floors: Dict[str, Dict] = {}         # floor_id -> {"name", "level"}
+        self._entity_area: Dict[str, str] = {}    # entity_id -> area_id
+        self._reg_owned: Dict[str, Dict[str, set]] = {}
+        # lookup indexes over current devices; names are lower-cased
+        self._by_area: Dict[str, set] = {}
+        self._by_floor: Dict[str, set] = {}
+        self._area_names: Dict[str, set] = {}
+        self._floor_names: Dict[str, set] = {}
+        self.add_listener(self._index_area)
+        # entity ids in sorted order for cursor pagination; rebuilt lazily
+        # after an entity is added or removed
+        self._sorted_ids: Optional[List[str]] = None
+        self.add_listener(self._forget_order)
+
+    @property
+    def last_refresh(self) -> Optional[float]:
+        """Epoch of the primary backend's last good refresh."""
+        return self.backend_status[self.ha.primary.name]["last_refresh"]
 
     # ── lifecycle ─────────────────────────────────────────────
     async def start(self):
-        """Background loop: refresh device list every 30 s."""
+        """Background loops: one per backend, each refreshing every
+        ``refresh_interval`` seconds, so a slow or unreachable backend
+        never delays the others."""
         self.running = True
-        logger.info("Device Manager started")
+        logger.info("Device Manager started (%d backend(s))", len(self.ha.clients))
+        await asyncio.gather(*(self._run_backend(name) for name in self.ha.clients))
+
+    async def _run_backend(self, name: str):
         while self.running:
-            await self.refresh()
-            await asyncio.sleep(30)
+            started = time.monotonic()
+            await self.refresh_backend(name)
+            # Sleep until the next refresh is due; a wake-up (new interval,
+            # stop) re-evaluates the deadline instead of refreshing early.
+            while self.running:
+                remaining = started + self.refresh_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+    def _wake_loops(self):
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    def set_refresh_interval(self, seconds: float):
+        seconds = max(1.0, float(seconds))
+        if seconds == self.refresh_interval:
+            return
+        self.refresh_interval = seconds
+        self._wake_loops()
+        logger.info("Device refresh interval set to %gs", seconds)
 
     async def stop(self):
         self.running = False
+        self._wake_loops()
         logger.info("Device Manager stopped")
 
     # ── discovery ─────────────────────────────────────────────
     async def refresh(self) -> List[Dict]:
-        """Query HA for all media_player entities, return the list."""
+        """Refresh every backend concurrently, return the merged list."""
+        await asyncio.gather(*(self.refresh_backend(name) for name in self.ha.clients))
+        return list(self.devices.values())
+
+    async def refresh_backend(self, name: str) -> bool:
+        """Query one HA backend for its media_player entities."""
+        client = self.ha.clients[name]
+        status = self.backend_status[name]
+        t0 = time.monotonic()
+        error = "unreachable"
         try:
-            all_players = await self.ha.get_all_media_players()
-            self.devices = {p["entity_id"]: p for p in all_players}
-            logger.info("Discovered %d media_player(s) in HA", len(self.devices))
-            return all_players
+            players = await client.get_all_media_players()
         except Exception as e:
-            logger.error("Failed to refresh devices: %s", e)
-            return []
+            logger.error("Failed to refresh devices from %s: %s", name, e)
+            players, error = None, str(e)
+        status["duration_ms"] = round((time.monotonic() - t0) * 1000)
+        if players is None:
+            # HA unreachable – keep serving the last known devices
+            status.update(ok=False, error=error)
+            return False
+        fresh = {}
+        for p in players:
+            eid = self.ha.qualify(name, p["entity_id"])
+            fresh[eid] = p if eid == p["entity_id"] else {**p, "entity_id": eid}
+        self._apply(name, fresh)
+        # INFO only when the picture changes; the steady state is DEBUG.
+        changed = status["count"] != len(fresh) or not status["ok"]
+        status.update(ok=True, error=None, count=len(fresh), last_refresh=time.time())
+        logger.log(logging.INFO if changed else logging.DEBUG,
+                   "Discovered %d media_player(s) in HA (%s)", len(fresh), name)
+        return True
+
+    async def refresh_entity(self, entity_id: str) -> Optional[Dict]:
+        """Re-read a single entity from HA and update the cache with it."""
+        state = await self.ha.get_entity_state(entity_id)
+        if not state or entity_id not in self.devices:
+            return state
+        if state.get("entity_id") != entity_id:
+            state = {**state, "entity_id": entity_id}
+        old = self.devices[entity_id]
+        if state != old:
+            self.devices[entity_id] = state
+            self._index_features(entity_id, state)
+            self._notify(entity_id, old, state)
+        return state
+
+    def _apply(self, backend: str, fresh: Dict[str, Dict]):
+        """Replace one backend's slice of the cache and tell listeners
+        what changed."""
+        old = self.devices
+        owned = self._owned[backend]
+        merged = {eid: st for eid, st in old.items() if eid not in owned}
+        merged.update(fresh)
+        self.devices = merged
+        self._owned[backend] = set(fresh)
+        for eid, state in fresh.items():
+            prev = old.get(eid)
+            if prev != state:
+                self._index_features(eid, state)
+                self._notify(eid, prev, state)
+        for eid in owned - fresh.keys():
+            self._features.pop(eid, None)
+            self._notify(eid, old.get(eid), None)
+
+    # ── capabilities ──────────────────────────────────────────
+    def _index_features(self, entity_id: str, state: Dict):
+        mask = state.get("attributes", {}).get("supported_features")
+        self._features[entity_id] = int(mask) if isinstance(mask, (int, float)) else None
+
+    def supports(self, entity_id: str, command: str) -> Optional[bool]:
+        """Whether a cached entity supports an API command; None when we
+        can't tell (unknown entity, no supported_features, or a command
+        with no matching feature bit) – callers should then just try."""
+        need = capabilities.required(command)
+        mask = self._features.get(entity_id)
+        if need is None or mask is None:
+            return None
+        return need in capabilities.decode(mask)
+
+    def capabilities_of(self, entity_id: str) -> tuple:
+        mask = self._features.get(entity_id)
+        return capabilities.as_list(mask) if mask is not None else ()
+
+    def _index_name(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        if new is None:
+            self.names.remove(entity_id)
+        else:
+            self.names.add(entity_id, new.get("attributes", {}).get("friendly_name"))
+
+    # ── areas / floors ────────────────────────────────────────
+    def apply_registry(self, backend: str, snapshot: Dict):
+        """Replace one backend's registry slice and rebuild the area and
+        floor indexes (only runs when HA reports a registry change)."""
+        def q(local_id):
+            return self.ha.qualify(backend, local_id) if local_id else local_id
+
+        owned = self._reg_owned.get(backend, {"areas": set(), "floors": set(), "entities": set()})
+        for aid in owned["areas"]:
+            self.areas.pop(aid, None)
+        for fid in owned["floors"]:
+            self.floors.pop(fid, None)
+        for eid in owned["entities"]:
+            self._entity_area.pop(eid, None)
+        areas = {q(aid): {**a, "floor_id": q(a.get("floor_id"))}
+                 for aid, a in snapshot["areas"].items()}
+        floors = {q(fid): f for fid, f in snapshot["floors"].items()}
+        entity_area = {q(eid): q(aid) for eid, aid in snapshot["entity_area"].items()}
+        self.areas.update(areas)
+        self.floors.update(floors)
+        self._entity_area.update(entity_area)
+        self._reg_owned[backend] = {"areas": set(areas), "floors": set(floors),
+                                    "entities": set(entity_area)}
+
+        self._area_names = {}
+        for aid, a in self.areas.items():
+            self._area_names.setdefault(a["name"].lower(), set()).add(aid)
+        self._floor_names = {}
+        for fid, f in self.floors.items():
+            self._floor_names.setdefault(f["name"].lower(), set()).add(fid)
+        self._by_area, self._by_floor = {}, {}
+        for eid in self.devices:
+            self._index_area(eid, None, self.devices[eid])
+        logger.info("Registry update from %s: %d area(s), %d floor(s), %d located player(s)",
+                    backend, len(areas), len(floors), len(entity_area))
 
-    def get_all(self) -> List[Dict]:
-        """Return cached media_player list in a frontend-friendly format."""
-        out = []
-        for eid, state in self.devices.items():
+    def _index_area(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        if (old is None) == (new is None):
+            return                      # state change only; location unchanged
+        aid = self._entity_area.get(entity_id)
+        if aid is None:
+            return
+        fid = self.areas.get(aid, {}).get("floor_id")
+        for index, key in ((self._by_area, aid), (self._by_floor, fid)):
+            if key is None:
+                continue
+            if new is None:
+                members = index.get(key)
+                if members:
+                    members.discard(entity_id)
+            else:
+                index.setdefault(key, set()).add(entity_id)
+
+    def entities_in(self, area: str = None, floor: str = None) -> Optional[set]:
+        """Current entity ids in an area or on a floor, by id or name
+        (case-insensitive); None if no such area/floor is known."""
+        if area is not None:
+            ids = {area} if area in self.areas else self._area_names.get(area.lower())
+            index = self._by_area
+        else:
+            ids = {floor} if floor in self.floors else self._floor_names.get((floor or "").lower())
+            index = self._by_floor
+        if not ids:
+            return None
+        out = set()
+        for i in ids:
+            out |= index.get(i, set())
+        return out
+
+    def location_of(self, entity_id: str) -> Dict:
+        aid = self._entity_area.get(entity_id)
+        area = self.areas.get(aid) if aid else None
+        floor = self.floors.get(area["floor_id"]) if area and area.get("floor_id") else None
+        return {"area": area["name"] if area else None,
+                "floor": floor["name"] if floor else None}
+
+    # ── change listeners ──────────────────────────────────────
+    def add_listener(self, callback: Callable[[str, Optional[Dict], Optional[Dict]], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        for cb in self._listeners:
+            try:
+                cb(entity_id, old, new)
+            except Exception as e:
+                logger.error("Device listener %r failed: %s", cb, e)
+
+    def get_all(self, entity_ids: Iterable[str] = None,
+                fields: Sequence[str] = None) -> List[Dict]:
+        """Return cached media_player list in a frontend-friendly format,
+        optionally only for the given entity ids and fields."""
+        return list(self.iter_devices(entity_ids, fields))
+
+    def iter_devices(self, entity_ids: Iterable[str] = None,
+                     fields: Sequence[str] = None) -> Iterator[Dict]:
+        """Lazily project devices; ``fields`` (names from DEVICE_FIELDS)
+        limits both the output and the work done per device."""
+        devices = self.devices
+        ids = devices if entity_ids is None else entity_ids
+        for eid in ids:
+            state = devices.get(eid)
+            if state is None:
+                continue
             attrs = state.get("attributes", {})
-            out.append({
+            if fields is not None:
+                yield {f: DEVICE_FIELDS[f](self, eid, state, attrs) for f in fields}
+                continue
+            yield {
                 "entity_id": eid,
+                "backend": self.ha.route(eid)[0].name,
                 "friendly_name": attrs.get("friendly_name", eid),
                 "state": state.get("state", "unknown"),
                 "volume": attrs.get("volume_level"),
@@ -67,7 +325,52 @@ class DeviceManager:
                 "source": attrs.get("source"),
                 "is_echo": self._looks_like_echo(eid, attrs),
                 "supported_features": attrs.get("supported_features", 0),
-            })
+                "capabilities": self.capabilities_of(eid),
+                **self.location_of(eid),
+            }
+
+    # ── pagination ────────────────────────────────────────────
+    def _forget_order(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        if old is None or new is None:
+            self._sorted_ids = None
+
+    def sorted_ids(self) -> List[str]:
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self.devices)
+        return self._sorted_ids
+
+    def page(self, only: Optional[set] = None, after: str = None,
+             limit: int = None) -> Tuple[Iterable[str], Optional[str]]:
+        """Entity ids in id order after ``after`` (a keyset cursor),
+        optionally restricted to ``only``, and the cursor for the next
+        page (None on the last one).  Without a limit the ids are
+        produced lazily."""
+        order = self.sorted_ids()
+        start = bisect.bisect_right(order, after) if after is not None else 0
+        ids = (order[i] for i in range(start, len(order)))
+        if only is not None:
+            ids = (eid for eid in ids if eid in only)
+        if limit is None:
+            return ids, None
+        page = []
+        for eid in ids:
+            if len(page) == limit:
+                return page, page[-1]
+            page.append(eid)
+        return page, None
+
+    def backends_to_dict(self) -> Dict[str, Dict]:
+        """Per-backend freshness metadata for the API."""
+        now = time.time()
+        out = {}
+        for name, st in self.backend_status.items():
+            last = st["last_refresh"]
+            out[name] = {
+                **st,
+                "age_s": round(now - last, 1) if last else None,
+                "circuit": self.ha.clients[name].breaker.state,
+                "get_cache": self.ha.clients[name].cache_to_dict(),
+            }
         return out
 
     def get_echo_devices(self) -> List[Dict]:
@@ -86,3 +389,21 @@ class DeviceManager:
             + attrs.get("source", "")
         ).lower()
         return any(m in text for m in _ECHO_MARKERS)
+
+
+# /api/devices?fields=...: field name -> getter(manager, entity_id, state, attrs)
+DEVICE_FIELDS: Dict[str, Callable[[DeviceManager, str, Dict, Dict], object]] = {
+    "entity_id": lambda dm, eid, st, a: eid,
+    "backend": lambda dm, eid, st, a: dm.ha.route(eid)[0].name,
+    "friendly_name": lambda dm, eid, st, a: a.get("friendly_name", eid),
+    "state": lambda dm, eid, st, a: st.get("state", "unknown"),
+    "volume": lambda dm, eid, st, a: a.get("volume_level"),
+    "media_title": lambda dm, eid, st, a: a.get("media_title"),
+    "media_artist": lambda dm, eid, st, a: a.get("media_artist"),
+    "source": lambda dm, eid, st, a: a.get("source"),
+    "is_echo": lambda dm, eid, st, a: dm._looks_like_echo(eid, a),
+    "supported_features": lambda dm, eid, st, a: a.get("supported_features", 0),
+    "capabilities": lambda dm, eid, st, a: dm.capabilities_of(eid),
+    "area": lambda dm, eid, st, a: dm.location_of(eid)["area"],
+    "floor": lambda dm, eid, st, a: dm.location_of(eid)["floor"],
+}
@@ -0,0 +1,336 @@
+"""
+Volume Fades
+Ramps volume on the server, so fading ten Echos down over five seconds
+is one API call instead of hundreds of volume_set requests racing each
+other through /api/command.
+
+All active fades are driven by one task.  Each fade steps at an
+interval derived from how long its previous step took (the slowest
+member's volume_set round trip), backs off while HA refuses calls, and
+never steps faster than its steepest member needs to move by
+FADE_MIN_DELTA – Alexa volume only has whole percents, so finer steps
+are inaudible calls.  Members of one fade step together: the next step
+waits for every member's call, so a group stays in lockstep.
+
+Starting a fade on a device takes it out of the fade it was in.  A fade
+that runs to its end always sends the exact target level, and retries
+that last call if it fails.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+from .device_manager import DeviceManager
+from .fanout import fan_out
+from .ha_integration import HARouter
+
+logger = logging.getLogger(__name__)
+
+FADE_MIN_STEP = float(os.getenv("FADE_MIN_STEP", "0.25"))
+FADE_MAX_DURATION = 3600.0
+FADE_MIN_DELTA = 0.01
+FADE_FINAL_RETRIES = 3
+# Spare time left after a step before the next one, as a multiple of
+# the step's round trip.
+STEP_HEADROOM = 1.5
+BACKOFF_MAX = 8.0
+LATENCY_ALPHA = 0.3
+
+
+class _Fade:
+    __slots__ = ("id", "target", "duration", "started_at", "start", "sent",
+                 "interval", "backoff", "next_step", "stepping", "final_tries",
+                 "steps", "calls", "failures")
+
+    def __init__(self, fid: str, start: Dict[str, float], target: float,
+                 duration: float, interval: float):
+        self.id = fid
+        self.target = target
+        self.duration = duration
+        self.started_at = time.monotonic()
+        self.start = start                  # member -> level at fade start
+        self.sent = dict(start)             # member -> last level sent
+        self.interval = interval
+        self.backoff = 1.0
+        self.next_step = self.started_at
+        self.stepping = False
+        self.final_tries = 0
+        self.steps = 0
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def ends_at(self) -> float:
+        return self.started_at + self.duration
+
+    def progress(self, now: float) -> float:
+        if self.duration <= 0:
+            return 1.0
+        return min(1.0, max(0.0, (now - self.started_at) / self.duration))
+
+    def level(self, entity_id: str, progress: float) -> float:
+        if progress >= 1.0:
+            return self.target
+        start = self.start[entity_id]
+        return round(start + (self.target - start) * progress, 2)
+
+    def min_interval(self) -> float:
+        """Time the steepest member needs to move by FADE_MIN_DELTA."""
+        span = max((abs(self.target - s) for s in self.start.values()), default=0.0)
+        if span < FADE_MIN_DELTA:
+            return self.duration
+        return self.duration * FADE_MIN_DELTA / span
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "targets": sorted(self.start),
+            "level": self.target,
+            "duration": self.duration,
+            "progress": round(self.progress(now), 3),
+            "current": {eid: self.sent[eid] for eid in sorted(self.start)},
+            "interval_ms": round(self.interval * self.backoff * 1000),
+            "steps": self.steps,
+            "calls": self.calls,
+            "failures": self.failures,
+        }
+
+
+class FadeEngine:
+    """Runs every active volume fade from a single task."""
+
+    def __init__(self, ha_client: HARouter, device_manager: DeviceManager):
+        self.ha = ha_client
+        self.dm = device_manager
+        self.fades: Dict[str, _Fade] = {}
+        self._owner: Dict[str, str] = {}          # entity -> fade id
+        self._busy: Set[str] = set()              # entities with a call in flight
+        self._latency: Dict[str, float] = {}      # entity -> smoothed step time (s)
+        # Levels we set that the cached state may not show yet.
+        self._levels: Dict[str, float] = {}
+        self._wake = asyncio.Event()
+        self._steps: Set[asyncio.Task] = set()
+        self.running = False
+        self.started = 0
+        self.completed = 0
+        self.superseded = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.calls = 0
+        self.dm.add_listener(self._on_change)
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        self.running = True
+        while self.running:
+            now = time.monotonic()
+            due: Optional[float] = None
+            for fade in list(self.fades.values()):
+                if fade.stepping or self._busy.intersection(fade.start):
+                    continue              # woken again when the call returns
+                if fade.next_step <= now:
+                    self._launch(fade)
+                elif due is None or fade.next_step < due:
+                    due = fade.next_step
+            wake = self._wake
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=None if due is None else due - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        self.running = False
+        self._wake_loop()
+        for task in list(self._steps):
+            task.cancel()
+
+    def _wake_loop(self):
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    # ── fades ─────────────────────────────────────────────────
+    def fade(self, entity_ids: Iterable[str], level: float, duration: float,
+             start_level: Optional[float] = None) -> Dict:
+        """Fade ``entity_ids`` together to ``level`` over ``duration``
+        seconds, from ``start_level`` or each device's current volume.
+        ValueError on bad arguments."""
+        level = float(level)
+        duration = float(duration)
+        if not 0.0 <= level <= 1.0:
+            raise ValueError("level must be between 0 and 1")
+        if not 0.0 <= duration <= FADE_MAX_DURATION:
+            raise ValueError(f"duration must be between 0 and {FADE_MAX_DURATION:g} seconds")
+        if start_level is not None:
+            start_level = max(0.0, min(1.0, float(start_level)))
+        members = sorted(set(entity_ids))
+        if not members:
+            raise ValueError("no devices to fade")
+
+        start: Dict[str, float] = {}
+        for eid in members:
+            current = self._current_level(eid)
+            self._release(eid, superseded=True)
+            if start_level is not None:
+                start[eid] = start_level
+            else:
+                # Unknown volume: nothing to ramp from, just set the level.
+                start[eid] = level if current is None else current
+        interval = max([FADE_MIN_STEP] + [self._latency.get(eid, 0.0) * STEP_HEADROOM
+                                          for eid in members])
+        fade = _Fade(uuid.uuid4().hex[:8], start, level, duration, interval)
+        fade.next_step = fade.started_at + min(self._interval(fade), duration)
+        self.fades[fade.id] = fade
+        for eid in members:
+            self._owner[eid] = fade.id
+        self.started += 1
+        self._wake_loop()
+        logger.info("Fade %s: %d device(s) to %.2f over %gs", fade.id, len(members),
+                    level, duration)
+        return fade.to_dict()
+
+    def cancel(self, fade_id: str = None, entity_ids: Iterable[str] = ()) -> List[str]:
+        """Stop a fade, or take devices out of theirs, leaving them at the
+        level last sent.  Returns the devices that were fading."""
+        stopped = []
+        fade = self.fades.get(fade_id) if fade_id else None
+        for eid in list(fade.start) if fade else entity_ids:
+            if self._release(eid):
+                stopped.append(eid)
+        self.cancelled += len(stopped)
+        return stopped
+
+    def _current_level(self, entity_id: str) -> Optional[float]:
+        # A fade in progress knows better than the cached state.
+        fade = self.fades.get(self._owner.get(entity_id, ""))
+        if fade is not None:
+            return fade.sent[entity_id]
+        if entity_id in self._levels:
+            return self._levels[entity_id]
+        state = self.dm.devices.get(entity_id) or {}
+        level = state.get("attributes", {}).get("volume_level")
+        return float(level) if isinstance(level, (int, float)) else None
+
+    def _on_change(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        before = (old or {}).get("attributes", {}).get("volume_level")
+        after = (new or {}).get("attributes", {}).get("volume_level")
+        if before != after or new is None:
+            self._levels.pop(entity_id, None)
+
+    def _release(self, entity_id: str, superseded: bool = False) -> bool:
+        fid = self._owner.pop(entity_id, None)
+        fade = self.fades.get(fid) if fid else None
+        if fade is None:
+            return False
+        fade.start.pop(entity_id, None)
+        if superseded:
+            self.superseded += 1
+        if not fade.start:
+            del self.fades[fid]
+        return True
+
+    def _interval(self, fade: _Fade) -> float:
+        return max(fade.interval * fade.backoff, fade.min_interval())
+
+    # ── stepping ──────────────────────────────────────────────
+    def _launch(self, fade: _Fade):
+        fade.stepping = True
+        task = asyncio.ensure_future(self._step(fade))
+        self._steps.add(task)
+        task.add_done_callback(self._steps.discard)
+
+    async def _step(self, fade: _Fade):
+        try:
+            await self._send_step(fade)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Fade %s step failed: %s", fade.id, e)
+            fade.next_step = time.monotonic() + self._interval(fade)
+        finally:
+            fade.stepping = False
+            self._wake_loop()
+
+    async def _send_step(self, fade: _Fade):
+        t0 = time.monotonic()
+        progress = fade.progress(t0)
+        final = progress >= 1.0
+        levels = {}
+        for eid in fade.start:
+            level = fade.level(eid, progress)
+            if final or abs(level - fade.sent[eid]) >= FADE_MIN_DELTA:
+                levels[eid] = level
+
+        results = {}
+        if levels:
+            self._busy.update(levels)
+            try:
+                results = await fan_out(sorted(levels), lambda eid: self._set(eid, levels[eid]),
+                                        limit=len(levels))
+            finally:
+                self._busy.difference_update(levels)
+            fade.steps += 1
+            fade.calls += len(results)
+            self.calls += len(results)
+        now = time.monotonic()
+
+        failed = []
+        for eid, r in results.items():
+            prev = self._latency.get(eid)
+            sample = r["ms"] / 1000
+            self._latency[eid] = sample if prev is None else prev + LATENCY_ALPHA * (sample - prev)
+            if self._owner.get(eid) != fade.id:
+                continue                  # superseded while the call was out
+            if r["ok"]:
+                fade.sent[eid] = self._levels[eid] = levels[eid]
+            else:
+                failed.append(eid)
+        fade.failures += len(failed)
+        if results:
+            fade.interval = max(FADE_MIN_STEP, (now - t0) * STEP_HEADROOM)
+            fade.backoff = min(fade.backoff * 2, BACKOFF_MAX) if failed else 1.0
+
+        if self.fades.get(fade.id) is not fade:
+            return                        # every member was taken over
+        if final:
+            self._finish(fade, failed)
+            fade.next_step = now + fade.interval * fade.backoff
+        else:
+            # The last step lands exactly at the end.
+            fade.next_step = min(now + self._interval(fade), max(fade.ends_at, now))
+
+    def _finish(self, fade: _Fade, failed: List[str]):
+        fade.final_tries += 1
+        for eid in list(fade.start):
+            if eid in failed and fade.final_tries <= FADE_FINAL_RETRIES:
+                continue
+            if eid in failed:
+                self.failed += 1
+                logger.warning("Fade %s: could not set %s to %.2f", fade.id, eid, fade.target)
+            self._owner.pop(eid, None)
+            del fade.start[eid]
+        if not fade.start:
+            self.fades.pop(fade.id, None)
+            self.completed += 1
+            logger.info("Fade %s finished after %d step(s), %d call(s)",
+                        fade.id, fade.steps, fade.calls)
+
+    async def _set(self, entity_id: str, level: float) -> bool:
+        if self.ha.breaker_for(entity_id).rejecting():
+            raise RuntimeError("Home Assistant unavailable")
+        return await self.ha.volume_set(entity_id, level)
+
+    def to_dict(self) -> Dict:
+        return {
+            "fades": [f.to_dict() for f in self.fades.values()],
+            "started": self.started,
+            "completed": self.completed,
+            "superseded": self.superseded,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "calls": self.calls,
+        }
@@ -0,0 +1,47 @@
+"""
+Fan-out helper
+Runs one coroutine per target with a concurrency cap and reports
+per-target outcome and timing.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Max concurrent HA service calls for multi-device operations
+FANOUT_LIMIT = int(os.getenv("FANOUT_LIMIT", "8"))
+
+
+async def fan_out(targets: Iterable[str],
+                  action: Callable[[str], Awaitable[bool]],
+                  limit: int = FANOUT_LIMIT) -> Dict[str, Dict]:
+    """Run ``action(target)`` for every target, at most ``limit`` at once.
+
+    Returns ``{target: {"ok", "ms", "done_at_ms", "error"?}}`` where ``ms``
+    is the target's own call time and ``done_at_ms`` its completion
+    relative to the start of the fan-out.  A failing target never aborts
+    the others.
+    """
+    sem = asyncio.Semaphore(max(1, limit))
+    start = time.monotonic()
+
+    async def run(target: str):
+        async with sem:
+            t0 = time.monotonic()
+            try:
+                ok = bool(await action(target))
+                result = {"ok": ok}
+            except Exception as e:
+                logger.error("Fan-out action for %s failed: %s", target, e)
+                result = {"ok": False, "error": str(e)}
+            now = time.monotonic()
+            result["ms"] = round((now - t0) * 1000)
+            result["done_at_ms"] = round((now - start) * 1000)
+            return target, result
+
+    results = await asyncio.gather(*(run(t) for t in targets))
+    return dict(results)
@@ -0,0 +1,33 @@
+"""
+Atomic File Writes
+Replaces a file's contents so that a crash or power loss leaves either
+the old file or the new one on disk, never a partial write.
+"""
+
+import os
+import tempfile
+
+
+def atomic_write(path: str, data: bytes, prefix: str = ".tmp-"):
+    """Write ``data`` to a temp file next to ``path``, fsync it and rename
+    it over ``path``.  An existing file keeps its permission bits; a new
+    one is created 0600."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=prefix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
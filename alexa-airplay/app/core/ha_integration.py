@@ -4,28 +4,128 @@ Handles communication with Home Assistant Supervisor API
 to discover media_player entities and send playback commands.
 """
 
+import asyncio
+import json
 import logging
 import os
-from typing import Dict, List, Optional
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
 import aiohttp
 
+from .cache import SingleFlight, TTLCache
+from .circuit_breaker import CircuitBreaker
+
 logger = logging.getLogger(__name__)
 
 HA_URL = os.getenv("HA_URL", "http://supervisor")
+# Upper bound for a single HA request, so a restarting HA can't hold
+# callers for the full TCP timeout.
+HA_TIMEOUT = float(os.getenv("HA_TIMEOUT", "10"))
+# Max pooled connections per HA backend
+HA_POOL_SIZE = int(os.getenv("HA_POOL_SIZE", "10"))
+OPTIONS_FILE = os.getenv("OPTIONS_FILE", "/data/options.json")
+# Read-through cache for GETs: JSON {path prefix: ttl seconds}, longest
+# prefix wins; "{}" turns caching off (identical concurrent GETs are
+# still shared).  Single-entity reads stay shorter than the actuation
+# tracker's poll interval so confirmations aren't delayed.
+HA_CACHE_TTL = os.getenv("HA_CACHE_TTL", '{"/states": 2, "/states/": 0.25}')
+HA_CACHE_SIZE = int(os.getenv("HA_CACHE_SIZE", "256"))
+
+PRIMARY_BACKEND = "local"
+# Entities of extra backends are namespaced as "<backend>:<entity_id>"
+NS_SEP = ":"
+_BACKEND_NAME = re.compile(r"^[a-z0-9_]+$")
+
+
+class MediaPlayerServices(ABC):
+    """media_player service helpers on top of ``call_service``.
+
+    Shared by HAClient (one HA instance) and HARouter (many).
+    """
+
+    @abstractmethod
+    async def call_service(self, domain: str, service: str,
+                           entity_id: str, data: dict = None) -> bool:
+        """Call ``domain.service`` on ``entity_id``; True on success."""
+
+    async def play_media(self, entity_id: str,
+                         content_id: str,
+                         content_type: str = "custom") -> bool:
+        """Call media_player.play_media on a device.
+
+        content_type can be:
+          "custom"       - send content_id as a voice command
+          "APPLE_MUSIC"  - search Apple Music
+          "AMAZON_MUSIC" - search Amazon Music
+          "SPOTIFY"      - search Spotify
+          "TUNEIN"       - search TuneIn
+          "music"        - generic
+        """
+        return await self.call_service(
+            "media_player", "play_media", entity_id,
+            {"media_content_id": content_id, "media_content_type": content_type},
+        )
+
+    async def media_play(self, entity_id: str) -> bool:
+        return await self.call_service("media_player", "media_play", entity_id)
+
+    async def media_pause(self, entity_id: str) -> bool:
+        return await self.call_service("media_player", "media_pause", entity_id)
+
+    async def media_stop(self, entity_id: str) -> bool:
+        return await self.call_service("media_player", "media_stop", entity_id)
+
+    async def media_next(self, entity_id: str) -> bool:
+        return await self.call_service("media_player", "media_next_track", entity_id)
 
+    async def media_previous(self, entity_id: str) -> bool:
+        return await self.call_service("media_player", "media_previous_track", entity_id)
+
+    async def select_source(self, entity_id: str, source: str) -> bool:
+        return await self.call_service(
+            "media_player", "select_source", entity_id, {"source": source},
+        )
+
+    async def volume_set(self, entity_id: str, level: float) -> bool:
+        """Set volume (0.0 - 1.0)."""
+        return await self.call_service(
+            "media_player", "volume_set", entity_id,
+            {"volume_level": max(0.0, min(1.0, level))},
+        )
 
-class HAClient:
-    """Client for the Home Assistant Supervisor REST API."""
 
-    def __init__(self):
-        self.token: str = os.getenv("SUPERVISOR_TOKEN", "")
-        self.base_url: str = f"{HA_URL}/core/api"
+class HAClient(MediaPlayerServices):
+    """Client for one Home Assistant REST API (the Supervisor proxy by
+    default, or a remote instance given ``base_url`` and ``token``)."""
+
+    def __init__(self, name: str = PRIMARY_BACKEND,
+                 base_url: str = None, token: str = None):
+        self.name = name
+        self.token: str = token if token is not None else os.getenv("SUPERVISOR_TOKEN", "")
+        self.base_url: str = base_url or f"{HA_URL}/core/api"
+        self.pool_size = HA_POOL_SIZE
         self._session: Optional[aiohttp.ClientSession] = None
+        self._retired: List[aiohttp.ClientSession] = []   # draining after a resize
+        self._closers: Set[asyncio.Task] = set()
+        self.breaker = CircuitBreaker(name)
+        self.recorder = None      # traffic.TrafficRecorder when HA_RECORD_FILE is set
+        # GET results are shared with every caller and must be treated
+        # as read-only.
+        self.cache = TTLCache(HA_CACHE_SIZE)
+        self._flights = SingleFlight()
+        # path -> version, bumped by writes so that GETs started before a
+        # write are neither joined nor cached afterwards
+        self._versions: Dict[str, int] = {}
+        self.upstream_gets = 0
 
     # ── session management ────────────────────────────────────
     async def _ensure_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
             self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=HA_TIMEOUT),
                 headers={
                     "Authorization": f"Bearer {self.token}",
                     "Content-Type": "application/json",
@@ -37,41 +137,160 @@ class HAClient:
         if self._session and not self._session.closed:
             await self._session.close()
             self._session = None
+        for task in list(self._closers):
+            task.cancel()
+        for old in self._retired:
+            await old.close()
+        self._retired.clear()
+
+    async def _close_retired(self, old: aiohttp.ClientSession):
+        await asyncio.sleep(HA_TIMEOUT)
+        if old in self._retired:
+            self._retired.remove(old)
+            await old.close()
+
+    def set_pool_size(self, size: int):
+        """Resize the connection pool.  The next request opens a new
+        session; the old one is closed once its in-flight requests have
+        had ``HA_TIMEOUT`` to finish."""
+        size = max(1, int(size))
+        if size == self.pool_size:
+            return
+        self.pool_size = size
+        old, self._session = self._session, None
+        if old is not None and not old.closed:
+            self._retired.append(old)
+            task = asyncio.ensure_future(self._close_retired(old))
+            self._closers.add(task)
+            task.add_done_callback(self._closers.discard)
+        logger.info("HA pool size for %s set to %d", self.name, size)
 
     # ── generic helpers ───────────────────────────────────────
-    async def _get(self, path: str):
+    # Connection errors, timeouts and 5xx answers (the Supervisor returns
+    # 502/504 while Core restarts) count against the circuit breaker;
+    # 4xx means HA is up and simply disagreed with us.
+    async def _send(self, method: str, path: str, data: dict = None) -> Tuple[int, Any]:
+        """One HTTP round trip returning ``(status, body)``; the body is
+        parsed JSON on 200, text otherwise.  Transport errors propagate."""
         session = await self._ensure_session()
         url = f"{self.base_url}{path}"
+        kwargs = {"json": data or {}} if method == "POST" else {}
+        async with session.request(method, url, **kwargs) as resp:
+            if resp.status == 200:
+                return resp.status, await resp.json(content_type=None)
+            return resp.status, await resp.text()
+
+    async def _request(self, method: str, path: str, data: dict = None) -> Tuple[int, Any]:
+        if self.recorder is None:
+            return await self._send(method, path, data)
+        t0 = time.monotonic()
+        try:
+            status, body = await self._send(method, path, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.recorder.record(self.name, method, path, data, None,
+                                 str(e) or type(e).__name__, time.monotonic() - t0)
+            raise
+        self.recorder.record(self.name, method, path, data, status, body,
+                             time.monotonic() - t0)
+        return status, body
+
+    @staticmethod
+    def _ttl_for(path: str) -> float:
+        for prefix, ttl in _CACHE_RULES:
+            if path.startswith(prefix):
+                return ttl
+        return 0.0
+
+    async def _get(self, path: str):
+        """Cached, coalesced GET: a fresh cached body is returned as is,
+        and identical concurrent GETs share one round trip."""
+        ttl = self._ttl_for(path)
+        if ttl > 0:
+            body = self.cache.get(path, _MISS)
+            if body is not _MISS:
+                return body
+        version = self._versions.get(path, 0)
+        return await self._flights.do((path, version),
+                                      lambda: self._fetch(path, ttl, version))
+
+    async def _fetch(self, path: str, ttl: float, version: int):
+        body = await self._get_uncached(path)
+        if ttl > 0 and body is not None and self._versions.get(path, 0) == version:
+            self.cache.set(path, body, ttl)
+        return body
+
+    def invalidate(self, entity_id: str):
+        """Forget cached state for one entity and the /states list that
+        contains it."""
+        for path in ("/states", f"/states/{entity_id}"):
+            self._versions[path] = self._versions.get(path, 0) + 1
+            self.cache.pop(path)
+
+    def cache_to_dict(self) -> Dict:
+        return {**self.cache.to_dict(), "shared": self._flights.shared,
+                "upstream_gets": self.upstream_gets}
+
+    async def _get_uncached(self, path: str):
+        if not self.breaker.allow():
+            logger.debug("GET %s skipped: circuit open", path)
+            return None
+        self.upstream_gets += 1
         try:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                logger.error("GET %s -> %s", path, resp.status)
-                return None
+            status, body = await self._request("GET", path)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
         except Exception as e:
+            self.breaker.record_failure()
             logger.error("GET %s error: %s", path, e)
             return None
+        self._record_status(status)
+        if status == 200:
+            return body
+        logger.error("GET %s -> %s", path, status)
+        return None
 
     async def _post(self, path: str, data: dict = None) -> bool:
-        session = await self._ensure_session()
-        url = f"{self.base_url}{path}"
+        return await self._post_json(path, data) is not None
+
+    async def _post_json(self, path: str, data: dict = None):
+        """POST and return the decoded response body, or None on failure."""
+        if not self.breaker.allow():
+            logger.debug("POST %s skipped: circuit open", path)
+            return None
         try:
-            async with session.post(url, json=data or {}) as resp:
-                if resp.status == 200:
-                    return True
-                body = await resp.text()
-                logger.error("POST %s -> %s: %s", path, resp.status, body[:200])
-                return False
+            status, body = await self._request("POST", path, data)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
         except Exception as e:
+            self.breaker.record_failure()
             logger.error("POST %s error: %s", path, e)
-            return False
+            return None
+        self._record_status(status)
+        if status == 200:
+            return body if body is not None else {}
+        logger.error("POST %s -> %s: %s", path, status, str(body)[:200])
+        return None
+
+    def _record_status(self, status: int):
+        if status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
 
     # ── discovery ─────────────────────────────────────────────
-    async def get_all_media_players(self) -> List[Dict]:
-        """Return every media_player entity in HA with state + attributes."""
+    async def get_all_media_players(self) -> Optional[List[Dict]]:
+        """Return every media_player entity in HA with state + attributes.
+
+        Returns None (rather than an empty list) when HA could not be
+        reached, so callers can keep their last known state.
+        """
         states = await self._get("/states")
-        if not states or not isinstance(states, list):
-            return []
+        if not isinstance(states, list):
+            return None
         return [
             s for s in states
             if s.get("entity_id", "").startswith("media_player.")
@@ -81,51 +300,165 @@ class HAClient:
         """Get the current state of a single entity."""
         return await self._get(f"/states/{entity_id}")
 
-    # ── media player service calls ────────────────────────────
+    # ── service calls ─────────────────────────────────────────
     async def call_service(self, domain: str, service: str,
                            entity_id: str, data: dict = None) -> bool:
         """Call a HA service targeting a specific entity."""
         payload = {"entity_id": entity_id}
         if data:
             payload.update(data)
-        return await self._post(f"/services/{domain}/{service}", payload)
+        # Before: nobody joins a read that predates the call.  After:
+        # nothing read while HA was applying it stays cached.
+        self.invalidate(entity_id)
+        try:
+            return await self._post(f"/services/{domain}/{service}", payload)
+        finally:
+            self.invalidate(entity_id)
 
-    async def play_media(self, entity_id: str,
-                         content_id: str,
-                         content_type: str = "custom") -> bool:
-        """Call media_player.play_media on a device.
+    async def browse_media(self, entity_id: str, content_type: str = None,
+                           content_id: str = None) -> Optional[Dict]:
+        """One level of the entity's media library (media_player.browse_media
+        with ``return_response``), or None if HA couldn't answer."""
+        payload = {"entity_id": entity_id}
+        if content_type and content_id:
+            payload.update(media_content_type=content_type, media_content_id=content_id)
+        body = await self._post_json(
+            "/services/media_player/browse_media?return_response", payload)
+        if not isinstance(body, dict):
+            return None
+        return (body.get("service_response") or {}).get(entity_id)
 
-        content_type can be:
-          "custom"       - send content_id as a voice command
-          "APPLE_MUSIC"  - search Apple Music
-          "AMAZON_MUSIC" - search Amazon Music
-          "SPOTIFY"      - search Spotify
-          "TUNEIN"       - search TuneIn
-          "music"        - generic
-        """
-        return await self.call_service(
-            "media_player", "play_media", entity_id,
-            {"media_content_id": content_id, "media_content_type": content_type},
-        )
+    async def notify(self, service: str, message: str,
+                     targets: List[str] = None, data: dict = None) -> bool:
+        """Call notify.<service>, e.g. Alexa Media Player's ``alexa_media``
+        which accepts a list of media_player targets in one call."""
+        payload = {"message": message}
+        if targets:
+            payload["target"] = targets
+        if data:
+            payload["data"] = data
+        return await self._post(f"/services/notify/{service}", payload)
 
-    async def media_play(self, entity_id: str) -> bool:
-        return await self.call_service("media_player", "media_play", entity_id)
 
-    async def media_pause(self, entity_id: str) -> bool:
-        return await self.call_service("media_player", "media_pause", entity_id)
+def _cache_ttls(raw: str) -> List[Tuple[str, float]]:
+    """(prefix, ttl) rules from HA_CACHE_TTL, longest prefix first."""
+    try:
+        rules = json.loads(raw or "{}")
+        pairs = [(str(k), float(v)) for k, v in rules.items()]
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error("Ignoring invalid HA_CACHE_TTL %r: %s", raw, e)
+        return []
+    return sorted(pairs, key=lambda kv: -len(kv[0]))
 
-    async def media_stop(self, entity_id: str) -> bool:
-        return await self.call_service("media_player", "media_stop", entity_id)
 
-    async def media_next(self, entity_id: str) -> bool:
-        return await self.call_service("media_player", "media_next_track", entity_id)
+_CACHE_RULES = _cache_ttls(HA_CACHE_TTL)
+_MISS = object()
 
-    async def media_previous(self, entity_id: str) -> bool:
-        return await self.call_service("media_player", "media_previous_track", entity_id)
 
-    async def volume_set(self, entity_id: str, level: float) -> bool:
-        """Set volume (0.0 - 1.0)."""
-        return await self.call_service(
-            "media_player", "volume_set", entity_id,
-            {"volume_level": max(0.0, min(1.0, level))},
-        )
+# ──────────────────────────────────────────────────────────────
+# Multiple HA instances
+# ──────────────────────────────────────────────────────────────
+def load_backends() -> List[HAClient]:
+    """Build extra HA clients from HA_BACKENDS (JSON) or the add-on's
+    ``ha_backends`` option: ``[{"name", "url", "token"}, ...]``.
+
+    ``url`` is the instance root (``http://host:8123``); the REST API
+    lives under ``/api`` there.
+    """
+    raw = os.getenv("HA_BACKENDS")
+    entries = []
+    try:
+        if raw:
+            entries = json.loads(raw)
+        elif os.path.exists(OPTIONS_FILE):
+            with open(OPTIONS_FILE, encoding="utf-8") as f:
+                entries = json.load(f).get("ha_backends") or []
+    except (OSError, ValueError) as e:
+        logger.error("Could not read HA backends: %s", e)
+        return []
+
+    clients = []
+    for entry in entries:
+        name = str(entry.get("name", "")).strip().lower()
+        url = str(entry.get("url", "")).strip().rstrip("/")
+        if not _BACKEND_NAME.match(name) or name == PRIMARY_BACKEND or not url:
+            logger.error("Ignoring invalid HA backend entry %r", entry.get("name"))
+            continue
+        clients.append(HAClient(name, f"{url}/api", entry.get("token", "")))
+    return clients
+
+
+class HARouter(MediaPlayerServices):
+    """Routes entity-scoped calls to the HA instance that owns the entity.
+
+    The primary (Supervisor) backend keeps plain entity ids; every other
+    backend's entities are ``"<backend>:<entity_id>"``.
+    """
+
+    def __init__(self, primary: HAClient, extra: List[HAClient] = ()):
+        self.primary = primary
+        self.clients: Dict[str, HAClient] = {primary.name: primary}
+        for client in extra:
+            self.clients[client.name] = client
+
+    # primary-backend shortcuts used for global status
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.primary.breaker
+
+    @property
+    def token(self) -> str:
+        return self.primary.token
+
+    # ── routing ───────────────────────────────────────────────
+    def route(self, entity_id: str) -> Tuple[HAClient, str]:
+        name, sep, local = entity_id.partition(NS_SEP)
+        if sep and name in self.clients:
+            return self.clients[name], local
+        return self.primary, entity_id
+
+    def qualify(self, backend: str, entity_id: str) -> str:
+        if backend == self.primary.name:
+            return entity_id
+        return f"{backend}{NS_SEP}{entity_id}"
+
+    def breaker_for(self, entity_id: str) -> CircuitBreaker:
+        return self.route(entity_id)[0].breaker
+
+    # ── calls ─────────────────────────────────────────────────
+    async def get_entity_state(self, entity_id: str) -> Optional[Dict]:
+        client, local = self.route(entity_id)
+        return await client.get_entity_state(local)
+
+    async def call_service(self, domain: str, service: str,
+                           entity_id: str, data: dict = None) -> bool:
+        client, local = self.route(entity_id)
+        return await client.call_service(domain, service, local, data)
+
+    async def browse_media(self, entity_id: str, content_type: str = None,
+                           content_id: str = None) -> Optional[Dict]:
+        client, local = self.route(entity_id)
+        return await client.browse_media(local, content_type, content_id)
+
+    async def notify(self, service: str, message: str,
+                     targets: List[str] = None, data: dict = None) -> bool:
+        """One notify call per backend that owns any of the targets."""
+        if not targets:
+            return await self.primary.notify(service, message, None, data)
+        by_backend: Dict[str, List[str]] = {}
+        for eid in targets:
+            client, local = self.route(eid)
+            by_backend.setdefault(client.name, []).append(local)
+        results = await asyncio.gather(*(
+            self.clients[name].notify(service, message, locals_, data)
+            for name, locals_ in by_backend.items()
+        ))
+        return all(results)
+
+    def set_pool_size(self, size: int):
+        for client in self.clients.values():
+            client.set_pool_size(size)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
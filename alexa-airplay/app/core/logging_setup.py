@@ -0,0 +1,186 @@
+"""
+Logging Setup
+Routes every log record through a queue so formatting and console I/O
+happen on a listener thread instead of the event loop, collapses bursts
+of identical messages, and optionally emits one JSON object per line
+tagged with the current request's correlation id.
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+import uuid
+from typing import Dict, Optional
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")          # "text" or "json"
+# At most LOG_BURST identical messages per LOG_DEDUP_WINDOW seconds.
+LOG_DEDUP_WINDOW = float(os.getenv("LOG_DEDUP_WINDOW", "60"))
+LOG_BURST = int(os.getenv("LOG_BURST", "5"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default="")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_console: Optional[logging.Handler] = None
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+# ── formatting (listener thread) ──────────────────────────────
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        cid = getattr(record, "correlation_id", "")
+        if cid:
+            out["correlation_id"] = cid
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            out["suppressed"] = suppressed
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        cid = getattr(record, "correlation_id", "")
+        if cid:
+            text += f" [cid={cid}]"
+        return text
+
+
+def make_formatter(fmt: str) -> logging.Formatter:
+    return JSONFormatter() if fmt == "json" else TextFormatter()
+
+
+# ── enqueueing (caller's thread) ──────────────────────────────
+class _Burst:
+    __slots__ = ("started", "count", "suppressed", "record")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.count = 0
+        self.suppressed = 0
+        self.record: Optional[logging.LogRecord] = None
+
+
+class RateLimitedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops repeats beyond ``burst`` per ``window``.
+
+    Records are keyed by logger, level and the unformatted message, so
+    "GET /states error: %s" counts as one message whatever the error
+    text.  When a window closes, a "suppressed N similar" summary is
+    queued for every key that dropped something.
+    """
+
+    def __init__(self, q: queue.Queue, window: float = LOG_DEDUP_WINDOW,
+                 burst: int = LOG_BURST):
+        super().__init__(q)
+        self.window = window
+        self.burst = burst
+        self._bursts: Dict[tuple, _Burst] = {}
+        self._next_sweep = 0.0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default prepare() formats here, on the caller's thread; only
+        # freeze the message text and leave formatting to the listener.
+        record.msg = record.getMessage()
+        record.args = None
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = correlation_id.get()
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if self.window <= 0:
+            super().emit(record)
+            return
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        key = (record.name, record.levelno, str(record.msg))
+        b = self._bursts.get(key)
+        if b is None or now - b.started >= self.window:
+            if b is not None:
+                self._summarise(b)
+            b = self._bursts[key] = _Burst(now)
+        b.count += 1
+        if b.count <= self.burst:
+            super().emit(record)
+        else:
+            b.suppressed += 1
+            record.correlation_id = correlation_id.get()
+            b.record = record
+
+    def _sweep(self, now: float):
+        self._next_sweep = now + self.window
+        for key, b in list(self._bursts.items()):
+            if now - b.started >= self.window:
+                self._summarise(b)
+                del self._bursts[key]
+
+    def _summarise(self, b: _Burst):
+        if not b.suppressed:
+            return
+        last = b.record
+        summary = logging.LogRecord(
+            last.name, last.levelno, last.pathname, last.lineno,
+            "%s (suppressed %d similar in %ds)",
+            (last.getMessage(), b.suppressed, round(self.window)), None,
+        )
+        summary.suppressed = b.suppressed
+        summary.correlation_id = getattr(last, "correlation_id", "")
+        b.suppressed = 0
+        super().emit(summary)
+
+    def flush_summaries(self):
+        self._sweep(float("inf"))
+
+
+# ── wiring ────────────────────────────────────────────────────
+def setup_logging(level: str = "INFO", fmt: str = LOG_FORMAT):
+    """Install the queue handler on the root logger and start the
+    listener thread that owns the console handler."""
+    global _listener, _console
+    q: queue.Queue = queue.Queue(-1)
+    _console = logging.StreamHandler()
+    _console.setFormatter(make_formatter(fmt))
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(RateLimitedQueueHandler(q))
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    _listener = logging.handlers.QueueListener(q, _console, respect_handler_level=True)
+    _listener.start()
+
+
+def set_format(fmt: str):
+    """Switch between "text" and "json" output at runtime."""
+    if _console is not None:
+        _console.setFormatter(make_formatter(fmt))
+
+
+def shutdown_logging():
+    """Emit pending summaries and drain the queue."""
+    global _listener
+    for h in logging.getLogger().handlers:
+        if isinstance(h, RateLimitedQueueHandler):
+            h.flush_summaries()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,159 @@
+"""
+Device Name Index
+Fuzzy lookup of media_player entities by what people call them
+("kitchen", "living room dot") instead of their entity ids.
+
+Each entity contributes two fields – its friendly_name and the object
+id part of its entity_id – which are indexed by character trigram and
+by word.  A query is scored against every entity sharing a trigram
+with it, so lookups touch only plausible candidates.
+"""
+
+import heapq
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+MIN_SCORE = 0.3
+# Two matches closer than this are reported as ambiguous.
+AMBIGUITY_MARGIN = 0.05
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(words: List[str]) -> Set[str]:
+    grams = set()
+    for w in words:
+        padded = f" {w} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _object_id(entity_id: str) -> str:
+    # "backend:media_player.kitchen_dot" -> "kitchen_dot"
+    return entity_id.rpartition(":")[2].partition(".")[2] or entity_id
+
+
+class _Entry:
+    __slots__ = ("name", "norm", "fields", "words")
+
+    def __init__(self, name: str, norm: str, fields: Tuple[Set[str], ...], words: Set[str]):
+        self.name = name
+        self.norm = norm            # lower-cased words joined by single spaces
+        self.fields = fields
+        self.words = words
+
+
+class NameIndex:
+    """Trigram + word index over friendly names and entity ids."""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        # trigram -> {(entity_id, field_no)}
+        self._postings: Dict[str, Set[Tuple[str, int]]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ── maintenance ───────────────────────────────────────────
+    def add(self, entity_id: str, friendly_name: Optional[str]):
+        name = friendly_name or entity_id
+        current = self._entries.get(entity_id)
+        if current is not None and current.name == name:
+            return
+        self.remove(entity_id)
+        name_words = _words(name)
+        id_words = _words(_object_id(entity_id))
+        fields = (_trigrams(name_words), _trigrams(id_words))
+        for no, grams in enumerate(fields):
+            for g in grams:
+                self._postings[g].add((entity_id, no))
+        self._entries[entity_id] = _Entry(name, " ".join(name_words), fields,
+                                          set(name_words) | set(id_words))
+
+    def remove(self, entity_id: str):
+        entry = self._entries.pop(entity_id, None)
+        if entry is None:
+            return
+        for no, grams in enumerate(entry.fields):
+            for g in grams:
+                posting = self._postings.get(g)
+                if posting is not None:
+                    posting.discard((entity_id, no))
+                    if not posting:
+                        del self._postings[g]
+
+    # ── lookup ────────────────────────────────────────────────
+    def search(self, query: str, limit: int = 5,
+               min_score: float = MIN_SCORE) -> List[Dict]:
+        """Ranked matches: ``[{"entity_id", "friendly_name", "score"}]``.
+
+        The score mixes trigram similarity (Dice coefficient against the
+        closer of the two fields) with the share of query words found
+        as whole words or word prefixes; an exact name match scores 1.
+        """
+        q_words = _words(query)
+        if not q_words:
+            return []
+        q_grams = _trigrams(q_words)
+        hits: Counter = Counter()
+        postings = self._postings
+        for g in q_grams:
+            if g in postings:
+                hits.update(postings[g])
+
+        best: Dict[str, float] = {}
+        n_q = len(q_grams)
+        entries = self._entries
+        for (eid, no), shared in hits.items():
+            dice = 2 * shared / (n_q + len(entries[eid].fields[no]))
+            if dice > best.get(eid, 0.0):
+                best[eid] = dice
+
+        # Visit candidates best-dice first and stop once even full word
+        # coverage couldn't lift the next one into the top ``limit``.
+        q_text = " ".join(q_words)
+        top: List[Tuple[float, str]] = []          # min-heap of (score, entity_id)
+        for eid, dice in sorted(best.items(), key=lambda kv: -kv[1]):
+            floor = top[0][0] if len(top) >= limit else min_score
+            if 0.6 * dice + 0.4 < floor:
+                break
+            entry = self._entries[eid]
+            if entry.norm == q_text:
+                score = 1.0
+            else:
+                covered = 0.0
+                for w in q_words:
+                    if w in entry.words:
+                        covered += 1
+                    elif len(w) >= 3 and any(ew.startswith(w) for ew in entry.words):
+                        covered += 0.8
+                score = 0.6 * dice + 0.4 * covered / len(q_words)
+            if score < floor or (len(top) >= limit and score == floor):
+                continue
+            if len(top) < limit:
+                heapq.heappush(top, (score, eid))
+            else:
+                heapq.heapreplace(top, (score, eid))
+        top.sort(key=lambda t: (-t[0], t[1]))
+        return [{"entity_id": eid, "friendly_name": self._entries[eid].name,
+                 "score": round(score, 3)} for score, eid in top]
+
+    def resolve(self, query: str) -> Tuple[Optional[str], List[Dict]]:
+        """Best single entity for ``query`` and the candidates considered.
+
+        The entity is None when nothing matches well enough or when the
+        top two candidates are too close to call.
+        """
+        matches = self.search(query)
+        if not matches:
+            return None, matches
+        top = matches[0]
+        if (top["score"] < 1.0 and len(matches) > 1
+                and top["score"] - matches[1]["score"] < AMBIGUITY_MARGIN):
+            return None, matches
+        return top["entity_id"], matches
@@ -0,0 +1,111 @@
+"""
+Add-on Options Hot Reload
+Watches /data/options.json (rewritten by the Supervisor when the user
+saves the add-on configuration) and applies changed settings to the
+running subsystems, so tweaking them doesn't cost a container restart.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+from .ha_integration import OPTIONS_FILE
+
+logger = logging.getLogger(__name__)
+
+OPTIONS_POLL_INTERVAL = float(os.getenv("OPTIONS_POLL_INTERVAL", "5"))
+
+# Options that are only read at start-up; changing them is logged so the
+# user knows a restart is still needed.
+RESTART_REQUIRED = ("ha_backends", "debug_endpoints", "web_workers")
+
+
+class OptionsWatcher:
+    """Polls the options file's mtime and dispatches changed keys.
+
+    Handlers are registered per option with ``on(key, handler)`` and are
+    called as ``handler(new_value)``.  The first successful read applies
+    every registered option, so values that start.sh does not export
+    take effect at start-up too.  When an option is removed its handler
+    gets the ``default`` it was registered with, or isn't called if it
+    has none.
+    """
+
+    def __init__(self, path: str = OPTIONS_FILE,
+                 interval: float = OPTIONS_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.options: Optional[Dict[str, Any]] = None
+        self.reloads = 0
+        self._mtime: Optional[float] = None
+        self._handlers: Dict[str, Callable[[Any], None]] = {}
+        self._defaults: Dict[str, Any] = {}
+        self.running = False
+
+    def on(self, key: str, handler: Callable[[Any], None], default: Any = None):
+        self._handlers[key] = handler
+        if default is not None:
+            self._defaults[key] = default
+
+    # ── polling ───────────────────────────────────────────────
+    async def start(self):
+        self.running = True
+        logger.info("Watching %s for option changes", self.path)
+        while self.running:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        self.running = False
+
+    def _read(self, mtime: Optional[float]):
+        """Return (mtime, options) or None when the file is unchanged."""
+        try:
+            current = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if current == mtime:
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return current, json.load(f)
+
+    async def check(self) -> bool:
+        """Reload if the file changed; True when new options were applied."""
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, self._read, self._mtime)
+        except (OSError, ValueError) as e:
+            # The Supervisor may be mid-write; try again next poll.
+            logger.warning("Could not read %s: %s", self.path, e)
+            return False
+        if result is None:
+            return False
+        self._mtime, fresh = result
+        self.apply(fresh)
+        return True
+
+    def apply(self, fresh: Dict[str, Any]):
+        old = self.options
+        self.options = fresh
+        if old is None:
+            changed = set(self._handlers) & fresh.keys()
+        else:
+            changed = {k for k in fresh.keys() | old.keys() if fresh.get(k) != old.get(k)}
+            self.reloads += 1
+        for key in sorted(changed):
+            handler = self._handlers.get(key)
+            if handler is None:
+                if key in RESTART_REQUIRED:
+                    logger.warning("Option '%s' changed; restart the add-on to apply it", key)
+                continue
+            value = fresh.get(key, self._defaults.get(key))
+            if value is None:
+                continue
+            try:
+                handler(value)
+            except Exception as e:
+                logger.error("Applying option '%s' failed: %s", key, e)
+        if old is not None and changed:
+            logger.info("Options reloaded: %s", ", ".join(sorted(changed)))
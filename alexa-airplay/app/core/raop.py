@@ -0,0 +1,486 @@
+"""
+AirPlay (RAOP) Receiver
+Listens on AIRPLAY_PORT for RTSP session setup and receives the RTP audio
+stream into a preallocated jitter buffer.
+
+Audio payloads are stored as received (L16 PCM or ALAC frames) – decoding
+and re-streaming happen downstream of the ``sink`` callback.  Only
+unencrypted sessions are accepted: decrypting AES-protected streams and
+answering Apple-Challenge would need crypto dependencies the add-on
+doesn't ship.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import socket
+import struct
+import time
+from array import array
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AIRPLAY_PORT = int(os.getenv("AIRPLAY_PORT", "5001"))
+# How much audio to hold back before playout starts, which is also the
+# time a resend has to fill a hole before its packet is due.
+RAOP_BUFFER_MS = int(os.getenv("RAOP_BUFFER_MS", "500"))
+
+SAMPLE_RATE = 44100
+DEFAULT_FRAMES_PER_PACKET = 352
+RTP_HEADER = 12
+PT_AUDIO = 0x60
+PT_RESEND_REPLY = 0x56
+PT_SYNC = 0x54
+PT_RESEND_REQUEST = 0x55
+MAX_DATAGRAM = 2048
+
+_RESEND = struct.Struct(">BBHHH")
+_SEQ = struct.Struct(">H")
+
+# Returned by JitterBuffer.get() when the next packet is missing but later
+# ones are buffered: a hole a resend may still fill, not an underrun.
+MISSING = memoryview(b"")
+
+
+# ──────────────────────────────────────────────────────────────
+# Jitter buffer
+# ──────────────────────────────────────────────────────────────
+class JitterBuffer:
+    """Fixed-size ring of packet slots backed by one bytearray.
+
+    Packets are copied straight into their slot (``seq % slots``), so
+    out-of-order arrival is reordered for free and steady-state operation
+    allocates nothing per packet.  Sequence numbers are extended from the
+    16-bit RTP field to a monotonic int to survive wrap-around.
+    """
+
+    def __init__(self, slots: int = 1024, slot_size: int = MAX_DATAGRAM,
+                 latency_packets: int = 64, silence_bytes: int = 0):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.latency_packets = latency_packets
+        self._buf = bytearray(slots * slot_size)
+        self._view = memoryview(self._buf)
+        self._seq = array("q", [-1]) * slots
+        self._len = array("H", [0]) * slots
+        self.silence = memoryview(bytes(silence_bytes))
+        self.stats: Dict[str, int] = {}
+        self.reset()
+
+    def reset(self):
+        self.read_seq = -1          # next extended seq to hand out
+        self.high_seq = -1          # highest extended seq stored
+        self._reading = False       # has playout consumed anything yet?
+        for i in range(self.slots):
+            self._seq[i] = -1
+        self.stats = {"received": 0, "late": 0, "duplicate": 0, "lost": 0,
+                      "overrun": 0, "reordered": 0}
+
+    def _extend(self, seq16: int) -> int:
+        ref = self.high_seq if self.high_seq >= 0 else seq16
+        diff = ((seq16 - (ref & 0xFFFF) + 0x8000) & 0xFFFF) - 0x8000
+        return ref + diff
+
+    def put(self, seq16: int, payload: memoryview) -> Optional[Tuple[int, int]]:
+        """Store one packet; returns ``(first_missing_seq16, count)`` when
+        this packet revealed a gap worth a resend request."""
+        n = len(payload)
+        if n > self.slot_size:
+            payload = payload[:self.slot_size]
+            n = self.slot_size
+        if self.read_seq < 0:
+            self.read_seq = self.high_seq = seq16
+            ext = seq16
+        else:
+            ext = self._extend(seq16)
+        if ext < self.read_seq:
+            if self._reading or self.high_seq - ext >= self.slots:
+                self.stats["late"] += 1
+                return None
+            self.read_seq = ext     # reordered before playout began
+        if ext >= self.read_seq + self.slots:
+            # Sender is a whole ring ahead of playout – drop the oldest.
+            skipped = ext - self.slots + 1 - self.read_seq
+            self.stats["overrun"] += skipped
+            self.read_seq = ext - self.slots + 1
+        slot = ext % self.slots
+        if self._seq[slot] == ext:
+            self.stats["duplicate"] += 1
+            return None
+        off = slot * self.slot_size
+        self._view[off:off + n] = payload
+        self._len[slot] = n
+        self._seq[slot] = ext
+        self.stats["received"] += 1
+        gap = None
+        if ext > self.high_seq + 1:
+            gap = ((self.high_seq + 1) & 0xFFFF, ext - self.high_seq - 1)
+        elif ext < self.high_seq:
+            self.stats["reordered"] += 1
+        self.high_seq = max(self.high_seq, ext)
+        return gap
+
+    def buffered(self) -> int:
+        return 0 if self.read_seq < 0 else self.high_seq - self.read_seq + 1
+
+    def get(self) -> Optional[memoryview]:
+        """Next packet in sequence order; ``MISSING`` if that packet hasn't
+        arrived but later ones have, None if the buffer is empty."""
+        if self.read_seq < 0 or self.read_seq > self.high_seq:
+            return None
+        slot = self.read_seq % self.slots
+        self._reading = True
+        if self._seq[slot] == self.read_seq:
+            self.read_seq += 1
+            off = slot * self.slot_size
+            return self._view[off:off + self._len[slot]]
+        return MISSING
+
+    def skip(self) -> memoryview:
+        """Give up on the missing next packet; returns ``silence``."""
+        self.read_seq += 1
+        self.stats["lost"] += 1
+        return self.silence
+
+
+# ──────────────────────────────────────────────────────────────
+# RTP receiver (audio + control ports)
+# ──────────────────────────────────────────────────────────────
+class _UDPReader:
+    """Non-blocking UDP socket read with ``recv_into`` a reused buffer."""
+
+    def __init__(self, host: str, on_packet: Callable[[memoryview, tuple], None]):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 18)
+        self.sock.bind((host, 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self._scratch = bytearray(MAX_DATAGRAM)
+        self._view = memoryview(self._scratch)
+        self._on_packet = on_packet
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.sock.fileno(), self._readable)
+
+    def _readable(self):
+        while True:
+            try:
+                n, addr = self.sock.recvfrom_into(self._scratch)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug("RAOP UDP read error: %s", e)
+                return
+            if n >= RTP_HEADER:
+                self._on_packet(self._view[:n], addr)
+
+    def sendto(self, data: bytes, addr: tuple):
+        try:
+            self.sock.sendto(data, addr)
+        except OSError as e:
+            logger.debug("RAOP UDP send error: %s", e)
+
+    def close(self):
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+
+class RAOPSession:
+    """One sender's stream: sockets, jitter buffer and paced playout."""
+
+    def __init__(self, host: str, peer_ip: str, fmt: Dict,
+                 sink: Optional[Callable[[memoryview], None]]):
+        self.peer_ip = peer_ip
+        self.fmt = fmt
+        self.sink = sink
+        fpp = fmt["frames_per_packet"]
+        self.packet_seconds = fpp / fmt["rate"]
+        latency = max(1, int(RAOP_BUFFER_MS / 1000 / self.packet_seconds))
+        pcm = fmt["codec"] == "L16"
+        self.buffer = JitterBuffer(
+            slots=max(256, latency * 4),
+            slot_size=MAX_DATAGRAM,
+            latency_packets=latency,
+            silence_bytes=fpp * fmt["channels"] * 2 if pcm else 0,
+        )
+        self.volume_db: float = 0.0
+        self.client_control_port: Optional[int] = None
+        self._resend_seq = 0
+        self.audio = _UDPReader(host, self._on_audio)
+        self.control = _UDPReader(host, self._on_control)
+        self.timing = _UDPReader(host, lambda data, addr: None)
+        self._playout: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+
+    # ── packet input ──────────────────────────────────────────
+    def _on_audio(self, pkt: memoryview, addr):
+        if pkt[1] & 0x7F == PT_AUDIO:
+            self._store(pkt)
+
+    def _on_control(self, pkt: memoryview, addr):
+        pt = pkt[1] & 0x7F
+        if pt == PT_RESEND_REPLY and len(pkt) >= RTP_HEADER + 4:
+            self._store(pkt[4:])           # original RTP packet follows
+        # PT_SYNC carries RTP↔NTP timing; playout is paced locally instead
+
+    def _store(self, pkt: memoryview):
+        seq = _SEQ.unpack_from(pkt, 2)[0]
+        gap = self.buffer.put(seq, pkt[RTP_HEADER:])
+        if gap and self.client_control_port:
+            first, count = gap
+            self._resend_seq = (self._resend_seq + 1) & 0xFFFF
+            self.control.sendto(
+                _RESEND.pack(0x80, PT_RESEND_REQUEST | 0x80, self._resend_seq,
+                             first, min(count, 0xFFFF)),
+                (self.peer_ip, self.client_control_port),
+            )
+
+    # ── playout ───────────────────────────────────────────────
+    def start_playout(self):
+        if self._playout is None or self._playout.done():
+            self._playout = asyncio.create_task(self._run_playout())
+
+    async def _run_playout(self):
+        """Hand packets to the sink at the stream's real-time rate.
+
+        Wakes every ~20 ms and emits however many packets are due since
+        playout began, so timer jitter never accumulates into drift.  A
+        missing packet holds its slot for up to half the buffer latency
+        while the clock keeps running (the packets behind it then go out
+        in a burst), and is replaced with silence after that.
+        """
+        loop = asyncio.get_running_loop()
+        buf = self.buffer
+        while buf.buffered() < buf.latency_packets:
+            await asyncio.sleep(self.packet_seconds * 4)
+        grace = max(1, buf.latency_packets // 2) * self.packet_seconds
+        t0 = loop.time()
+        emitted = 0
+        hole_since: Optional[float] = None
+        while True:
+            due = int((loop.time() - t0) / self.packet_seconds) - emitted
+            while due > 0:
+                pkt = buf.get()
+                if pkt is None:
+                    # Underrun: restart the clock once audio is back.
+                    await asyncio.sleep(self.packet_seconds)
+                    t0 = loop.time()
+                    emitted = 0
+                    break
+                if pkt is MISSING:
+                    now = loop.time()
+                    if hole_since is None:
+                        hole_since = now
+                    if now - hole_since < grace:
+                        break              # hold the slot for a resend
+                    pkt = buf.skip()
+                hole_since = None
+                if len(pkt):
+                    try:
+                        self.sink(pkt)
+                    except Exception as e:
+                        logger.error("RAOP sink error: %s", e)
+                emitted += 1
+                due -= 1
+            await asyncio.sleep(0.02)
+
+    def _stop_playout(self) -> bool:
+        running = self._playout is not None and not self._playout.done()
+        if self._playout:
+            self._playout.cancel()
+            self._playout = None
+        return running
+
+    def flush(self):
+        """Drop buffered audio (seek/pause); playout re-primes itself."""
+        running = self._stop_playout()
+        self.buffer.reset()
+        if running:
+            self.start_playout()
+
+    def close(self):
+        self._stop_playout()
+        for reader in (self.audio, self.control, self.timing):
+            reader.close()
+
+    def to_dict(self) -> Dict:
+        return {
+            "peer": self.peer_ip,
+            "codec": self.fmt["codec"],
+            "frames_per_packet": self.fmt["frames_per_packet"],
+            "volume_db": self.volume_db,
+            "buffered_packets": self.buffer.buffered(),
+            "started_at": self.started_at,
+            **self.buffer.stats,
+        }
+
+
+# ──────────────────────────────────────────────────────────────
+# RTSP control connection
+# ──────────────────────────────────────────────────────────────
+def _parse_sdp(body: str) -> Optional[Dict]:
+    fmt = {"codec": None, "rate": SAMPLE_RATE, "channels": 2,
+           "frames_per_packet": DEFAULT_FRAMES_PER_PACKET, "encrypted": False}
+    for line in body.splitlines():
+        line = line.strip()
+        if line.startswith("a=rtpmap:"):
+            m = re.match(r"a=rtpmap:\d+\s+([\w-]+)(?:/(\d+)(?:/(\d+))?)?", line)
+            if m:
+                fmt["codec"] = m.group(1)
+                if m.group(2):
+                    fmt["rate"] = int(m.group(2))
+                if m.group(3):
+                    fmt["channels"] = int(m.group(3))
+        elif line.startswith("a=fmtp:"):
+            parts = line.split()
+            if fmt["codec"] == "AppleLossless" and len(parts) > 1:
+                fmt["frames_per_packet"] = int(parts[1])
+                if len(parts) > 11:
+                    fmt["rate"] = int(parts[11])
+        elif line.startswith(("a=rsaaeskey:", "a=fpaeskey:")):
+            fmt["encrypted"] = True
+    return fmt if fmt["codec"] in ("L16", "AppleLossless") else None
+
+
+class RAOPServer:
+    """RTSP listener managing a single active RAOP session."""
+
+    PUBLIC = ("ANNOUNCE, SETUP, RECORD, PAUSE, FLUSH, TEARDOWN, OPTIONS, "
+              "GET_PARAMETER, SET_PARAMETER")
+
+    def __init__(self, host: str = "0.0.0.0", port: int = AIRPLAY_PORT):
+        self.host = host
+        self.port = port
+        self.session: Optional[RAOPSession] = None
+        self.sink: Optional[Callable[[memoryview], None]] = None
+        self.on_format: Optional[Callable[[Dict], None]] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._pending_fmt: Optional[Dict] = None
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("AirPlay receiver listening on %s:%d", self.host, self.port)
+
+    async def stop(self):
+        self._end_session()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _end_session(self):
+        if self.session:
+            self.session.close()
+            self.session = None
+
+    def _emit(self, pkt: memoryview):
+        if self.sink is not None:
+            self.sink(pkt)
+
+    def to_dict(self) -> Dict:
+        return {
+            "port": self.port,
+            "session": self.session.to_dict() if self.session else None,
+        }
+
+    # ── RTSP ──────────────────────────────────────────────────
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer_ip = writer.get_extra_info("peername")[0]
+        local_ip = writer.get_extra_info("sockname")[0]
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_line = line.decode("latin-1").strip()
+                if not request_line:
+                    continue
+                headers: Dict[str, str] = {}
+                while True:
+                    h = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+                    if not h:
+                        break
+                    k, _, v = h.partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = b""
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    body = await reader.readexactly(length)
+                method = request_line.split(" ", 1)[0]
+                status, extra, payload = self._dispatch(method, headers, body,
+                                                        peer_ip, local_ip)
+                self._respond(writer, status, headers.get("cseq", "0"), extra, payload)
+                await writer.drain()
+                if method == "TEARDOWN":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error("RAOP connection error: %s", e)
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status: str, cseq: str, extra: Dict[str, str], payload: bytes):
+        lines = [f"RTSP/1.0 {status}", f"CSeq: {cseq}", "Server: AirTunes/105.1",
+                 "Audio-Jack-Status: connected; type=analog"]
+        lines += [f"{k}: {v}" for k, v in extra.items()]
+        if payload:
+            lines.append(f"Content-Length: {len(payload)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+
+    def _dispatch(self, method: str, headers: Dict[str, str], body: bytes,
+                  peer_ip: str, local_ip: str):
+        ok = "200 OK"
+        if method == "OPTIONS":
+            return ok, {"Public": self.PUBLIC}, b""
+        if method == "ANNOUNCE":
+            fmt = _parse_sdp(body.decode("utf-8", "replace"))
+            if fmt is None:
+                return "415 Unsupported Media Type", {}, b""
+            if fmt["encrypted"]:
+                logger.warning("Rejecting encrypted AirPlay stream from %s", peer_ip)
+                return "415 Unsupported Media Type", {}, b""
+            self._pending_fmt = fmt
+            return ok, {}, b""
+        if method == "SETUP":
+            if not self._pending_fmt:
+                return "455 Method Not Valid in This State", {}, b""
+            self._end_session()      # a new sender takes over, like AirPlay does
+            self.session = RAOPSession(local_ip if self.host == "0.0.0.0" else self.host,
+                                       peer_ip, self._pending_fmt, self._emit)
+            m = re.search(r"control_port=(\d+)", headers.get("transport", ""))
+            if m:
+                self.session.client_control_port = int(m.group(1))
+            if self.on_format:
+                self.on_format(self._pending_fmt)
+            s = self.session
+            transport = (f"RTP/AVP/UDP;unicast;mode=record;server_port={s.audio.port};"
+                         f"control_port={s.control.port};timing_port={s.timing.port}")
+            logger.info("AirPlay session from %s (%s)", peer_ip, s.fmt["codec"])
+            return ok, {"Transport": transport, "Session": "1"}, b""
+        if method == "RECORD":
+            if not self.session:
+                return "455 Method Not Valid in This State", {}, b""
+            self.session.start_playout()
+            return ok, {"Audio-Latency": str(int(RAOP_BUFFER_MS * SAMPLE_RATE / 1000))}, b""
+        if method in ("FLUSH", "PAUSE"):
+            if self.session:
+                self.session.flush()
+            return ok, {}, b""
+        if method == "SET_PARAMETER":
+            text = body.decode("utf-8", "replace")
+            m = re.search(r"volume:\s*(-?[\d.]+)", text)
+            if m and self.session:
+                self.session.volume_db = float(m.group(1))
+            return ok, {}, b""
+        if method == "GET_PARAMETER":
+            vol = self.session.volume_db if self.session else 0.0
+            return ok, {"Content-Type": "text/parameters"}, f"volume: {vol:.6f}\r\n".encode()
+        if method == "TEARDOWN":
+            self._end_session()
+            return ok, {}, b""
+        return "501 Not Implemented", {}, b""
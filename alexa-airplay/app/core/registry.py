@@ -0,0 +1,193 @@
+"""
+HA Registries
+Keeps a cached copy of Home Assistant's area, floor, device and entity
+registries so devices can be targeted by room.
+
+The registries are read once over HA's websocket API and then only
+re-read when HA fires the matching ``*_registry_updated`` event, instead
+of being polled alongside the states.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set
+
+import aiohttp
+
+from .ha_integration import HAClient
+
+logger = logging.getLogger(__name__)
+
+# registry name -> (websocket list command, update event)
+REGISTRIES = {
+    "area": ("config/area_registry/list", "area_registry_updated"),
+    "floor": ("config/floor_registry/list", "floor_registry_updated"),
+    "device": ("config/device_registry/list", "device_registry_updated"),
+    "entity": ("config/entity_registry/list", "entity_registry_updated"),
+}
+# Registry events come in bursts (e.g. a device with many entities);
+# wait for this much quiet before re-reading.
+REGISTRY_DEBOUNCE = 1.0
+RECONNECT_MIN = 5
+RECONNECT_MAX = 300
+
+
+class RegistryError(Exception):
+    pass
+
+
+def _ws_url(client: HAClient) -> str:
+    # Supervisor proxy: .../core/api -> .../core/websocket;
+    # a direct instance: http://host:8123/api -> .../api/websocket
+    base = client.base_url
+    if base.endswith("/core/api"):
+        base = base[:-len("/api")]
+    url = f"{base}/websocket"
+    return "ws" + url[4:] if url.startswith("http") else url
+
+
+class RegistryWatcher:
+    """Websocket subscriber for one HA backend's registries.
+
+    ``on_update(backend, snapshot)`` is called with
+    ``{"areas": {area_id: {...}}, "floors": {...}, "entity_area":
+    {entity_id: area_id}}`` after the initial read and after every
+    change; only media_player entities are kept.
+    """
+
+    def __init__(self, client: HAClient, on_update: Callable[[str, Dict], None]):
+        self.client = client
+        self.on_update = on_update
+        self.raw: Dict[str, list] = {name: [] for name in REGISTRIES}
+        self.connected = False
+        self.updates = 0
+        self.running = False
+        self._next_id = 0
+        self._dirty: Set[str] = set()
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        self.running = True
+        delay = RECONNECT_MIN
+        while self.running:
+            try:
+                await self._session()
+                delay = RECONNECT_MIN
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.running:
+                    logger.warning("Registry websocket (%s) failed: %s", self.client.name, e)
+            self.connected = False
+            if not self.running:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def stop(self):
+        self.running = False
+        if self._ws is not None:
+            await self._ws.close()
+
+    # ── websocket protocol ────────────────────────────────────
+    async def _session(self):
+        # Own session: the REST session's total timeout would cut a
+        # long-lived websocket.
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(_ws_url(self.client), heartbeat=30) as ws:
+                self._ws = ws
+                try:
+                    await self._auth(ws)
+                    self.connected = True
+                    for _cmd, event in REGISTRIES.values():
+                        await self._call(ws, {"type": "subscribe_events", "event_type": event})
+                    await self._reload(ws, set(REGISTRIES))
+                    logger.info("Registry websocket (%s) connected", self.client.name)
+                    await self._listen(ws)
+                finally:
+                    self._ws = None
+
+    async def _auth(self, ws):
+        hello = await ws.receive_json()
+        if hello.get("type") != "auth_required":
+            raise RegistryError(f"unexpected greeting {hello.get('type')!r}")
+        await ws.send_json({"type": "auth", "access_token": self.client.token})
+        reply = await ws.receive_json()
+        if reply.get("type") != "auth_ok":
+            raise RegistryError(reply.get("message") or "authentication failed")
+
+    async def _call(self, ws, payload: Dict):
+        """Send one command and wait for its result; events received in
+        the meantime are noted for the next reload."""
+        self._next_id += 1
+        msg_id = self._next_id
+        await ws.send_json({"id": msg_id, **payload})
+        while True:
+            msg = await ws.receive_json()
+            if msg.get("type") == "event":
+                self._note(msg)
+            elif msg.get("id") == msg_id:
+                if not msg.get("success"):
+                    err = msg.get("error") or {}
+                    raise RegistryError(f"{payload['type']}: {err.get('message', 'failed')}")
+                return msg.get("result")
+
+    def _note(self, msg: Dict):
+        event_type = (msg.get("event") or {}).get("event_type")
+        for name, (_cmd, event) in REGISTRIES.items():
+            if event == event_type:
+                self._dirty.add(name)
+
+    async def _listen(self, ws):
+        timeout: Optional[float] = None
+        while True:
+            try:
+                msg = await ws.receive(timeout=timeout)
+            except asyncio.TimeoutError:
+                dirty, self._dirty = self._dirty, set()
+                await self._reload(ws, dirty)
+                timeout = None
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise RegistryError(f"websocket closed ({msg.type.name})")
+            data = msg.json()
+            if data.get("type") == "event":
+                self._note(data)
+                if self._dirty:
+                    timeout = REGISTRY_DEBOUNCE
+
+    async def _reload(self, ws, names: Set[str]):
+        for name in names:
+            try:
+                self.raw[name] = await self._call(ws, {"type": REGISTRIES[name][0]}) or []
+            except RegistryError as e:
+                # Floors only exist on HA 2024.4+.
+                logger.debug("Registry %s unavailable on %s: %s", name, self.client.name, e)
+                self.raw[name] = []
+        self.updates += 1
+        self.on_update(self.client.name, self.snapshot())
+
+    # ── derived view ──────────────────────────────────────────
+    def snapshot(self) -> Dict:
+        areas = {a["area_id"]: {"name": a.get("name") or a["area_id"],
+                                "floor_id": a.get("floor_id")}
+                 for a in self.raw["area"] if a.get("area_id")}
+        floors = {f["floor_id"]: {"name": f.get("name") or f["floor_id"],
+                                  "level": f.get("level")}
+                  for f in self.raw["floor"] if f.get("floor_id")}
+        device_area = {d["id"]: d.get("area_id") for d in self.raw["device"] if d.get("id")}
+        entity_area = {}
+        for e in self.raw["entity"]:
+            eid = e.get("entity_id", "")
+            if not eid.startswith("media_player."):
+                continue
+            # An entity's own area overrides its device's.
+            area = e.get("area_id") or device_area.get(e.get("device_id"))
+            if area:
+                entity_area[eid] = area
+        return {"areas": areas, "floors": floors, "entity_area": entity_area}
+
+    def to_dict(self) -> Dict:
+        return {"connected": self.connected, "updates": self.updates,
+                **{name: len(rows) for name, rows in self.raw.items()}}
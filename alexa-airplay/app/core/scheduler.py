@@ -0,0 +1,430 @@
+"""
+Scheduled Commands
+Runs playback commands at set times ("play jazz in the kitchen at 07:00
+on weekdays", "pause the bedroom at 23:30") without an HA automation
+per schedule.
+
+All schedules share one min-heap of due times and one task that sleeps
+until the earliest of them, so thousands of schedules cost nothing
+while idle.  Edits push a fresh heap entry and leave the old one to be
+discarded when it surfaces.  Schedules are kept in /data/schedules.json
+together with their next due time, which lets a restart catch up on a
+run it missed (within the schedule's grace period) exactly once.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .device_manager import DeviceManager
+from .fade import FADE_MAX_DURATION, FadeEngine
+from .fanout import fan_out
+from .fileio import atomic_write
+from .ha_integration import HARouter
+
+logger = logging.getLogger(__name__)
+
+SCHEDULES_FILE = os.getenv("SCHEDULES_FILE", "/data/schedules.json")
+# Default grace period: a run missed by less than this (add-on restart,
+# host reboot) still happens after start-up; older misses are skipped.
+SCHEDULE_CATCH_UP = float(os.getenv("SCHEDULE_CATCH_UP", "900"))
+SCHEDULE_SAVE_DEBOUNCE = 1.0
+# Upper bound on one sleep, so wall-clock jumps (NTP, suspend) are noticed.
+MAX_SLEEP = 300.0
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+COMMANDS = ("play", "pause", "stop", "next", "previous", "volume", "play_media", "fade")
+_SERVICES = {
+    "play": "media_play",
+    "pause": "media_pause",
+    "stop": "media_stop",
+    "next": "media_next",
+    "previous": "media_previous",
+}
+TARGET_KEYS = ("entity_id", "name", "area", "floor")
+_FIELDS = ("id", "label", "time", "days", "at", "enabled", "catch_up", "command",
+           "value", "duration", "query", "service") + TARGET_KEYS
+
+
+def _parse_time(value: str) -> Tuple[int, int, int]:
+    parts = [int(p) for p in str(value).split(":")]
+    if len(parts) not in (2, 3):
+        raise ValueError
+    hh, mm, ss = (parts + [0])[:3]
+    if not (0 <= hh < 24 and 0 <= mm < 60 and 0 <= ss < 60):
+        raise ValueError
+    return hh, mm, ss
+
+
+def validate(data: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Normalised copy of a schedule definition; ValueError if invalid.
+
+    A schedule is either recurring (``time`` "HH:MM[:SS]" local time plus
+    optional ``days``, e.g. ``["mon", "fri"]``; none means daily) or
+    one-shot (``at``: epoch seconds or a local ISO datetime).  It names
+    exactly one target (``entity_id``, ``name``, ``area`` or ``floor``)
+    and a ``command`` as accepted by /api/command, ``play_media`` with
+    ``query``/``service`` as accepted by /api/play, or ``fade`` to
+    ``value`` over ``duration`` seconds as /api/fade does.  Given
+    ``now``, an enabled one-shot must lie in the future.
+    """
+    s = {k: data[k] for k in _FIELDS if data.get(k) not in (None, "")}
+    if ("time" in s) == ("at" in s):
+        raise ValueError("give either 'time' (recurring) or 'at' (one-shot)")
+    if "time" in s:
+        try:
+            hh, mm, ss = _parse_time(s["time"])
+        except ValueError:
+            raise ValueError(f"invalid time {s['time']!r}, expected HH:MM") from None
+        s["time"] = f"{hh:02d}:{mm:02d}:{ss:02d}" if ss else f"{hh:02d}:{mm:02d}"
+        days = [str(d).lower()[:3] for d in s.get("days") or []]
+        bad = [d for d in days if d not in DAYS]
+        if bad:
+            raise ValueError(f"invalid day(s) {bad}, expected {list(DAYS)}")
+        s["days"] = sorted(set(days), key=DAYS.index)
+    else:
+        at = s["at"]
+        try:
+            s["at"] = float(at) if isinstance(at, (int, float)) else datetime.fromisoformat(at).timestamp()
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid 'at' {at!r}") from None
+        if now is not None and data.get("enabled", True) and s["at"] <= now:
+            raise ValueError("'at' is in the past; the schedule would never run")
+        s.pop("days", None)
+    targets = [k for k in TARGET_KEYS if k in s]
+    if len(targets) != 1:
+        raise ValueError(f"give exactly one of {list(TARGET_KEYS)}")
+    command = s.get("command")
+    if command not in COMMANDS:
+        raise ValueError(f"command must be one of {list(COMMANDS)}")
+    if command in ("volume", "fade"):
+        try:
+            s["value"] = max(0.0, min(1.0, float(s["value"])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"{command} requires a numeric 'value'") from None
+    if command == "fade":
+        try:
+            s["duration"] = max(0.0, min(FADE_MAX_DURATION, float(s.get("duration", 0))))
+        except (TypeError, ValueError):
+            raise ValueError("invalid fade 'duration'") from None
+    else:
+        s.pop("duration", None)
+    if command == "play_media" and not s.get("query"):
+        raise ValueError("play_media requires a 'query'")
+    s["enabled"] = bool(data.get("enabled", True))
+    s["catch_up"] = max(0.0, float(s.get("catch_up", SCHEDULE_CATCH_UP)))
+    s["id"] = str(s.get("id") or uuid.uuid4().hex[:8])
+    return s
+
+
+def next_run(schedule: Dict, after: float) -> Optional[float]:
+    """First due time strictly after ``after`` (epoch); None when a
+    one-shot schedule has already passed."""
+    if "at" in schedule:
+        return schedule["at"] if schedule["at"] > after else None
+    hh, mm, ss = _parse_time(schedule["time"])
+    days = {DAYS.index(d) for d in schedule.get("days") or DAYS}
+    day = datetime.fromtimestamp(after).date()
+    for offset in range(8):
+        d = day + timedelta(days=offset)
+        if d.weekday() in days:
+            # Naive local datetime -> epoch follows DST changes.
+            due = datetime(d.year, d.month, d.day, hh, mm, ss).timestamp()
+            if due > after:
+                return due
+    return None
+
+
+class Scheduler:
+    """Timer heap of schedules plus the persisted schedule table."""
+
+    def __init__(self, ha_client: HARouter, device_manager: DeviceManager,
+                 fades: Optional[FadeEngine] = None, path: str = SCHEDULES_FILE):
+        self.ha = ha_client
+        self.dm = device_manager
+        self.fades = fades
+        self.path = path
+        self.schedules: Dict[str, Dict] = {}
+        # (due, generation, schedule id); an entry is live only while its
+        # generation matches _live[id], so edits never search the heap.
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, int] = {}
+        self._gen = itertools.count()
+        self._wake = asyncio.Event()
+        self._firing: Set[asyncio.Task] = set()
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._saving: Optional[asyncio.Task] = None
+        self.running = False
+        self.loaded = False
+        self.fired = 0
+        self.caught_up = 0
+        self.skipped = 0
+
+    # ── heap ──────────────────────────────────────────────────
+    def _push(self, sid: str, due: float):
+        gen = next(self._gen)
+        self._live[sid] = gen
+        entry = (due, gen, sid)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wake_loop()
+        # Stale entries are dropped as they surface; rebuild only when
+        # they clearly outnumber the live ones.
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [e for e in self._heap if self._live.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
+
+    def _arm(self, s: Dict, after: float):
+        s["next_run"] = next_run(s, after) if s["enabled"] else None
+        if s["next_run"] is None:
+            self._live.pop(s["id"], None)
+        else:
+            self._push(s["id"], s["next_run"])
+
+    def _peek(self) -> Optional[float]:
+        """Earliest live due time, discarding stale entries on top."""
+        heap = self._heap
+        while heap and self._live.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def _wake_loop(self):
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        self.running = True
+        await self._load()
+        logger.info("Scheduler started (%d schedule(s))", len(self.schedules))
+        while self.running:
+            self._fire_due(time.time())
+            wake = self._wake
+            due = self._peek()
+            delay = MAX_SLEEP if due is None else min(MAX_SLEEP, max(0.0, due - time.time()))
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        self.running = False
+        self._wake_loop()
+        for task in list(self._firing):
+            task.cancel()
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+            await self._save()
+        elif self._saving is not None:
+            await self._saving
+
+    # ── firing ────────────────────────────────────────────────
+    def _fire_due(self, now: float):
+        changed = False
+        while self._heap and self._heap[0][0] <= now:
+            due, gen, sid = heapq.heappop(self._heap)
+            if self._live.get(sid) != gen:
+                continue
+            s = self.schedules[sid]
+            self._launch(s)
+            if "at" in s:
+                s["enabled"] = False
+            self._arm(s, max(now, due))
+            changed = True
+        if changed:
+            self._schedule_save()
+
+    def _launch(self, s: Dict):
+        s["last_run"] = time.time()
+        self.fired += 1
+        task = asyncio.ensure_future(self._fire(dict(s)))
+        self._firing.add(task)
+        task.add_done_callback(self._firing.discard)
+
+    def targets_of(self, s: Dict) -> List[str]:
+        if "entity_id" in s:
+            return [s["entity_id"]]
+        if "name" in s:
+            eid, _matches = self.dm.names.resolve(s["name"])
+            return [eid] if eid else []
+        members = self.dm.entities_in(area=s.get("area"), floor=s.get("floor"))
+        return sorted(members or ())
+
+    async def _fire(self, s: Dict):
+        targets = self.targets_of(s)
+        if not targets:
+            logger.warning("Schedule %s: no device matches its target", s["id"])
+            result = {"ok": 0, "failed": 0, "error": "no matching device"}
+        elif s["command"] == "fade" and self.fades:
+            # One fade for all targets, so they stay in lockstep.
+            members = [eid for eid in targets if self.dm.supports(eid, "volume") is not False]
+            try:
+                fade = self.fades.fade(members, s["value"], s["duration"])
+            except ValueError as e:
+                result = {"ok": 0, "failed": len(targets), "error": str(e)}
+            else:
+                result = {"ok": len(members), "failed": len(targets) - len(members),
+                          "fade": fade["id"]}
+                logger.info("Schedule %s (fade) started fade %s on %d device(s)",
+                            s["id"], fade["id"], len(members))
+        else:
+            results = await fan_out(targets, lambda eid: self.execute(eid, s))
+            ok = sum(1 for r in results.values() if r["ok"])
+            result = {"ok": ok, "failed": len(results) - ok}
+            logger.info("Schedule %s (%s) fired: %d/%d device(s) ok",
+                        s["id"], s["command"], ok, len(results))
+        current = self.schedules.get(s["id"])
+        if current is not None:
+            current["last_result"] = result
+            self._schedule_save()
+
+    async def execute(self, entity_id: str, s: Dict) -> bool:
+        """Run one schedule's action on one device."""
+        command = s["command"]
+        if self.dm.supports(entity_id, command) is False:
+            raise ValueError(f"{entity_id} does not support '{command}'")
+        if command in ("volume", "fade"):
+            # "fade" only lands here without a fade engine: jump to the level.
+            if self.fades:
+                self.fades.cancel(entity_ids=[entity_id])
+            return await self.ha.volume_set(entity_id, s["value"])
+        if command == "play_media":
+            return await self.ha.play_media(entity_id, s["query"], s.get("service", "custom"))
+        return await getattr(self.ha, _SERVICES[command])(entity_id)
+
+    # ── editing ───────────────────────────────────────────────
+    def get_all(self) -> List[Dict]:
+        return sorted(self.schedules.values(),
+                      key=lambda s: (s.get("next_run") is None, s.get("next_run") or 0, s["id"]))
+
+    def create(self, data: Dict) -> Dict:
+        s = validate({k: v for k, v in data.items() if k != "id"}, now=time.time())
+        while s["id"] in self.schedules:
+            s["id"] = uuid.uuid4().hex[:8]
+        return self._put(s)
+
+    def update(self, sid: str, changes: Dict) -> Optional[Dict]:
+        old = self.schedules.get(sid)
+        if old is None:
+            return None
+        merged = {**old, **changes, "id": sid}
+        # Switching between recurring and one-shot drops the other kind.
+        if "at" in changes and "time" not in changes:
+            merged.pop("time", None)
+        elif "time" in changes and "at" not in changes:
+            merged.pop("at", None)
+        if any(k in changes for k in TARGET_KEYS):
+            for k in TARGET_KEYS:
+                if k not in changes:
+                    merged.pop(k, None)
+        # Relabelling a one-shot that already ran is fine; moving it or
+        # re-enabling it must put it in the future.
+        rearmed = "at" in changes or bool(changes.get("enabled"))
+        s = validate(merged, now=time.time() if rearmed else None)
+        for k in ("last_run", "last_result"):
+            if k in old:
+                s[k] = old[k]
+        return self._put(s)
+
+    def delete(self, sid: str) -> bool:
+        if self.schedules.pop(sid, None) is None:
+            return False
+        self._live.pop(sid, None)
+        self._schedule_save()
+        return True
+
+    def _put(self, s: Dict) -> Dict:
+        self.schedules[s["id"]] = s
+        self._arm(s, time.time())
+        self._schedule_save()
+        return s
+
+    # ── persistence ───────────────────────────────────────────
+    async def _load(self):
+        loop = asyncio.get_running_loop()
+        try:
+            raw = await loop.run_in_executor(None, self._read)
+        except (OSError, ValueError) as e:
+            logger.error("Could not read %s: %s", self.path, e)
+            raw = []
+        now = time.time()
+        for item in raw:
+            try:
+                s = validate(item)
+            except (ValueError, TypeError) as e:
+                logger.error("Dropping invalid schedule %r: %s", item.get("id"), e)
+                continue
+            for k in ("last_run", "last_result", "next_run"):
+                if item.get(k) is not None:
+                    s[k] = item[k]
+            self.schedules[s["id"]] = s
+            due = s.get("next_run")
+            if s["enabled"] and due is not None and due <= now:
+                # Missed while we were down: several missed runs
+                # collapse into one, and only within the grace period.
+                if now - due <= s["catch_up"] and s.get("last_run", 0) < due:
+                    logger.info("Schedule %s: catching up on run missed by %ds",
+                                s["id"], now - due)
+                    self.caught_up += 1
+                    self._launch(s)
+                else:
+                    logger.info("Schedule %s: skipping run missed by %ds",
+                                s["id"], now - due)
+                    self.skipped += 1
+                if "at" in s:
+                    s["enabled"] = False
+                self._arm(s, now)
+            elif s["enabled"]:
+                s["next_run"] = next_run(s, now)
+                if s["next_run"] is not None:
+                    gen = next(self._gen)
+                    self._live[s["id"]] = gen
+                    self._heap.append((s["next_run"], gen, s["id"]))
+        heapq.heapify(self._heap)
+        self.loaded = True
+        if self.caught_up or self.skipped:
+            self._schedule_save()
+
+    def _read(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f).get("schedules") or []
+
+    def _schedule_save(self):
+        if self._save_handle is None:
+            loop = asyncio.get_event_loop()
+            self._save_handle = loop.call_later(SCHEDULE_SAVE_DEBOUNCE, self._start_save)
+
+    def _start_save(self):
+        self._save_handle = None
+        self._saving = asyncio.ensure_future(self._save())
+
+    async def _save(self):
+        snapshot = json.dumps({"schedules": list(self.schedules.values())}, indent=1)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+        except OSError as e:
+            logger.error("Could not save schedules to %s: %s", self.path, e)
+
+    def _write(self, snapshot: str):
+        atomic_write(self.path, snapshot.encode("utf-8"), prefix=".schedules-")
+
+    def to_dict(self) -> Dict:
+        return {
+            "total": len(self.schedules),
+            "armed": len(self._live),
+            "heap": len(self._heap),
+            "next_due": self._peek(),
+            "fired": self.fired,
+            "caught_up": self.caught_up,
+            "skipped": self.skipped,
+        }
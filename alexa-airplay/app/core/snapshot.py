@@ -0,0 +1,114 @@
+"""
+Snapshot / Restore
+Captures the playback state of every playing device in one pass over the
+DeviceManager cache, pauses them together, and later puts each one back
+at its previous volume and source.
+
+Capturing again under a name that hasn't been restored yet (a doorbell
+pressed twice) adds to that snapshot instead of replacing it: the second
+pass would only see the devices the first one paused, and their resume
+state would be lost.
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+from .device_manager import DeviceManager
+from .fanout import fan_out
+from .ha_integration import HARouter
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotManager:
+    """Named snapshots of media_player state for announcement automations."""
+
+    def __init__(self, ha_client: HARouter, device_manager: DeviceManager):
+        self.ha = ha_client
+        self.dm = device_manager
+        self.snapshots: Dict[str, Dict] = {}   # name -> {"taken_at", "devices"}
+
+    async def capture(self, name: str = "default",
+                      entity_ids: Optional[Iterable[str]] = None,
+                      pause: bool = True,
+                      include_idle: bool = False,
+                      overwrite: bool = False) -> Dict:
+        """Record state/volume/source and optionally pause all at once.
+
+        Only playing devices are captured unless ``include_idle`` is set
+        or explicit ``entity_ids`` are given (an empty list captures
+        nothing).  An unrestored snapshot of the same name keeps what it
+        already recorded for a device unless ``overwrite`` is set.
+        """
+        start = time.monotonic()
+        cache = self.dm.devices          # one consistent view of the cache
+        wanted = set(entity_ids) if entity_ids is not None else None
+        existing = None if overwrite else self.snapshots.get(name)
+        kept = existing["devices"] if existing else {}
+        captured: Dict[str, Dict] = {}
+        for eid, st in cache.items():
+            if wanted is not None and eid not in wanted:
+                continue
+            if eid in kept:
+                continue
+            if wanted is None and not include_idle and st.get("state") != "playing":
+                continue
+            attrs = st.get("attributes", {})
+            captured[eid] = {
+                "state": st.get("state"),
+                "volume": attrs.get("volume_level"),
+                "source": attrs.get("source"),
+            }
+        if existing:
+            existing["devices"] = {**kept, **captured}
+        else:
+            self.snapshots[name] = {"taken_at": time.time(), "devices": captured}
+
+        results: Dict[str, Dict] = {}
+        if pause:
+            playing = [eid for eid, snap in captured.items()
+                       if snap["state"] == "playing"
+                       and self.dm.supports(eid, "pause") is not False]
+            results = await fan_out(playing, self.ha.media_pause)
+        logger.info("Snapshot '%s': %d device(s)%s, %d paused", name, len(captured),
+                    f" added to {len(kept)} kept" if existing else "", len(results))
+        return {
+            "name": name,
+            "merged": bool(existing),
+            "devices": {eid: {**snap, **({"pause": results[eid]} if eid in results else {})}
+                        for eid, snap in captured.items()},
+            "kept": sorted(kept),
+            "total_ms": round((time.monotonic() - start) * 1000),
+        }
+
+    async def restore(self, name: str = "default", keep: bool = False) -> Optional[Dict]:
+        """Put every device of a snapshot back; None if it doesn't exist."""
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            return None
+        start = time.monotonic()
+        devices = snapshot["devices"]
+
+        async def restore_one(eid: str) -> bool:
+            snap = devices[eid]
+            current = self.dm.devices.get(eid, {}).get("attributes", {})
+            ok = True
+            if snap["volume"] is not None and snap["volume"] != current.get("volume_level"):
+                ok &= await self.ha.volume_set(eid, float(snap["volume"]))
+            if (snap["source"] and snap["source"] != current.get("source")
+                    and self.dm.supports(eid, "select_source") is not False):
+                ok &= await self.ha.select_source(eid, snap["source"])
+            if snap["state"] == "playing":
+                ok &= await self.ha.media_play(eid)
+            return ok
+
+        results = await fan_out(devices.keys(), restore_one)
+        if not keep and all(r["ok"] for r in results.values()):
+            self.snapshots.pop(name, None)
+        logger.info("Restored snapshot '%s' to %d device(s)", name, len(results))
+        return {
+            "name": name,
+            "devices": results,
+            "total_ms": round((time.monotonic() - start) * 1000),
+        }
@@ -0,0 +1,215 @@
+"""
+Audio Re-Streaming
+One producer writes audio into a shared ring buffer; any number of HTTP
+listeners read from it at their own offsets, so an extra Echo costs a
+copy of what it is sent and a socket write.  Listeners that fall more than a ring
+behind are skipped ahead (or dropped) instead of slowing the producer.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, List
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+STREAM_BUFFER_KB = int(os.getenv("STREAM_BUFFER_KB", "512"))
+# Base URL the Echos can reach the add-on on, e.g. http://192.168.1.10:8099
+STREAM_BASE_URL = os.getenv("STREAM_BASE_URL", "").rstrip("/")
+MAX_SKIPS = 5
+
+
+class _Listener:
+    __slots__ = ("id", "peer", "pos", "sent", "skips", "connected_at")
+
+    def __init__(self, lid: int, peer: str, pos: int):
+        self.id = lid
+        self.peer = peer
+        self.pos = pos
+        self.sent = 0
+        self.skips = 0
+        self.connected_at = time.time()
+
+
+class StreamHub:
+    """Single-producer, multi-listener ring buffer.
+
+    Positions are absolute byte counts since the hub was created; the
+    ring index is ``pos % capacity``.  What a listener is sent is copied
+    out of the ring first: the transport may hold on to it unflushed
+    while the producer wraps around and overwrites that region.
+    """
+
+    def __init__(self, capacity: int = STREAM_BUFFER_KB * 1024):
+        self.capacity = capacity
+        self._ring = bytearray(capacity)
+        self._view = memoryview(self._ring)
+        self.write_pos = 0
+        self.content_type = "application/octet-stream"
+        self.header = b""            # sent once to every new listener
+        self.align = 1               # skip-ahead granularity (frame size)
+        self.byte_rate = 0           # bytes per second, for lag in ms
+        self.available = False
+        self._listeners: Dict[int, _Listener] = {}
+        self._next_id = 0
+        self._wake = asyncio.Event()
+
+    # ── producer side ─────────────────────────────────────────
+    def configure(self, content_type: str, header: bytes = b"",
+                  align: int = 1, byte_rate: int = 0):
+        self.content_type = content_type
+        self.header = header
+        self.align = max(1, align)
+        self.byte_rate = byte_rate
+        self.available = True
+
+    def publish(self, data):
+        """Append bytes to the ring and wake every waiting listener."""
+        n = len(data)
+        if n == 0:
+            return
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if first < n:
+            self._view[0:n - first] = data[first:]
+        self.write_pos += n
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    # ── listener side ─────────────────────────────────────────
+    def _chunks(self, lst: _Listener) -> List[memoryview]:
+        """Ring slices between the listener's offset and the write head."""
+        behind = self.write_pos - lst.pos
+        if behind > self.capacity:
+            # Too slow: jump to half a ring behind live, frame-aligned.
+            target = self.write_pos - self.capacity // 2
+            lst.pos = target - (target % self.align)
+            lst.skips += 1
+            behind = self.write_pos - lst.pos
+        if behind <= 0:
+            return []
+        start = lst.pos % self.capacity
+        first = min(behind, self.capacity - start)
+        out = [self._view[start:start + first]]
+        if first < behind:
+            out.append(self._view[0:behind - first])
+        return out
+
+    async def serve(self, request: web.Request) -> web.StreamResponse:
+        if not self.available:
+            return web.json_response({"error": "No audio source active"}, status=503)
+        resp = web.StreamResponse(headers={
+            "Content-Type": self.content_type,
+            "Cache-Control": "no-cache",
+        })
+        await resp.prepare(request)
+        lid = self._next_id
+        self._next_id += 1
+        live = self.write_pos - (self.write_pos % self.align)
+        lst = self._listeners[lid] = _Listener(lid, request.remote or "?", live)
+        logger.info("Stream listener %d connected from %s", lid, lst.peer)
+        try:
+            if self.header:
+                await resp.write(self.header)
+            while self.available:
+                chunks = self._chunks(lst)
+                if lst.skips > MAX_SKIPS:
+                    logger.warning("Dropping stream listener %d: too slow", lid)
+                    break
+                if not chunks:
+                    await self._wake.wait()
+                    continue
+                # One copy of everything pending, taken before the first
+                # await, so the producer can't overwrite it under us.
+                data = b"".join(chunks)
+                lst.pos += len(data)
+                lst.sent += len(data)
+                await resp.write(data)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._listeners.pop(lid, None)
+            logger.info("Stream listener %d disconnected", lid)
+        return resp
+
+    def stop(self):
+        self.available = False
+        self._wake.set()
+
+    def to_dict(self) -> Dict:
+        listeners = []
+        for lst in self._listeners.values():
+            lag = self.write_pos - lst.pos
+            listeners.append({
+                "id": lst.id,
+                "peer": lst.peer,
+                "lag_bytes": lag,
+                "lag_ms": round(lag * 1000 / self.byte_rate) if self.byte_rate else None,
+                "sent_bytes": lst.sent,
+                "skips": lst.skips,
+                "connected_at": lst.connected_at,
+            })
+        return {
+            "available": self.available,
+            "content_type": self.content_type,
+            "url": f"{STREAM_BASE_URL}/stream/live" if STREAM_BASE_URL else None,
+            "buffer_bytes": self.capacity,
+            "written_bytes": self.write_pos,
+            "listeners": listeners,
+        }
+
+
+# ──────────────────────────────────────────────────────────────
+# AirPlay → HTTP adapter
+# ──────────────────────────────────────────────────────────────
+def _wav_header(rate: int, channels: int) -> bytes:
+    """Streaming WAV header with an 'unknown' (maximum) data length."""
+    byte_rate = rate * channels * 2
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, rate,
+                                    byte_rate, channels * 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+class AirPlayStreamSource:
+    """Feeds RAOP playout into a StreamHub as a WAV stream.
+
+    RTP L16 is big-endian; it is swapped once here, on the producer side,
+    so the per-listener path stays copy-free.  ALAC sessions are not
+    re-streamed because the add-on has no ALAC decoder.
+    """
+
+    def __init__(self, hub: StreamHub):
+        self.hub = hub
+        self._swap = sys.byteorder == "little"
+
+    def on_format(self, fmt: Dict):
+        if fmt["codec"] != "L16":
+            logger.warning("AirPlay codec %s cannot be re-streamed", fmt["codec"])
+            self.hub.stop()
+            return
+        ch, rate = fmt["channels"], fmt["rate"]
+        self.hub.configure("audio/wav", _wav_header(rate, ch),
+                           align=ch * 2, byte_rate=rate * ch * 2)
+
+    def sink(self, pkt: memoryview):
+        if not self.hub.available:
+            return
+        if self._swap:
+            samples = array("h")
+            samples.frombytes(pkt[:len(pkt) & ~1])
+            samples.byteswap()
+            self.hub.publish(memoryview(samples).cast("B"))
+        else:
+            self.hub.publish(pkt)
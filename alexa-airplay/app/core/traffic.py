@@ -0,0 +1,195 @@
+"""
+Traffic Capture / Replay
+Records HAClient request/response pairs with their timings to a JSONL
+file, and replays such a file as an offline HA backend so production
+behaviour can be reproduced and profiled without a network.
+
+Recording is enabled with HA_RECORD_FILE; replay with HA_REPLAY_FILE
+(and HA_REPLAY_SPEED to compress recorded latencies).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .ha_integration import PRIMARY_BACKEND, HAClient
+
+logger = logging.getLogger(__name__)
+
+HA_RECORD_FILE = os.getenv("HA_RECORD_FILE", "")
+HA_REPLAY_FILE = os.getenv("HA_REPLAY_FILE", "")
+HA_REPLAY_SPEED = float(os.getenv("HA_REPLAY_SPEED", "1"))
+# Mask personal free text (names, titles, ...) as well as secrets.
+HA_RECORD_ANONYMIZE = os.getenv("HA_RECORD_ANONYMIZE", "true").lower() in ("1", "true", "yes")
+
+# Keys whose values are secrets – always replaced.
+_SECRET_KEY = re.compile(r"token|password|secret|api_key|access|auth", re.I)
+# Secret query parameters inside URLs (entity_picture's ?token=...) –
+# always replaced, whatever HA_RECORD_ANONYMIZE says.
+_SECRET_PARAM = re.compile(r"([?&][^=&#\s]*(?:token|auth)[^=&#\s]*=)[^&#\s]*", re.I)
+# Free-text attributes that identify people or their listening habits;
+# replaced by stable pseudonyms of the same length so payload sizes and
+# equality between records are preserved.
+_PERSONAL_KEYS = frozenset((
+    "friendly_name", "media_title", "media_artist", "media_album_name",
+    "media_album_artist", "media_series_name", "media_playlist",
+    "media_content_id", "entity_picture", "message", "title", "query",
+    "latitude", "longitude",
+))
+
+
+def _pseudonym(value: str) -> str:
+    digest = hashlib.sha256(value.encode()).hexdigest()
+    return (digest * (len(value) // 64 + 1))[:len(value)]
+
+
+def sanitize(obj: Any, personal: bool = False) -> Any:
+    """Copy of ``obj`` with secrets redacted and personal text masked."""
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if _SECRET_KEY.search(k) and isinstance(v, str):
+                out[k] = "REDACTED"
+            else:
+                out[k] = sanitize(v, personal or (HA_RECORD_ANONYMIZE and k in _PERSONAL_KEYS))
+        return out
+    if isinstance(obj, list):
+        return [sanitize(v, personal) for v in obj]
+    if personal and isinstance(obj, str):
+        return _pseudonym(obj)
+    if isinstance(obj, str) and "?" in obj:
+        return _SECRET_PARAM.sub(r"\1REDACTED", obj)
+    if personal and isinstance(obj, float):
+        return round(obj, 1)
+    return obj
+
+
+# ──────────────────────────────────────────────────────────────
+# Recording
+# ──────────────────────────────────────────────────────────────
+class TrafficRecorder:
+    """Appends one JSON line per HA round trip.
+
+    Sanitising and file I/O happen on a writer thread; the event loop
+    only enqueues the raw objects.  Each line carries ``t`` (seconds
+    since recording started), ``ms`` (round-trip time), the backend,
+    method, path, request body and either ``status``/``response`` or
+    ``error`` for transport failures.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.monotonic()
+        self.count = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name="ha-recorder", daemon=True)
+        self._thread.start()
+        logger.warning("Recording HA traffic to %s", path)
+
+    def record(self, backend: str, method: str, path: str, data: Optional[dict],
+               status: Optional[int], body: Any, elapsed: float):
+        self.count += 1
+        self._queue.put({
+            "t": round(time.monotonic() - elapsed - self.started, 4),
+            "ms": round(elapsed * 1000, 2),
+            "backend": backend,
+            "method": method,
+            "path": path,
+            "request": data,
+            "status": status,
+            "body": body,
+        })
+
+    def _writer(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    break
+                if entry["status"] is None:
+                    entry["error"] = entry.pop("body")
+                else:
+                    entry["response"] = sanitize(entry.pop("body"))
+                entry["request"] = sanitize(entry["request"])
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        logger.info("Recorded %d HA round trip(s) to %s", self.count, self.path)
+
+
+# ──────────────────────────────────────────────────────────────
+# Replay
+# ──────────────────────────────────────────────────────────────
+class ReplayHAClient(HAClient):
+    """HAClient that answers from a recording instead of the network.
+
+    Responses for each (method, path) are served in recorded order and
+    the last one is repeated once they run out, so a /states poll walks
+    through the captured timeline.  Each answer is delayed by its
+    recorded round-trip time divided by ``speed``; recorded transport
+    errors are raised again, so breaker behaviour replays too.  POSTs
+    with no recording succeed after the median recorded POST latency.
+    """
+
+    def __init__(self, name: str, entries: List[Dict], speed: float = HA_REPLAY_SPEED):
+        super().__init__(name, base_url=f"replay://{name}", token="")
+        self.speed = max(speed, 1e-6)
+        self._entries: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+        for e in entries:
+            self._entries[(e["method"], e["path"])].append(e)
+        self._cursor: Dict[Tuple[str, str], int] = defaultdict(int)
+        post_ms = sorted(e["ms"] for e in entries if e["method"] == "POST")
+        self._post_ms = post_ms[len(post_ms) // 2] if post_ms else 0.0
+        self.served = 0
+
+    async def _ensure_session(self):
+        raise RuntimeError("replay client has no network session")
+
+    async def _send(self, method: str, path: str, data: dict = None) -> Tuple[int, Any]:
+        key = (method, path)
+        recorded = self._entries.get(key)
+        self.served += 1
+        if not recorded:
+            if method == "POST":
+                await asyncio.sleep(self._post_ms / 1000 / self.speed)
+                return 200, []
+            return 404, f"no recording for {method} {path}"
+        i = self._cursor[key]
+        self._cursor[key] = min(i + 1, len(recorded) - 1)
+        entry = recorded[i]
+        await asyncio.sleep(entry["ms"] / 1000 / self.speed)
+        if entry.get("status") is None:
+            error = entry.get("error", "")
+            if "Timeout" in error:
+                raise asyncio.TimeoutError()
+            raise aiohttp.ClientConnectionError(error)
+        return entry["status"], entry.get("response")
+
+
+def load_replay(path: str, speed: float = HA_REPLAY_SPEED) -> Tuple[ReplayHAClient, List[ReplayHAClient]]:
+    """(primary, extra) replay clients for every backend in a recording."""
+    by_backend: Dict[str, List[Dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                by_backend[entry.get("backend", PRIMARY_BACKEND)].append(entry)
+    primary = ReplayHAClient(PRIMARY_BACKEND, by_backend.pop(PRIMARY_BACKEND, []), speed)
+    extra = [ReplayHAClient(name, entries, speed) for name, entries in sorted(by_backend.items())]
+    logger.warning("Replaying HA traffic from %s at %gx (%d backend(s))",
+                   path, speed, 1 + len(extra))
+    return primary, extra
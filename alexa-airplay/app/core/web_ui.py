@@ -4,12 +4,68 @@ Provides device discovery dashboard and playback controls.
 Fully compatible with Home Assistant Ingress proxy.
 """
 
+import base64
 import json
 import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
 from aiohttp import web
 
+from .admission import AdmissionController, LoopLagMonitor
+from .announce import ANNOUNCE_TYPES
+from .circuit_breaker import CLOSED
+from .debug_tools import DEBUG_ENDPOINTS, DebugTools
+from .device_manager import DEVICE_FIELDS
+from .fanout import fan_out
+from .logging_setup import correlation_id, new_correlation_id
+
 logger = logging.getLogger(__name__)
 
+GROUP_COMMANDS = ("play", "pause", "stop", "next", "previous", "volume")
+DEVICE_PAGE_MAX = 1000
+NDJSON_CHUNK = 64 * 1024
+
+
+def _parse_fields(raw: Optional[str]) -> Optional[Tuple[str, ...]]:
+    if not raw:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in DEVICE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"unknown field(s) {unknown}; valid: {sorted(DEVICE_FIELDS)}")
+    return fields
+
+
+def _parse_limit(raw: Optional[str]) -> Optional[int]:
+    if raw is None:
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= DEVICE_PAGE_MAX:
+        raise ValueError(f"limit must be 1-{DEVICE_PAGE_MAX}")
+    return limit
+
+
+# Cursors are opaque to clients: the last entity id of the previous page.
+def _encode_cursor(entity_id: str) -> str:
+    return base64.urlsafe_b64encode(entity_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        raw = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+        entity_id = raw.decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor") from None
+    if not entity_id:
+        raise ValueError("invalid cursor")
+    return entity_id
+
+
 # ──────────────────────────────────────────────────────────────
 # HTML – uses only relative URLs for HA Ingress compatibility
 # ──────────────────────────────────────────────────────────────
@@ -62,6 +118,7 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
 .device-card .name{font-weight:700;font-size:1em;margin-bottom:6px}
 .device-card .meta{font-size:.82em;color:var(--muted)}
 .device-card .now-playing{font-size:.82em;color:var(--green);margin-top:6px}
+.device-card .vol{margin-left:8px}
 
 .controls{display:flex;gap:8px;align-items:center;justify-content:center;flex-wrap:wrap;margin-top:12px}
 .controls button{font-size:1.2em;width:44px;height:44px;padding:0;display:flex;
@@ -78,6 +135,13 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
 .info-box{background:rgba(83,168,226,.08);border:1px solid rgba(83,168,226,.2);
           border-radius:8px;padding:14px;margin-bottom:16px;font-size:.88em;color:var(--muted);line-height:1.5}
 .info-box b{color:var(--blue)}
+.crumbs{font-size:.85em;color:var(--muted);margin-bottom:8px}
+.crumbs a{color:var(--blue);cursor:pointer}
+.browse-list{list-style:none;max-height:360px;overflow-y:auto}
+.browse-list li{padding:8px 10px;border-bottom:1px solid var(--border);cursor:pointer;
+                display:flex;justify-content:space-between;gap:10px}
+.browse-list li:hover{background:var(--accent)}
+.browse-list .kind{font-size:.8em;color:var(--muted);white-space:nowrap}
 </style>
 </head>
 <body>
@@ -114,13 +178,12 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
   <div style="display:flex;justify-content:space-between;align-items:center">
     <h2>Devices</h2>
     <div class="filter-row">
-      <label><input type="checkbox" id="echoOnly" checked onchange="renderDevices()"> Echo only</label>
+      <label><input type="checkbox" id="echoOnly" checked onchange="applyFilter()"> Echo only</label>
       <button class="btn-primary btn-small" onclick="refreshDevices()">Refresh</button>
     </div>
   </div>
-  <div id="deviceGrid" class="device-grid">
-    <p style="color:var(--muted)">Loading devices...</p>
-  </div>
+  <p id="gridMsg" style="color:var(--muted)">Loading devices...</p>
+  <div id="deviceGrid" class="device-grid"></div>
 </div>
 
 <!-- Playback controls -->
@@ -128,13 +191,13 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
   <h2>Now Playing — <span id="selectedName">-</span></h2>
   <div id="nowPlaying" style="color:var(--muted);font-size:.9em;margin-bottom:10px">Nothing playing</div>
   <div class="controls">
-    <button onclick="cmd('previous')" title="Previous">&#9198;</button>
-    <button onclick="cmd('play')" title="Play">&#9654;&#65039;</button>
-    <button onclick="cmd('pause')" title="Pause">&#9208;&#65039;</button>
-    <button onclick="cmd('stop')" title="Stop">&#9209;&#65039;</button>
-    <button onclick="cmd('next')" title="Next">&#9197;</button>
+    <button data-cap="previous_track" onclick="cmd('previous')" title="Previous">&#9198;</button>
+    <button data-cap="play" onclick="cmd('play')" title="Play">&#9654;&#65039;</button>
+    <button data-cap="pause" onclick="cmd('pause')" title="Pause">&#9208;&#65039;</button>
+    <button data-cap="stop" onclick="cmd('stop')" title="Stop">&#9209;&#65039;</button>
+    <button data-cap="next_track" onclick="cmd('next')" title="Next">&#9197;</button>
   </div>
-  <div class="volume-row">
+  <div class="volume-row" data-cap="volume_set">
     <span style="color:var(--muted)">Vol</span>
     <input type="range" id="volumeSlider" min="0" max="100" value="50"
            oninput="document.getElementById('volLabel').textContent=this.value+'%'"
@@ -144,7 +207,7 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
 </div>
 
 <!-- Play music command -->
-<div class="card" id="playCard" style="display:none">
+<div class="card" id="playCard" data-cap="play_media" style="display:none">
   <h2>Play Music</h2>
   <label for="musicService">Service</label>
   <select id="musicService">
@@ -166,6 +229,16 @@ button{padding:10px 20px;border:none;border-radius:8px;cursor:pointer;font-size:
   </p>
 </div>
 
+<!-- Media library -->
+<div class="card" id="browseCard" data-cap="browse_media" style="display:none">
+  <h2>Browse Library</h2>
+  <div id="browseCrumbs" class="crumbs"></div>
+  <ul id="browseList" class="browse-list"></ul>
+  <div class="btn-row">
+    <button class="btn-primary btn-small" onclick="browseTo(0)">Library Home</button>
+  </div>
+</div>
+
 <div class="footer">Alexa Music Controller &bull; Home Assistant Add-on</div>
 
 <script>
@@ -177,8 +250,14 @@ function apiUrl(path) {
 }
 function showMsg(text, ok) {
   const d = document.getElementById('msgArea');
-  d.innerHTML = '<div class="msg '+(ok?'msg-ok':'msg-err')+'">'+text+'</div>';
-  setTimeout(() => d.innerHTML = '', 6000);
+  const m = document.createElement('div');
+  m.className = 'msg ' + (ok ? 'msg-ok' : 'msg-err');
+  m.textContent = text;
+  d.replaceChildren(m);
+  setTimeout(() => { if (m.parentNode === d) d.replaceChildren(); }, 6000);
+}
+function trackText(d) {
+  return d.media_title ? '\u266B ' + (d.media_artist ? d.media_artist + ' — ' : '') + d.media_title : '';
 }
 
 let allDevices = [];
@@ -188,13 +267,17 @@ let selectedEntity = null;
 async function refreshDevices() {
   try {
     const r = await fetch(apiUrl('api/devices'), {credentials:'same-origin'});
+    if (r.status === 503) return;   // shed while the server is busy; keep the last list
     if (!r.ok) throw new Error('HTTP ' + r.status);
     const d = await r.json();
     allDevices = d.devices || [];
 
     // Update HA badge
     const badge = document.getElementById('haBadge');
-    if (d.ha_connected) {
+    if (d.stale) {
+      badge.textContent = 'HA restarting (cached)';
+      badge.className = 'status-badge status-warn';
+    } else if (d.ha_connected) {
       badge.textContent = d.device_count + ' device(s)';
       badge.className = 'status-badge status-ok';
     } else {
@@ -202,6 +285,8 @@ async function refreshDevices() {
       badge.className = 'status-badge status-warn';
     }
     renderDevices();
+    const sel = selectedEntity && allDevices.find(x => x.entity_id === selectedEntity);
+    if (sel) updateNowPlaying(sel);
   } catch(e) {
     console.error('refreshDevices:', e);
     document.getElementById('haBadge').textContent = 'Error';
@@ -209,34 +294,95 @@ async function refreshDevices() {
   }
 }
 
+/* Keyed rendering: one card per entity_id, created once and then
+   patched field by field, so refreshes don't rebuild the grid or reset
+   hover/selection.  All text goes through textContent. */
+const cards = new Map();   // entity_id -> {el, name, badge, vol, np, shown}
+
+function stateClass(state) {
+  return state === 'playing' ? 'status-playing'
+       : state === 'paused'  ? 'status-paused'
+       : 'status-idle';
+}
+
+function buildCard(entityId) {
+  const el = document.createElement('div');
+  el.className = 'device-card';
+  el.dataset.entity = entityId;
+  const name = document.createElement('div');
+  name.className = 'name';
+  const meta = document.createElement('div');
+  meta.className = 'meta';
+  const badge = document.createElement('span');
+  const vol = document.createElement('span');
+  vol.className = 'vol';
+  meta.append(badge, vol);
+  const np = document.createElement('div');
+  np.className = 'now-playing';
+  el.append(name, meta, np);
+  return {el, name, badge, vol, np, shown: {}};
+}
+
+function patchCard(c, d) {
+  const s = c.shown;
+  if (s.name !== d.friendly_name) c.name.textContent = s.name = d.friendly_name;
+  if (s.state !== d.state) {
+    c.badge.textContent = s.state = d.state;
+    c.badge.className = 'status-badge ' + stateClass(d.state);
+  }
+  const vol = (d.volume === null || d.volume === undefined) ? '' : 'Vol ' + Math.round(d.volume * 100) + '%';
+  if (s.vol !== vol) c.vol.textContent = s.vol = vol;
+  const np = trackText(d);
+  if (s.np !== np) {
+    c.np.textContent = s.np = np;
+    c.np.hidden = !np;
+  }
+}
+
 function renderDevices() {
-  const echoOnly = document.getElementById('echoOnly').checked;
-  const list = echoOnly ? allDevices.filter(d => d.is_echo) : allDevices;
   const grid = document.getElementById('deviceGrid');
+  const seen = new Set();
+  let prev = null;
+  for (const d of allDevices) {
+    seen.add(d.entity_id);
+    let c = cards.get(d.entity_id);
+    if (!c) {
+      c = buildCard(d.entity_id);
+      cards.set(d.entity_id, c);
+    }
+    patchCard(c, d);
+    // keep DOM order in step with the API order, moving only what moved
+    const want = prev ? prev.nextSibling : grid.firstChild;
+    if (c.el !== want) grid.insertBefore(c.el, want);
+    prev = c.el;
+  }
+  for (const [id, c] of cards) {
+    if (!seen.has(id)) { c.el.remove(); cards.delete(id); }
+  }
+  applyFilter();
+  renderSelection();
+}
 
-  if (list.length === 0) {
-    grid.innerHTML = '<p style="color:var(--muted)">' +
-      (allDevices.length === 0
-        ? 'No media_player entities found. Make sure Alexa Media Player (HACS) is installed.'
-        : 'No Echo devices found. Uncheck "Echo only" to see all media players.') +
-      '</p>';
-    return;
+function applyFilter() {
+  const echoOnly = document.getElementById('echoOnly').checked;
+  let visible = 0;
+  for (const d of allDevices) {
+    const show = !echoOnly || d.is_echo;
+    const c = cards.get(d.entity_id);
+    if (c && c.el.hidden === show) c.el.hidden = !show;
+    if (show) visible++;
   }
+  const msg = document.getElementById('gridMsg');
+  msg.hidden = visible > 0;
+  if (!visible) {
+    msg.textContent = allDevices.length === 0
+      ? 'No media_player entities found. Make sure Alexa Media Player (HACS) is installed.'
+      : 'No Echo devices found. Uncheck "Echo only" to see all media players.';
+  }
+}
 
-  grid.innerHTML = list.map(d => {
-    const sel = d.entity_id === selectedEntity ? ' selected' : '';
-    const np = d.media_title
-      ? '<div class="now-playing">&#9835; ' + (d.media_artist ? d.media_artist+' — ' : '') + d.media_title + '</div>'
-      : '';
-    const stateClass = d.state === 'playing' ? 'status-playing'
-                     : d.state === 'paused'  ? 'status-paused'
-                     : 'status-idle';
-    return '<div class="device-card'+sel+'" onclick="selectDevice(\''+d.entity_id+'\')">' +
-      '<div class="name">' + d.friendly_name + '</div>' +
-      '<div class="meta"><span class="status-badge '+stateClass+'">' + d.state + '</span></div>' +
-      np +
-    '</div>';
-  }).join('');
+function renderSelection() {
+  for (const [id, c] of cards) c.el.classList.toggle('selected', id === selectedEntity);
 }
 
 function selectDevice(entityId) {
@@ -246,19 +392,31 @@ function selectDevice(entityId) {
   document.getElementById('selectedName').textContent = dev.friendly_name;
   document.getElementById('controlCard').style.display = '';
   document.getElementById('playCard').style.display = '';
+  document.getElementById('browseCard').style.display = '';
+  if (browseEntity !== entityId) resetBrowse();
+  applyCapabilities(dev);
   updateNowPlaying(dev);
   if (dev.volume !== null && dev.volume !== undefined) {
     const pct = Math.round(dev.volume * 100);
     document.getElementById('volumeSlider').value = pct;
     document.getElementById('volLabel').textContent = pct + '%';
   }
-  renderDevices();
+  renderSelection();
+}
+
+// Hide controls the device can't use; an empty list means "unknown",
+// in which case everything stays visible.
+function applyCapabilities(dev) {
+  const caps = dev.capabilities || [];
+  document.querySelectorAll('[data-cap]').forEach(el => {
+    el.style.display = (caps.length === 0 || caps.includes(el.dataset.cap)) ? '' : 'none';
+  });
 }
 
 function updateNowPlaying(dev) {
   const el = document.getElementById('nowPlaying');
   if (dev.media_title) {
-    el.innerHTML = '&#9835; ' + (dev.media_artist ? dev.media_artist + ' — ' : '') + dev.media_title;
+    el.textContent = trackText(dev);
     el.style.color = 'var(--green)';
   } else {
     el.textContent = dev.state === 'playing' ? 'Playing (unknown track)' : 'Nothing playing';
@@ -318,8 +476,112 @@ async function playMusic() {
   }
 }
 
+/* ── media library ────────────────────────────────────────── */
+// browsePath[0] is the library root; each entry is {title, type, id}.
+let browsePath = [];
+let browseEntity = null;
+let browseChildren = [];
+
+function resetBrowse() {
+  browseEntity = null;
+  browsePath = [];
+  browseChildren = [];
+  document.getElementById('browseCrumbs').replaceChildren();
+  const li = document.createElement('li');
+  li.className = 'kind';
+  li.textContent = 'Press "Library Home" to browse this device’s media.';
+  document.getElementById('browseList').replaceChildren(li);
+}
+
+async function browseTo(depth) {
+  if (!selectedEntity) { showMsg('Select a device first', false); return; }
+  if (browseEntity !== selectedEntity || depth === 0) {
+    browseEntity = selectedEntity;
+    browsePath = [{title: 'Library', type: '', id: ''}];
+  } else {
+    browsePath = browsePath.slice(0, depth + 1);
+  }
+  const node = browsePath[browsePath.length - 1];
+  const q = new URLSearchParams({entity_id: browseEntity});
+  if (node.id) { q.set('media_content_type', node.type); q.set('media_content_id', node.id); }
+  try {
+    const r = await fetch(apiUrl('api/browse?' + q), {credentials:'same-origin'});
+    const d = await r.json();
+    if (!r.ok) throw new Error(d.error || 'HTTP ' + r.status);
+    renderBrowse(d);
+  } catch(e) {
+    showMsg('Browse failed: ' + e.message, false);
+  }
+}
+
+function renderBrowse(node) {
+  const crumbs = document.getElementById('browseCrumbs');
+  crumbs.replaceChildren();
+  browsePath.forEach((p, i) => {
+    if (i) crumbs.append(' › ');
+    const a = document.createElement('a');
+    a.textContent = p.title || '?';
+    a.dataset.depth = i;
+    crumbs.append(a);
+  });
+  browseChildren = node.children || [];
+  const list = document.getElementById('browseList');
+  list.replaceChildren(...browseChildren.map((c, i) => {
+    const li = document.createElement('li');
+    li.dataset.idx = i;
+    const title = document.createElement('span');
+    title.textContent = c.title || c.media_content_id;
+    const kind = document.createElement('span');
+    kind.className = 'kind';
+    kind.textContent = (c.can_expand ? '▸ ' : '') + (c.can_play ? '▶ ' : '') + (c.media_class || '');
+    li.append(title, kind);
+    return li;
+  }));
+  if (!browseChildren.length) {
+    const li = document.createElement('li');
+    li.className = 'kind';
+    li.textContent = 'Nothing here.';
+    list.append(li);
+  }
+}
+
+async function openBrowseItem(c) {
+  if (c.can_expand) {
+    browsePath.push({title: c.title, type: c.media_content_type, id: c.media_content_id});
+    return browseTo(browsePath.length - 1);
+  }
+  if (!c.can_play) return;
+  try {
+    const r = await fetch(apiUrl('api/play'), {
+      method: 'POST',
+      headers: {'Content-Type':'application/json'},
+      body: JSON.stringify({entity_id: browseEntity, query: c.media_content_id,
+                            service: c.media_content_type}),
+      credentials: 'same-origin'
+    });
+    const d = await r.json();
+    if (!r.ok) throw new Error(d.error || 'HTTP ' + r.status);
+    showMsg('Playing ' + (c.title || c.media_content_id), true);
+    setTimeout(refreshDevices, 2000);
+  } catch(e) {
+    showMsg('Play failed: ' + e.message, false);
+  }
+}
+
 /* ── init ─────────────────────────────────────────────────── */
 document.addEventListener('DOMContentLoaded', () => {
+  document.getElementById('deviceGrid').addEventListener('click', e => {
+    const card = e.target.closest('.device-card');
+    if (card) selectDevice(card.dataset.entity);
+  });
+  document.getElementById('browseList').addEventListener('click', e => {
+    const li = e.target.closest('li[data-idx]');
+    if (li) openBrowseItem(browseChildren[+li.dataset.idx]);
+  });
+  document.getElementById('browseCrumbs').addEventListener('click', e => {
+    if (e.target.dataset.depth !== undefined) browseTo(+e.target.dataset.depth);
+  });
+  resetBrowse();
   refreshDevices();
   setInterval(refreshDevices, 15000);
 });
@@ -334,38 +596,139 @@ document.addEventListener('DOMContentLoaded', () => {
 class WebUIServer:
     """aiohttp web server with HA Ingress support."""
 
-    def __init__(self, ha_client, device_manager):
+    def __init__(self, ha_client, device_manager, actuation=None, snapshots=None,
+                 announcer=None, airplay=None, stream=None, browser=None,
+                 webhooks=None, scheduler=None, fades=None, workers=None,
+                 unix_socket=None):
         self.ha = ha_client
         self.dm = device_manager
-        self.app = web.Application()
+        self.actuation = actuation
+        self.snapshots = snapshots
+        self.announcer = announcer
+        self.airplay = airplay
+        self.stream = stream
+        self.browser = browser
+        self.webhooks = webhooks
+        self.scheduler = scheduler
+        self.fades = fades
+        self.workers = workers
+        # Worker mode: listen only on this local socket, behind the workers.
+        self.unix_socket = unix_socket
+        self.loop_lag = LoopLagMonitor()
+        self.admission = AdmissionController(self.loop_lag)
+        middlewares = [self._admit, self._correlate]
+        if unix_socket:
+            middlewares.insert(0, self._forwarded)
+        self.app = web.Application(middlewares=middlewares)
         self.runner = None
         self._setup_routes()
 
     def _setup_routes(self):
-        # Normal routes
-        self.app.router.add_get('/', self._index)
-        self.app.router.add_get('/health', self._health)
-        self.app.router.add_get('/api/devices', self._get_devices)
-        self.app.router.add_post('/api/command', self._command)
-        self.app.router.add_post('/api/play', self._play)
-        # HA ingress sometimes sends 4 leading slashes
-        self.app.router.add_get('////', self._index)
-        self.app.router.add_get('////health', self._health)
-        self.app.router.add_get('////api/devices', self._get_devices)
-        self.app.router.add_post('////api/command', self._command)
-        self.app.router.add_post('////api/play', self._play)
+        self._route_map = {}
+        self._add_route('GET', '/', self._index)
+        self._add_route('GET', '/health', self._health)
+        self._add_route('GET', '/api/devices', self._get_devices)
+        self._add_route('POST', '/api/command', self._command)
+        self._add_route('POST', '/api/play', self._play)
+        self._add_route('GET', '/api/latency', self._latency)
+        self._add_route('POST', '/api/snapshot', self._snapshot)
+        self._add_route('POST', '/api/restore', self._restore)
+        self._add_route('POST', '/api/announce', self._announce)
+        self._add_route('GET', '/api/airplay', self._airplay_status)
+        self._add_route('GET', '/api/browse', self._browse)
+        self._add_route('GET', '/api/resolve', self._resolve)
+        self._add_route('GET', '/api/admission', self._admission_status)
+        if self.webhooks:
+            self._add_route('GET', '/api/webhooks', self._webhooks_status)
+        if self.workers:
+            self._add_route('GET', '/api/workers', self._workers_status)
+        if self.scheduler:
+            self._add_route('GET', '/api/schedules', self._schedules)
+            self._add_route('POST', '/api/schedules', self._schedule_create)
+            self._add_route('PUT', '/api/schedules', self._schedule_update)
+            self._add_route('DELETE', '/api/schedules', self._schedule_delete)
+        if self.fades:
+            self._add_route('GET', '/api/fade', self._fades_status)
+            self._add_route('POST', '/api/fade', self._fade)
+            self._add_route('DELETE', '/api/fade', self._fade_cancel)
+        if self.stream:
+            self._add_route('GET', '/stream/live', self.stream.serve)
+            self._add_route('GET', '/api/stream', self._stream_status)
+            self._add_route('POST', '/api/stream/play', self._stream_play)
+        if DEBUG_ENDPOINTS:
+            self.debug = DebugTools()
+            self.debug.register(self._add_route)
         # catch-all for other mangled paths
         self.app.router.add_route('*', '/{tail:.*}', self._catch_all)
 
+    @web.middleware
+    async def _forwarded(self, request, handler):
+        """Behind the web workers, the client address is the one they
+        forward; only they can reach the unix socket."""
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            request = request.clone(remote=forwarded)
+        return await handler(request)
+
+    @web.middleware
+    async def _admit(self, request, handler):
+        """Turn requests away with 503 while their route class is full
+        or the event loop is too far behind for it."""
+        cls = self.admission.classify(request.method, request.path)
+        retry = self.admission.try_admit(cls)
+        if retry is not None:
+            return web.json_response(
+                {"error": "Server busy", "retry_after": retry},
+                status=503, headers={"Retry-After": str(retry)},
+            )
+        try:
+            return await handler(request)
+        finally:
+            self.admission.release(cls)
+
+    @web.middleware
+    async def _correlate(self, request, handler):
+        """Tag everything logged while handling a request with one id
+        (the caller's X-Correlation-ID if given) and echo it back."""
+        cid = request.headers.get("X-Correlation-ID", "")[:64] or new_correlation_id()
+        token = correlation_id.set(cid)
+        try:
+            resp = await handler(request)
+        finally:
+            correlation_id.reset(token)
+        if not resp.prepared:
+            resp.headers["X-Correlation-ID"] = cid
+        return resp
+
+    def _add_route(self, method: str, path: str, handler):
+        """Register a route, its 4-slash twin (HA ingress sometimes sends
+        4 leading slashes) and its catch-all normalisation entry."""
+        for p in (path, '///' + path):
+            if method == 'GET':
+                self.app.router.add_get(p, handler)
+            else:
+                self.app.router.add_route(method, p, handler)
+        self._route_map[(path, method)] = handler
+
     # ── lifecycle ─────────────────────────────────────────────
     async def start(self):
+        self.loop_lag.start()
         self.runner = web.AppRunner(self.app)
         await self.runner.setup()
+        if self.unix_socket:
+            if os.path.exists(self.unix_socket):
+                os.unlink(self.unix_socket)
+            site = web.UnixSite(self.runner, self.unix_socket)
+            await site.start()
+            os.chmod(self.unix_socket, 0o600)
+            logger.info("Web UI listening on %s (behind web workers)", self.unix_socket)
+            return
         site = web.TCPSite(self.runner, "0.0.0.0", 8099)
         await site.start()
         logger.info("Web UI listening on 0.0.0.0:8099")
 
     async def stop(self):
+        self.loop_lag.stop()
         if self.runner:
             await self.runner.cleanup()
 
@@ -374,78 +737,535 @@ class WebUIServer:
         return web.Response(text=HTML_PAGE, content_type='text/html')
 
     async def _health(self, request):
-        return web.json_response({"status": "ok"})
+        return web.json_response({"status": "ok", "ha": self.ha.breaker.state,
+                                  "loop_lag_ms": round(self.loop_lag.current() * 1000, 1)})
+
+    def _ha_unavailable(self, breaker=None):
+        """503 with Retry-After while the HA circuit breaker is open."""
+        breaker = breaker or self.ha.breaker
+        retry = breaker.retry_after()
+        return web.json_response(
+            {"error": "Home Assistant unavailable", "retry_after": retry},
+            status=503, headers={"Retry-After": str(retry)},
+        )
+
+    def _unsupported(self, entity_id: str, command: str):
+        """Reject locally what the entity's supported_features rule out."""
+        return web.json_response({
+            "error": f"{entity_id} does not support '{command}'",
+            "capabilities": list(self.dm.capabilities_of(entity_id)),
+        }, status=422)
+
+    def _ha_failed(self, entity_id: str = None):
+        breaker = self.ha.breaker_for(entity_id) if entity_id else self.ha.breaker
+        if breaker.rejecting():
+            return self._ha_unavailable(breaker)
+        return web.json_response({"error": "HA service call failed"}, status=502)
 
     async def _get_devices(self, request):
-        """Return all discovered media_player entities."""
+        """Return all discovered media_player entities.
+
+        Always served from the DeviceManager cache; while the breaker is
+        open the result is flagged stale instead of failing.  Optional:
+        ``area``/``floor`` filters, ``fields`` (comma-separated),
+        ``limit`` + ``cursor`` paging in entity id order, and NDJSON
+        streaming with ``Accept: application/x-ndjson``.
+        """
         try:
-            devices = self.dm.get_all()
-            return web.json_response({
-                "devices": devices,
-                "device_count": len(devices),
-                "ha_connected": len(devices) > 0 or self.ha.token != "",
-            })
+            q = request.query
+            area, floor = q.get("area"), q.get("floor")
+            ids = None
+            if area or floor:
+                ids = self.dm.entities_in(area=area) if area else self.dm.entities_in(floor=floor)
+                if ids is None:
+                    scope = "area" if area else "floor"
+                    return web.json_response(
+                        {"error": f"Unknown {scope}: {area or floor}"}, status=404)
+            try:
+                fields = _parse_fields(q.get("fields"))
+                limit = _parse_limit(q.get("limit"))
+                after = _decode_cursor(q["cursor"]) if q.get("cursor") else None
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            if "application/x-ndjson" in request.headers.get("Accept", ""):
+                return await self._stream_devices(request, ids, fields, after, limit)
+            next_cursor = None
+            if limit is not None or after is not None:
+                total = len(ids) if ids is not None else len(self.dm.devices)
+                ids, next_id = self.dm.page(ids, after, limit)
+                next_cursor = _encode_cursor(next_id) if next_id else None
+            payload, retry = self._devices_payload(ids, fields)
+            if limit is not None or after is not None:
+                payload.update(total=total, next_cursor=next_cursor)
+            headers = {"Retry-After": str(retry)} if retry is not None else {}
+            return web.json_response(payload, headers=headers)
         except Exception as e:
             logger.error("Error getting devices: %s", e)
             return web.json_response({"devices": [], "error": str(e)}, status=500)
 
+    async def _stream_devices(self, request, ids, fields, after, limit):
+        """One JSON object per line, written in chunks as they are
+        serialised; writes wait for the client, so memory stays bounded
+        by the chunk size however many devices there are."""
+        page, next_id = self.dm.page(ids, after, limit)
+        resp = web.StreamResponse()
+        resp.content_type = "application/x-ndjson"
+        if next_id:
+            resp.headers["X-Next-Cursor"] = _encode_cursor(next_id)
+        await resp.prepare(request)
+        chunk: List[str] = []
+        size = 0
+        for device in self.dm.iter_devices(page, fields):
+            line = json.dumps(device, separators=(",", ":"))
+            chunk.append(line)
+            size += len(line) + 1
+            if size >= NDJSON_CHUNK:
+                await resp.write(("\n".join(chunk) + "\n").encode())
+                chunk.clear()
+                size = 0
+        if chunk:
+            await resp.write(("\n".join(chunk) + "\n").encode())
+        await resp.write_eof()
+        return resp
+
+    def _devices_payload(self, ids=None, fields=None) -> Tuple[Dict, Optional[int]]:
+        """The /api/devices body and its Retry-After (None unless the
+        primary HA breaker is open)."""
+        devices = self.dm.get_all(ids, fields)
+        backends = self.dm.backends_to_dict()
+        stale = any(b["circuit"] != CLOSED for b in backends.values())
+        retry = None
+        if self.ha.breaker.state != CLOSED:
+            retry = self.ha.breaker.retry_after()
+        return {
+            "devices": devices,
+            "device_count": len(devices),
+            "ha_connected": self.ha.breaker.state == CLOSED
+                            and (len(devices) > 0 or self.ha.token != ""),
+            "stale": stale,
+            "last_refresh": self.dm.last_refresh,
+            "backends": backends,
+        }, retry
+
+    def devices_snapshot(self) -> Tuple[bytes, Optional[int]]:
+        """Pre-serialised /api/devices for the web workers."""
+        payload, retry = self._devices_payload()
+        return json.dumps(payload).encode(), retry
+
     async def _command(self, request):
-        """Handle play/pause/stop/next/previous/volume commands."""
+        """Handle play/pause/stop/next/previous/volume commands for one
+        device (entity_id or name) or a whole area/floor."""
         try:
             data = await request.json()
-            entity_id = data.get("entity_id", "")
             command = data.get("command", "")
             value = data.get("value")
+            if data.get("area") or data.get("floor"):
+                return await self._group_command(data, command, value)
+            entity_id, problem = self._target(data)
+            if problem is not None:
+                return problem
 
             if not entity_id or not command:
-                return web.json_response({"error": "entity_id and command required"}, status=400)
-
-            ok = False
-            if command == "play":
-                ok = await self.ha.media_play(entity_id)
-            elif command == "pause":
-                ok = await self.ha.media_pause(entity_id)
-            elif command == "stop":
-                ok = await self.ha.media_stop(entity_id)
-            elif command == "next":
-                ok = await self.ha.media_next(entity_id)
-            elif command == "previous":
-                ok = await self.ha.media_previous(entity_id)
-            elif command == "volume" and value is not None:
-                ok = await self.ha.volume_set(entity_id, float(value))
-            else:
+                return web.json_response({"error": "entity_id (or name) and command required"}, status=400)
+            if command == "volume" and value is None:
+                return web.json_response({"error": "volume requires a value"}, status=400)
+            if self.dm.supports(entity_id, command) is False:
+                return self._unsupported(entity_id, command)
+            breaker = self.ha.breaker_for(entity_id)
+            if breaker.rejecting():
+                return self._ha_unavailable(breaker)
+
+            cid = self._correlation_id()
+            issued_at = time.monotonic()
+            ok = await self._dispatch(entity_id, command, value)
+            if ok is None:
                 return web.json_response({"error": f"Unknown command: {command}"}, status=400)
 
             if ok:
-                return web.json_response({"message": f"{command} sent to {entity_id}"})
+                self._track(cid, entity_id, command, issued_at, value)
+                return web.json_response({
+                    "message": f"{command} sent to {entity_id}",
+                    "correlation_id": cid,
+                })
             else:
-                return web.json_response({"error": "HA service call failed"}, status=502)
+                return self._ha_failed(entity_id)
         except Exception as e:
             logger.error("Command error: %s", e)
             return web.json_response({"error": str(e)}, status=500)
 
+    async def _dispatch(self, entity_id: str, command: str, value=None) -> Optional[bool]:
+        """Send one command; None if the command is unknown."""
+        if command == "play":
+            return await self.ha.media_play(entity_id)
+        if command == "pause":
+            return await self.ha.media_pause(entity_id)
+        if command == "stop":
+            return await self.ha.media_stop(entity_id)
+        if command == "next":
+            return await self.ha.media_next(entity_id)
+        if command == "previous":
+            return await self.ha.media_previous(entity_id)
+        if command == "volume" and value is not None:
+            # An explicit level wins over a fade in progress.
+            if self.fades:
+                self.fades.cancel(entity_ids=[entity_id])
+            return await self.ha.volume_set(entity_id, float(value))
+        return None
+
+    async def _group_command(self, data: dict, command: str, value):
+        """Send a command to every device in an area or on a floor."""
+        scope = "area" if data.get("area") else "floor"
+        ref = str(data[scope])
+        targets = self.dm.entities_in(**{scope: ref})
+        if targets is None:
+            return web.json_response({"error": f"Unknown {scope}: {ref}"}, status=404)
+        if command not in GROUP_COMMANDS:
+            return web.json_response({"error": f"Unknown command: {command}"}, status=400)
+        if command == "volume" and value is None:
+            return web.json_response({"error": "volume requires a value"}, status=400)
+
+        unsupported = {eid for eid in targets if self.dm.supports(eid, command) is False}
+        cid = self._correlation_id()
+
+        async def send(eid: str) -> bool:
+            if self.ha.breaker_for(eid).rejecting():
+                raise RuntimeError("Home Assistant unavailable")
+            issued_at = time.monotonic()
+            ok = await self._dispatch(eid, command, value)
+            if ok:
+                self._track(cid, eid, command, issued_at, value)
+            return bool(ok)
+
+        results = await fan_out(sorted(targets - unsupported), send)
+        for eid in unsupported:
+            results[eid] = {"ok": False, "error": f"does not support '{command}'"}
+        return web.json_response({
+            scope: ref,
+            "command": command,
+            "targets": results,
+            "correlation_id": cid,
+        })
+
     async def _play(self, request):
         """Send a play_media command."""
         try:
             data = await request.json()
-            entity_id = data.get("entity_id", "")
             query = data.get("query", "")
             service = data.get("service", "custom")
+            entity_id, problem = self._target(data)
+            if problem is not None:
+                return problem
 
             if not entity_id or not query:
-                return web.json_response({"error": "entity_id and query required"}, status=400)
+                return web.json_response({"error": "entity_id (or name) and query required"}, status=400)
+            if self.dm.supports(entity_id, "play_media") is False:
+                return self._unsupported(entity_id, "play_media")
+            breaker = self.ha.breaker_for(entity_id)
+            if breaker.rejecting():
+                return self._ha_unavailable(breaker)
 
+            cid = self._correlation_id()
+            issued_at = time.monotonic()
             ok = await self.ha.play_media(entity_id, query, service)
             if ok:
+                self._track(cid, entity_id, "play_media", issued_at)
                 return web.json_response({
-                    "message": f"Sent '{query}' to {entity_id} via {service}"
+                    "message": f"Sent '{query}' to {entity_id} via {service}",
+                    "correlation_id": cid,
                 })
             else:
-                return web.json_response({"error": "HA service call failed"}, status=502)
+                return self._ha_failed(entity_id)
         except Exception as e:
             logger.error("Play error: %s", e)
             return web.json_response({"error": str(e)}, status=500)
 
+    # ── snapshot / restore ────────────────────────────────────
+    async def _snapshot(self, request):
+        """Capture (and by default pause) every playing device."""
+        if not self.snapshots:
+            return web.json_response({"error": "Snapshots disabled"}, status=404)
+        try:
+            data = await request.json() if request.can_read_body else {}
+        except Exception:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "expected a JSON object"}, status=400)
+        name = data.get("name", "default")
+        entity_ids = data.get("entity_ids")
+        if not isinstance(name, str):
+            return web.json_response({"error": "name must be a string"}, status=400)
+        if entity_ids is not None and not (isinstance(entity_ids, list)
+                                           and all(isinstance(e, str) for e in entity_ids)):
+            return web.json_response({"error": "entity_ids must be a list of strings"},
+                                     status=400)
+        if self.ha.breaker.rejecting():
+            return self._ha_unavailable()
+        result = await self.snapshots.capture(
+            name=name,
+            entity_ids=entity_ids,
+            pause=bool(data.get("pause", True)),
+            include_idle=bool(data.get("include_idle", False)),
+            overwrite=bool(data.get("overwrite", False)),
+        )
+        return web.json_response(result)
+
+    async def _restore(self, request):
+        """Restore volume/source/playback of a previous snapshot."""
+        if not self.snapshots:
+            return web.json_response({"error": "Snapshots disabled"}, status=404)
+        try:
+            data = await request.json() if request.can_read_body else {}
+        except Exception:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "expected a JSON object"}, status=400)
+        name = data.get("name", "default")
+        if not isinstance(name, str):
+            return web.json_response({"error": "name must be a string"}, status=400)
+        if self.ha.breaker.rejecting():
+            return self._ha_unavailable()
+        result = await self.snapshots.restore(name, keep=bool(data.get("keep", False)))
+        if result is None:
+            return web.json_response({"error": f"No snapshot named '{name}'"}, status=404)
+        return web.json_response(result)
+
+    # ── announcements ─────────────────────────────────────────
+    async def _announce(self, request):
+        """Send one message to many devices in as few HA calls as possible."""
+        if not self.announcer:
+            return web.json_response({"error": "Announcements disabled"}, status=404)
+        try:
+            data = await request.json()
+        except Exception:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "expected a JSON object"}, status=400)
+        message = data.get("message") or ""
+        entity_ids = data.get("entity_ids") or []
+        group = data.get("group")
+        kind = data.get("type", "announce")
+        if not isinstance(message, str) or not message.strip():
+            return web.json_response({"error": "message required"}, status=400)
+        message = message.strip()
+        if not isinstance(entity_ids, list) or not all(isinstance(e, str) for e in entity_ids):
+            return web.json_response({"error": "entity_ids must be a list of strings"},
+                                     status=400)
+        if group is not None and not isinstance(group, str):
+            return web.json_response({"error": "group must be a string"}, status=400)
+        if not isinstance(kind, str) or kind not in ANNOUNCE_TYPES:
+            return web.json_response({"error": f"Unknown type: {kind}"}, status=400)
+        if group:
+            entity_ids = entity_ids + self.announcer.resolve_group(group)
+        if not entity_ids:
+            return web.json_response({"error": "entity_ids or group required"}, status=400)
+        if self.ha.breaker.rejecting():
+            return self._ha_unavailable()
+        return web.json_response(await self.announcer.announce(message, entity_ids, kind))
+
+    # ── name resolution ───────────────────────────────────────
+    def _target(self, data: dict):
+        """(entity_id, None) from ``entity_id`` or a fuzzy ``name``, or
+        (None, error response) when the name doesn't pick one device."""
+        entity_id = data.get("entity_id", "")
+        name = data.get("name", "")
+        if entity_id or not name:
+            return entity_id, None
+        entity_id, matches = self.dm.names.resolve(str(name))
+        if entity_id:
+            return entity_id, None
+        if not matches:
+            return None, web.json_response({"error": f"No device matches '{name}'"}, status=404)
+        return None, web.json_response(
+            {"error": f"'{name}' is ambiguous", "matches": matches}, status=409)
+
+    async def _resolve(self, request):
+        """Ranked devices for a spoken-style name: /api/resolve?q=kitchen"""
+        q = request.query.get("q", "").strip()
+        if not q:
+            return web.json_response({"error": "q required"}, status=400)
+        try:
+            limit = max(1, min(int(request.query.get("limit", "5")), 50))
+        except ValueError:
+            return web.json_response({"error": "limit must be an integer"}, status=400)
+        t0 = time.perf_counter()
+        matches = self.dm.names.search(q, limit=limit)
+        return web.json_response({
+            "query": q,
+            "matches": matches,
+            "took_us": round((time.perf_counter() - t0) * 1e6, 1),
+        })
+
+    # ── media library ─────────────────────────────────────────
+    async def _browse(self, request):
+        """One level of an entity's media library (cached).
+
+        Query: entity_id, optional media_content_type + media_content_id
+        (omit both for the root), refresh=1 to bypass the cache.
+        """
+        if not self.browser:
+            return web.json_response({"error": "Browsing disabled"}, status=404)
+        entity_id = request.query.get("entity_id", "")
+        if not entity_id:
+            return web.json_response({"error": "entity_id required"}, status=400)
+        if self.dm.supports(entity_id, "browse") is False:
+            return self._unsupported(entity_id, "browse")
+        if request.query.get("refresh") in ("1", "true"):
+            self.browser.invalidate(entity_id)
+        breaker = self.ha.breaker_for(entity_id)
+        content_type = request.query.get("media_content_type")
+        content_id = request.query.get("media_content_id")
+        if breaker.rejecting() and not self.browser.is_cached(entity_id, content_type, content_id):
+            return self._ha_unavailable(breaker)
+        node = await self.browser.browse(entity_id, content_type, content_id)
+        if node is None:
+            return self._ha_failed(entity_id)
+        return web.json_response(node)
+
+    # ── AirPlay receiver ──────────────────────────────────────
+    async def _airplay_status(self, request):
+        if not self.airplay:
+            return web.json_response({"error": "AirPlay receiver disabled"}, status=404)
+        return web.json_response(self.airplay.to_dict())
+
+    # ── schedules ─────────────────────────────────────────────
+    async def _schedules(self, request):
+        return web.json_response({"schedules": self.scheduler.get_all(),
+                                  **self.scheduler.to_dict()})
+
+    async def _schedule_create(self, request):
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            schedule = self.scheduler.create(data)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response(schedule, status=201)
+
+    async def _schedule_update(self, request):
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            schedule = self.scheduler.update(str(data.get("id", "")), data)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if schedule is None:
+            return web.json_response({"error": f"Unknown schedule: {data.get('id')}"}, status=404)
+        return web.json_response(schedule)
+
+    async def _schedule_delete(self, request):
+        sid = request.query.get("id", "")
+        if not self.scheduler.delete(sid):
+            return web.json_response({"error": f"Unknown schedule: {sid}"}, status=404)
+        return web.json_response({"message": f"Schedule {sid} deleted"})
+
+    # ── fades ─────────────────────────────────────────────────
+    async def _fade(self, request):
+        """Fade one device (entity_id or name), a list (entity_ids) or an
+        area/floor to ``level`` over ``duration`` seconds."""
+        try:
+            data = await request.json()
+        except Exception:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "expected a JSON object"}, status=400)
+        if data.get("area") or data.get("floor"):
+            scope = "area" if data.get("area") else "floor"
+            targets = self.dm.entities_in(**{scope: str(data[scope])})
+            if targets is None:
+                return web.json_response({"error": f"Unknown {scope}: {data[scope]}"}, status=404)
+        elif data.get("entity_ids") is not None:
+            entity_ids = data["entity_ids"]
+            if not isinstance(entity_ids, list) or not all(isinstance(e, str) for e in entity_ids):
+                return web.json_response({"error": "entity_ids must be a list of strings"},
+                                         status=400)
+            targets = set(entity_ids)
+        else:
+            if not isinstance(data.get("entity_id", ""), str):
+                return web.json_response({"error": "entity_id must be a string"}, status=400)
+            entity_id, problem = self._target(data)
+            if problem is not None:
+                return problem
+            targets = {entity_id} if entity_id else set()
+        if data.get("level") is None:
+            return web.json_response({"error": "level required"}, status=400)
+        unsupported = sorted(eid for eid in targets if self.dm.supports(eid, "volume") is False)
+        try:
+            fade = self.fades.fade(targets.difference(unsupported), data["level"],
+                                   data.get("duration", 0), data.get("from"))
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": str(e), "unsupported": unsupported}, status=400)
+        return web.json_response({**fade, "unsupported": unsupported})
+
+    async def _fade_cancel(self, request):
+        """Stop a fade (?id=) or one device's fade (?entity_id=) where it is."""
+        fid = request.query.get("id")
+        entity_id = request.query.get("entity_id")
+        if not fid and not entity_id:
+            return web.json_response({"error": "id or entity_id required"}, status=400)
+        stopped = self.fades.cancel(fid, [entity_id] if entity_id else ())
+        if not stopped:
+            return web.json_response({"error": "No such fade"}, status=404)
+        return web.json_response({"stopped": stopped})
+
+    async def _fades_status(self, request):
+        return web.json_response(self.fades.to_dict())
+
+    async def _workers_status(self, request):
+        return web.json_response(self.workers.to_dict())
+
+    async def _admission_status(self, request):
+        return web.json_response(self.admission.to_dict())
+
+    async def _webhooks_status(self, request):
+        return web.json_response(self.webhooks.to_dict())
+
+    async def _stream_status(self, request):
+        return web.json_response(self.stream.to_dict())
+
+    async def _stream_play(self, request):
+        """Point one or more devices at the live re-stream URL."""
+        try:
+            data = await request.json()
+        except Exception:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "expected a JSON object"}, status=400)
+        entity_ids = data.get("entity_ids") or []
+        if not isinstance(entity_ids, list) or not entity_ids:
+            return web.json_response({"error": "entity_ids required"}, status=400)
+        if not all(isinstance(e, str) for e in entity_ids):
+            return web.json_response({"error": "entity_ids must be a list of strings"},
+                                     status=400)
+        url = self.stream.to_dict()["url"]
+        if not url:
+            return web.json_response({"error": "STREAM_BASE_URL not configured"}, status=409)
+        if self.ha.breaker.rejecting():
+            return self._ha_unavailable()
+        results = await fan_out(
+            entity_ids, lambda eid: self.ha.play_media(eid, url, "music"),
+        )
+        return web.json_response({"url": url, "devices": results})
+
+    # ── actuation latency ─────────────────────────────────────
+    def _correlation_id(self) -> str:
+        return correlation_id.get() if self.actuation else ""
+
+    def _track(self, cid: str, entity_id: str, command: str, issued_at: float, value=None):
+        if self.actuation:
+            self.actuation.track(cid, entity_id, command, issued_at, value)
+
+    async def _latency(self, request):
+        """Command → observed state change latency percentiles."""
+        if not self.actuation:
+            return web.json_response({"error": "Latency tracking disabled"}, status=404)
+        return web.json_response(self.actuation.to_dict(
+            entity_id=request.query.get("entity_id"),
+            correlation_id=request.query.get("correlation_id"),
+        ))
+
     async def _catch_all(self, request):
         """Normalize mangled ingress paths."""
         raw = request.path
@@ -453,14 +1273,7 @@ class WebUIServer:
         normalized = re.sub(r'^/{2,}', '/', raw)
         logger.debug("Catch-all: %s -> %s (%s)", raw, normalized, request.method)
 
-        route_map = {
-            ('/', 'GET'): self._index,
-            ('/health', 'GET'): self._health,
-            ('/api/devices', 'GET'): self._get_devices,
-            ('/api/command', 'POST'): self._command,
-            ('/api/play', 'POST'): self._play,
-        }
-        handler = route_map.get((normalized, request.method))
+        handler = self._route_map.get((normalized, request.method))
         if handler:
             return await handler(request)
 
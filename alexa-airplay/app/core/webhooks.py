@@ -0,0 +1,317 @@
+"""
+Outbound Webhooks
+Pushes now-playing changes to external receivers (displays, scrobblers)
+so they don't have to poll /api/devices.
+
+Every configured endpoint has its own delivery queue.  The queue holds
+at most one pending event per entity – a newer change replaces the
+older one – and is drained in batches, one POST per batch.  Failed
+POSTs are retried with exponential backoff, and each endpoint has its
+own concurrency limit, so a dead receiver only ever backs up its own
+queue.
+
+Endpoints come from the WEBHOOKS environment variable plus the add-on's
+``webhooks`` option (hot-reloaded), both ``[{"url", "secret"?,
+"concurrency"?}, ...]``; the option wins for a url listed in both.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+# Quiet time before a batch is taken, so bursts coalesce into one POST.
+WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", "0.5"))
+WEBHOOK_BATCH_MAX = int(os.getenv("WEBHOOK_BATCH_MAX", "50"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "2"))
+WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", "5"))
+RETRY_BASE = 1.0
+RETRY_MAX = 60.0
+LATENCY_SAMPLES = 200
+
+# Attributes that make up "now playing"; changes to anything else
+# (media_position, entity_picture tokens, ...) are not sent.
+_TRACKED = ("media_title", "media_artist", "media_album_name", "source", "volume_level")
+
+
+def _now_playing(state: Optional[Dict]) -> Optional[Dict]:
+    if state is None:
+        return None
+    attrs = state.get("attributes", {})
+    return {"state": state.get("state"), **{k: attrs.get(k) for k in _TRACKED}}
+
+
+def _redact(url: str) -> str:
+    # Receivers often carry a token in the query string.
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+class _Endpoint:
+    """Queue, worker and counters for one receiver."""
+
+    def __init__(self, dispatcher: "WebhookDispatcher", url: str,
+                 secret: str = "", concurrency: int = WEBHOOK_CONCURRENCY):
+        self.dispatcher = dispatcher
+        self.url = url
+        self.secret = secret
+        self.concurrency = max(1, int(concurrency))
+        # entity_id -> (queued_at monotonic, event); keeps first-queued order
+        self.pending: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._worker: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self.delivered = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.dropped = 0
+        self.last_status: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self._latency: deque = deque(maxlen=LATENCY_SAMPLES)   # ms, queued -> acked
+
+    # ── queue ─────────────────────────────────────────────────
+    def enqueue(self, event: Dict):
+        eid = event["entity_id"]
+        queued_at = time.monotonic()
+        prev = self.pending.get(eid)
+        if prev is not None:
+            self.coalesced += 1
+            queued_at = prev[0]
+        # Assignment keeps the entity's place in line; latency counts
+        # from the first change that is still waiting.
+        self.pending[eid] = (queued_at, event)
+        self._ready.set()
+
+    def _take(self) -> List[Tuple[float, Dict]]:
+        batch = []
+        while self.pending and len(batch) < WEBHOOK_BATCH_MAX:
+            batch.append(self.pending.popitem(last=False)[1])
+        if not self.pending:
+            self._ready.clear()
+        return batch
+
+    # ── delivery ──────────────────────────────────────────────
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._deliveries):
+            task.cancel()
+        if self.pending:
+            logger.info("Webhook %s: dropping %d undelivered event(s)",
+                        _redact(self.url), len(self.pending))
+            self.dropped += len(self.pending)
+            self.pending.clear()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            await asyncio.sleep(WEBHOOK_BATCH_WINDOW)
+            # A free slot is awaited before the batch is taken, so changes
+            # arriving while the receiver is slow keep coalescing.
+            await self._slots.acquire()
+            batch = self._take()
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.ensure_future(self._deliver(batch))
+            self._deliveries.add(task)
+            task.add_done_callback(self._delivered)
+
+    def _delivered(self, task: asyncio.Task):
+        self._deliveries.discard(task)
+        self._slots.release()
+
+    async def _deliver(self, batch: List[Tuple[float, Dict]]):
+        delay = RETRY_BASE
+        for attempt in range(WEBHOOK_RETRIES + 1):
+            if attempt:
+                # Events superseded while we were backing off go out with
+                # the newer batch instead, which inherits their age.
+                for queued, event in batch:
+                    newer = self.pending.get(event["entity_id"])
+                    if newer is not None and queued < newer[0]:
+                        self.pending[event["entity_id"]] = (queued, newer[1])
+                batch = [item for item in batch if item[1]["entity_id"] not in self.pending]
+                if not batch:
+                    return
+            retry_after = await self._post([event for _q, event in batch])
+            if retry_after is None:
+                now = time.monotonic()
+                self.delivered += len(batch)
+                self.batches += 1
+                self._latency.extend((now - queued) * 1000 for queued, _e in batch)
+                return
+            if retry_after < 0 or attempt == WEBHOOK_RETRIES:
+                break
+            self.retries += 1
+            await asyncio.sleep(max(delay, min(retry_after, RETRY_MAX)))
+            delay = min(delay * 2, RETRY_MAX)
+        self.dropped += len(batch)
+        logger.warning("Webhook %s: gave up on %d event(s): %s",
+                       _redact(self.url), len(batch), self.last_error)
+
+    async def _post(self, events: List[Dict]) -> Optional[float]:
+        """POST one batch; None on success, otherwise seconds to wait
+        before retrying (-1: don't retry)."""
+        body = json.dumps({"events": events, "sent_at": time.time()},
+                          separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Webhook-Signature"] = f"sha256={digest}"
+        try:
+            session = await self.dispatcher.session()
+            async with session.post(self.url, data=body, headers=headers) as resp:
+                self.last_status = resp.status
+                if resp.status < 300:
+                    self.last_error = None
+                    return None
+                self.last_error = f"HTTP {resp.status}"
+                if resp.status in (408, 429) or resp.status >= 500:
+                    try:
+                        return float(resp.headers.get("Retry-After", 0))
+                    except ValueError:
+                        return 0.0
+                return -1.0
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.last_status = None
+            self.last_error = str(e) or type(e).__name__
+            return 0.0
+
+    def to_dict(self) -> Dict:
+        lat = sorted(self._latency)
+        return {
+            "url": _redact(self.url),
+            "queued": len(self.pending),
+            "in_flight": len(self._deliveries),
+            "concurrency": self.concurrency,
+            "delivered": self.delivered,
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "latency_ms": {
+                "p50": round(lat[len(lat) // 2]) if lat else None,
+                "p95": round(lat[int(len(lat) * 0.95)]) if lat else None,
+                "max": round(lat[-1]) if lat else None,
+            },
+        }
+
+
+class WebhookDispatcher:
+    """Turns DeviceManager changes into webhook events for every endpoint."""
+
+    def __init__(self, device_manager):
+        self.dm = device_manager
+        self.endpoints: Dict[str, _Endpoint] = {}
+        self.running = False
+        self._seq = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._env_entries: List[Dict[str, Any]] = []
+        self._option_entries: List[Dict[str, Any]] = []
+        self.dm.add_listener(self._on_change)
+        raw = os.getenv("WEBHOOKS")
+        if raw:
+            try:
+                entries = json.loads(raw)
+                if not isinstance(entries, list):
+                    raise ValueError("expected a list")
+                self._env_entries = entries
+            except ValueError as e:
+                logger.error("Could not parse WEBHOOKS: %s", e)
+        if self._env_entries:
+            self._apply()
+
+    # ── configuration ─────────────────────────────────────────
+    def configure(self, entries: Optional[List[Dict[str, Any]]]):
+        """Set the option-provided endpoints; WEBHOOKS ones are kept."""
+        self._option_entries = list(entries or [])
+        self._apply()
+
+    def _apply(self):
+        """Rebuild the endpoint list; unchanged endpoints keep their queues."""
+        wanted: Dict[str, Dict] = {}
+        for entry in self._env_entries + self._option_entries:
+            url = str(entry.get("url", "")).strip() if isinstance(entry, dict) else ""
+            if not url.startswith(("http://", "https://")):
+                logger.error("Ignoring invalid webhook url %r", _redact(url))
+                continue
+            wanted[url] = {"secret": entry.get("secret") or "",
+                           "concurrency": entry.get("concurrency") or WEBHOOK_CONCURRENCY}
+        for url in list(self.endpoints):
+            ep = self.endpoints[url]
+            cfg = wanted.get(url)
+            if cfg is None or cfg != {"secret": ep.secret, "concurrency": ep.concurrency}:
+                ep.stop()
+                del self.endpoints[url]
+        for url, cfg in wanted.items():
+            if url not in self.endpoints:
+                ep = _Endpoint(self, url, **cfg)
+                self.endpoints[url] = ep
+                if self.running:
+                    ep.start()
+        logger.info("Webhooks: %d endpoint(s) configured", len(self.endpoints))
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        self.running = True
+        for ep in self.endpoints.values():
+            ep.start()
+
+    async def stop(self):
+        self.running = False
+        for ep in self.endpoints.values():
+            ep.stop()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT))
+        return self._session
+
+    # ── events ────────────────────────────────────────────────
+    def _on_change(self, entity_id: str, old: Optional[Dict], new: Optional[Dict]):
+        if not self.endpoints:
+            return
+        before, after = _now_playing(old), _now_playing(new)
+        if before == after:
+            return
+        self._seq += 1
+        attrs = (new or old).get("attributes", {})
+        event = {
+            "seq": self._seq,
+            "ts": time.time(),
+            "type": "added" if old is None else "removed" if new is None else "changed",
+            "entity_id": entity_id,
+            "friendly_name": attrs.get("friendly_name", entity_id),
+            **(after or {}),
+        }
+        for ep in self.endpoints.values():
+            ep.enqueue(event)
+
+    def to_dict(self) -> Dict:
+        return {"endpoints": [ep.to_dict() for ep in self.endpoints.values()],
+                "queued": sum(len(ep.pending) for ep in self.endpoints.values())}
@@ -0,0 +1,363 @@
+"""
+Web Workers
+Optional multi-process serving (WEB_WORKERS > 0) so reads use more
+than one core.
+
+The leader process keeps everything that talks to HA (DeviceManager,
+HAClient, scheduler, ...) and serves its web UI on a local unix socket.
+N worker processes share the public port through SO_REUSEPORT.  They
+answer /api/devices straight from a pre-serialised snapshot the leader
+publishes into a memory-mapped file whenever the devices change, and
+forward every other request to the leader.
+
+Snapshot file layout: a fixed header (magic, flags, sequence, written
+at, length, crc32, retry-after) followed by the JSON body.  The writer
+makes the sequence odd while it copies and even when done; readers keep
+the last good body and only copy again when the sequence moves, so a
+request costs one header read and no IPC.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import re
+import signal
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+WEB_PORT = int(os.getenv("WEB_PORT", "8099"))
+LEADER_SOCKET = os.getenv("LEADER_SOCKET", "/tmp/alexa-leader.sock")
+SNAPSHOT_FILE = os.getenv(
+    "SNAPSHOT_FILE",
+    "/dev/shm/alexa-devices.snap" if os.path.isdir("/dev/shm") else "/tmp/alexa-devices.snap")
+# Coalesce a burst of device changes into one snapshot.
+SNAPSHOT_DEBOUNCE = 0.05
+# Re-publish at least this often so ages/freshness in the body stay current.
+SNAPSHOT_REFRESH = 2.0
+SNAPSHOT_CAPACITY = 256 * 1024
+
+_MAGIC = b"AMCS"
+_HEADER = struct.Struct("<4sIQdIIi")      # magic, flags, seq, written_at, length, crc32, retry_after
+HEADER_SIZE = 64
+_REOPEN = 1                               # file was replaced by a bigger one
+
+_MAIN = Path(__file__).resolve().parent.parent / "main.py"
+_LEADING_SLASHES = re.compile(r"^/{2,}")
+_HOP_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+))
+# Set by the worker itself; a client's own copy (any case) must not
+# reach the leader, which takes it as the peer address.
+_CLIENT_DROP = _HOP_HEADERS | {"x-forwarded-for"}
+
+
+# ──────────────────────────────────────────────────────────────
+# Snapshot file
+# ──────────────────────────────────────────────────────────────
+class SnapshotWriter:
+    """Leader side: publishes bodies into the mapped file."""
+
+    def __init__(self, path: str = SNAPSHOT_FILE, capacity: int = SNAPSHOT_CAPACITY):
+        self.path = path
+        self.seq = 0
+        self._file, self._mm, self.capacity = self._create(path, capacity)
+
+    @staticmethod
+    def _create(path: str, capacity: int):
+        f = open(path, "w+b")
+        f.truncate(HEADER_SIZE + capacity)
+        mm = mmap.mmap(f.fileno(), HEADER_SIZE + capacity)
+        _HEADER.pack_into(mm, 0, _MAGIC, 0, 0, 0.0, 0, 0, -1)
+        return f, mm, capacity
+
+    def write(self, body: bytes, retry_after: Optional[int] = None):
+        if len(body) > self.capacity:
+            self._grow(len(body))
+        mm = self._mm
+        self.seq += 1                     # odd: update in progress
+        _HEADER.pack_into(mm, 0, _MAGIC, 0, self.seq, 0.0, 0, 0, -1)
+        mm[HEADER_SIZE:HEADER_SIZE + len(body)] = body
+        self.seq += 1
+        _HEADER.pack_into(mm, 0, _MAGIC, 0, self.seq, time.time(), len(body),
+                          zlib.crc32(body), -1 if retry_after is None else retry_after)
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        tmp = f"{self.path}.new"
+        f, mm, capacity = self._create(tmp, capacity)
+        _HEADER.pack_into(mm, 0, _MAGIC, 0, self.seq, 0.0, 0, 0, -1)
+        os.replace(tmp, self.path)
+        old_mm, old_file = self._mm, self._file
+        _HEADER.pack_into(old_mm, 0, _MAGIC, _REOPEN, self.seq, 0.0, 0, 0, -1)
+        old_mm.close()
+        old_file.close()
+        self._file, self._mm, self.capacity = f, mm, capacity
+        logger.info("Device snapshot grown to %d KiB", capacity // 1024)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class SnapshotReader:
+    """Worker side: the latest complete body, re-read only on change."""
+
+    def __init__(self, path: str = SNAPSHOT_FILE):
+        self.path = path
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self.seq = -1
+        self.body: Optional[bytes] = None
+        self.retry_after: Optional[int] = None
+        self.written_at = 0.0
+
+    def _open(self) -> bool:
+        self._close()
+        try:
+            f = open(self.path, "rb")
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE:
+                f.close()
+                return False
+            self._file, self._mm = f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        except OSError:
+            return False
+        return True
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
+
+    def read(self) -> Optional[bytes]:
+        """Current body, or None before the leader's first publish."""
+        for _attempt in range(3):
+            if self._mm is None and not self._open():
+                return self.body
+            magic, flags, seq, written, length, crc, retry = _HEADER.unpack_from(self._mm, 0)
+            if magic != _MAGIC:
+                return self.body
+            if flags & _REOPEN:
+                self._open()
+                continue
+            if seq == self.seq or seq % 2 or seq == 0:
+                return self.body
+            body = self._mm[HEADER_SIZE:HEADER_SIZE + length]
+            # The crc catches a copy that raced the next write (no memory
+            # ordering guarantees across processes on ARM).
+            if zlib.crc32(body) != crc or _HEADER.unpack_from(self._mm, 0)[2] != seq:
+                continue
+            self.seq, self.body, self.written_at = seq, body, written
+            self.retry_after = None if retry < 0 else retry
+            return body
+        return self.body
+
+
+class SnapshotPublisher:
+    """Leader side: rebuilds the snapshot after device changes (debounced)
+    and every SNAPSHOT_REFRESH seconds."""
+
+    def __init__(self, device_manager, build: Callable[[], Tuple[bytes, Optional[int]]],
+                 path: str = SNAPSHOT_FILE):
+        self.dm = device_manager
+        self.build = build
+        self.writer = SnapshotWriter(path)
+        self.published = 0
+        self.running = False
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self.dm.add_listener(self._on_change)
+
+    def _on_change(self, entity_id, old, new):
+        if self._pending is None and self.running:
+            self._pending = asyncio.get_event_loop().call_later(SNAPSHOT_DEBOUNCE, self.publish)
+
+    def publish(self):
+        self._pending = None
+        try:
+            body, retry = self.build()
+        except Exception as e:
+            logger.error("Building device snapshot failed: %s", e)
+            return
+        self.writer.write(body, retry)
+        self.published += 1
+
+    async def start(self):
+        self.running = True
+        while self.running:
+            self.publish()
+            await asyncio.sleep(SNAPSHOT_REFRESH)
+
+    async def stop(self):
+        self.running = False
+        self.dm.remove_listener(self._on_change)
+        if self._pending is not None:
+            self._pending.cancel()
+        self.writer.close()
+
+
+# ──────────────────────────────────────────────────────────────
+# Worker processes
+# ──────────────────────────────────────────────────────────────
+class WorkerPool:
+    """Leader side: starts the workers and restarts any that exit."""
+
+    def __init__(self, count: int = WEB_WORKERS):
+        self.count = count
+        self.procs: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts = 0
+        self.running = False
+
+    async def start(self):
+        self.running = True
+        logger.info("Starting %d web worker(s) on port %d", self.count, WEB_PORT)
+        await asyncio.gather(*(self._supervise(i) for i in range(self.count)))
+
+    async def _supervise(self, index: int):
+        delay = 1.0
+        while self.running:
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-u", str(_MAIN), "--worker", str(index))
+            self.procs[index] = proc
+            code = await proc.wait()
+            if not self.running:
+                break
+            logger.warning("Web worker %d exited with %s; restarting", index, code)
+            self.restarts += 1
+            if time.monotonic() - started > 60:
+                delay = 1.0
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def stop(self):
+        self.running = False
+        procs = [p for p in self.procs.values() if p.returncode is None]
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                proc.kill()
+
+    def to_dict(self) -> Dict:
+        return {
+            "workers": self.count,
+            "port": WEB_PORT,
+            "pids": {i: p.pid for i, p in self.procs.items() if p.returncode is None},
+            "restarts": self.restarts,
+        }
+
+
+class WorkerServer:
+    """One worker: snapshot reads locally, everything else proxied."""
+
+    def __init__(self, index: int, leader_socket: str = LEADER_SOCKET,
+                 snapshot: str = SNAPSHOT_FILE):
+        from .web_ui import HTML_PAGE          # the page itself is static
+        self.index = index
+        self.leader_socket = leader_socket
+        self.snapshot = SnapshotReader(snapshot)
+        self._page = HTML_PAGE
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_route("*", "/{tail:.*}", self._handle)
+
+    async def start(self):
+        # No overall timeout: /stream/live is long-lived.
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.UnixConnector(path=self.leader_socket),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5),
+            auto_decompress=False,
+        )
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "0.0.0.0", WEB_PORT, reuse_port=True).start()
+        logger.info("Web worker %d (pid %d) listening on port %d",
+                    self.index, os.getpid(), WEB_PORT)
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+        if self._session:
+            await self._session.close()
+
+    async def _handle(self, request: web.Request):
+        path = _LEADING_SLASHES.sub("/", request.path)
+        if request.method == "GET" and not request.query_string:
+            if path == "/api/devices" and "ndjson" not in request.headers.get("Accept", ""):
+                body = self.snapshot.read()
+                if body is not None:
+                    headers = {"X-Snapshot-Age": f"{time.time() - self.snapshot.written_at:.2f}"}
+                    if self.snapshot.retry_after is not None:
+                        headers["Retry-After"] = str(self.snapshot.retry_after)
+                    return web.Response(body=body, content_type="application/json",
+                                        charset="utf-8", headers=headers)
+            elif path == "/":
+                return web.Response(text=self._page, content_type="text/html")
+        return await self._proxy(request)
+
+    async def _proxy(self, request: web.Request):
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _CLIENT_DROP}
+        headers["X-Forwarded-For"] = request.remote or ""
+        body = await request.read() if request.can_read_body else None
+        try:
+            upstream = await self._session.request(
+                request.method, f"http://leader{request.path_qs}",
+                headers=headers, data=body, allow_redirects=False)
+        except (aiohttp.ClientError, OSError) as e:
+            logger.warning("Leader unreachable: %s", e)
+            return web.json_response({"error": "Service starting", "retry_after": 1},
+                                     status=503, headers={"Retry-After": "1"})
+        async with upstream:
+            out = {k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_HEADERS}
+            length = upstream.headers.get("Content-Length")
+            if length is not None:
+                data = await upstream.read()
+                return web.Response(status=upstream.status, body=data, headers=out)
+            resp = web.StreamResponse(status=upstream.status, headers=out)
+            await resp.prepare(request)
+            async for chunk in upstream.content.iter_any():
+                await resp.write(chunk)
+            await resp.write_eof()
+            return resp
+
+
+async def run_worker(index: int):
+    """Entry point of a worker process (``main.py --worker N``)."""
+    server = WorkerServer(index)
+    await server.start()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    parent = os.getppid()
+    try:
+        # Exit with the leader, whatever way it went.
+        while not stop.is_set() and os.getppid() == parent:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=2)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await server.stop()
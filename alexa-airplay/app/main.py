@@ -9,15 +9,13 @@ import sys
 import logging
 from pathlib import Path
 
-log_level = os.getenv("LOG_LEVEL", "INFO")
-logging.basicConfig(
-    level=getattr(logging, log_level, logging.INFO),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-logger = logging.getLogger("alexa-controller")
-
 sys.path.insert(0, str(Path(__file__).parent))
 
+from core.logging_setup import setup_logging, shutdown_logging
+
+setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("alexa-controller")
+
 from core.app import AlexaMusicController
 
 
@@ -40,6 +38,12 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+            from core.workers import run_worker
+            asyncio.run(run_worker(int(sys.argv[2])))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Shutdown complete")
+    finally:
+        shutdown_logging()
@@ -24,10 +24,16 @@ AMAZON_CLIENT_ID="$(bashio::config 'amazon_client_id' 2>/dev/null || echo '')"
 AMAZON_CLIENT_SECRET="$(bashio::config 'amazon_client_secret' 2>/dev/null || echo '')"
 AIRPLAY_PORT="$(bashio::config 'airplay_port' 2>/dev/null || echo '5001')"
 DEBUG_LOGGING="$(bashio::config 'debug_logging' 2>/dev/null || echo 'false')"
+DEBUG_ENDPOINTS="$(bashio::config 'debug_endpoints' 2>/dev/null || echo 'false')"
+LOG_FORMAT="$(bashio::config 'log_format' 2>/dev/null || echo 'text')"
+WEB_WORKERS="$(bashio::config 'web_workers' 2>/dev/null || echo '0')"
 
 export AMAZON_CLIENT_ID
 export AMAZON_CLIENT_SECRET
 export AIRPLAY_PORT
+export DEBUG_ENDPOINTS
+export LOG_FORMAT
+export WEB_WORKERS
 
 if [ "$DEBUG_LOGGING" = "true" ]; then
   export LOG_LEVEL="DEBUG"
@@ -40,6 +46,7 @@ export WEB_PORT=8099
 
 echo "Log level     : $LOG_LEVEL"
 echo "Web UI port   : $WEB_PORT"
+echo "Web workers   : $WEB_WORKERS"
 echo "AirPlay port  : $AIRPLAY_PORT"
 
 # ── launch ──
@@ -0,0 +1,125 @@
+"""RAOP receiver driven by a loopback RTSP/RTP sender."""
+
+import asyncio
+import re
+import socket
+import struct
+
+from core import raop
+from core.raop import MISSING, JitterBuffer, RAOPServer
+
+FPP = 352
+PACKET_SECONDS = FPP / raop.SAMPLE_RATE
+PCM_BYTES = FPP * 2 * 2
+SDP = (
+    "v=0\r\no=iTunes 1 0 IN IP4 127.0.0.1\r\ns=iTunes\r\nc=IN IP4 127.0.0.1\r\n"
+    "t=0 0\r\nm=audio 0 RTP/AVP 96\r\na=rtpmap:96 L16/44100/2\r\n"
+)
+
+
+def _payload(seq: int) -> bytes:
+    return struct.pack(">H", seq) * (PCM_BYTES // 2)
+
+
+def _rtp(seq: int, pt: int = raop.PT_AUDIO) -> bytes:
+    return struct.pack(">BBHII", 0x80, pt, seq, seq * FPP, 1) + _payload(seq)
+
+
+def test_jitter_buffer_tells_hole_from_empty():
+    buf = JitterBuffer(slots=16, slot_size=PCM_BYTES, latency_packets=4,
+                       silence_bytes=PCM_BYTES)
+    assert buf.get() is None
+    buf.put(0, memoryview(_payload(0)))
+    assert buf.put(2, memoryview(_payload(2))) == (1, 1)
+    assert bytes(buf.get()) == _payload(0)
+    assert buf.get() is MISSING
+    buf.put(1, memoryview(_payload(1)))         # the resend arrives
+    assert bytes(buf.get()) == _payload(1)
+    assert bytes(buf.get()) == _payload(2)
+    assert buf.get() is None
+    buf.put(4, memoryview(_payload(4)))
+    assert buf.get() is MISSING
+    assert bytes(buf.skip()) == bytes(PCM_BYTES)
+    assert bytes(buf.get()) == _payload(4)
+    assert buf.stats["lost"] == 1
+
+
+async def _rtsp(reader, writer, cseq: int, method: str, headers=None, body=b""):
+    lines = [f"{method} rtsp://127.0.0.1/1 RTSP/1.0", f"CSeq: {cseq}"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = {}
+    status = (await reader.readline()).decode()
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        k, _, v = line.partition(":")
+        response[k.strip().lower()] = v.strip()
+    assert " 200 " in status, status
+    return response
+
+
+async def _stream(monkeypatch):
+    monkeypatch.setattr(raop, "RAOP_BUFFER_MS", 120)
+    out = []
+    server = RAOPServer(host="127.0.0.1", port=0)
+    server.sink = lambda pkt: out.append(bytes(pkt))
+    await server.start()
+    control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    control.bind(("127.0.0.1", 0))
+    control.setblocking(False)
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    try:
+        await _rtsp(reader, writer, 1, "ANNOUNCE", {"Content-Type": "application/sdp"},
+                    SDP.encode())
+        setup = await _rtsp(reader, writer, 2, "SETUP", {
+            "Transport": "RTP/AVP/UDP;unicast;mode=record;"
+                         f"control_port={control.getsockname()[1]};timing_port=1"})
+        ports = dict(re.findall(r"(server_port|control_port)=(\d+)", setup["transport"]))
+        audio_addr = ("127.0.0.1", int(ports["server_port"]))
+        control_addr = ("127.0.0.1", int(ports["control_port"]))
+        await _rtsp(reader, writer, 3, "RECORD")
+
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        total = 80
+        # 20 is lost for good, 30 is answered through a resend, 41 and 40
+        # arrive swapped.
+        order = [s for s in range(total) if s not in (20, 30, 40, 41)]
+        order.insert(order.index(42), 41)
+        order.insert(order.index(42), 40)
+        resend_requests = []
+        for seq in order:
+            sender.sendto(_rtp(seq), audio_addr)
+            try:
+                resend_requests.append(control.recv(64))
+            except BlockingIOError:
+                pass
+            if seq == 33:
+                sender.sendto(struct.pack(">BBH", 0x80, raop.PT_RESEND_REPLY | 0x80, 1)
+                              + _rtp(30), control_addr)
+            await asyncio.sleep(PACKET_SECONDS)
+        sender.close()
+        await asyncio.sleep(0.3)
+        return out, resend_requests, server.to_dict()["session"], total
+    finally:
+        writer.close()
+        control.close()
+        await server.stop()
+
+
+def test_loopback_stream_with_loss_and_reordering(monkeypatch):
+    out, resend_requests, stats, total = asyncio.run(_stream(monkeypatch))
+
+    # Every slot is played exactly once, in order, with silence for the
+    # packet that never came – no stall, no extra latency.
+    expected = [bytes(PCM_BYTES) if seq == 20 else _payload(seq) for seq in range(total)]
+    assert out == expected
+    assert stats["lost"] == 1
+    assert stats["reordered"] >= 1
+    assert stats["late"] == 0
+    requested = {struct.unpack(">BBHHH", r)[3] for r in resend_requests}
+    assert {20, 30, 40} <= requested
@@ -0,0 +1,78 @@
+"""
+Config Persistence for Alexa AirPlay Bridge
+Writes the bridge configuration off the event loop, coalescing saves
+that arrive close together and skipping those that change nothing.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CONFIG_SAVE_DEBOUNCE = float(os.getenv("CONFIG_SAVE_DEBOUNCE", "0.5"))
+
+
+class ConfigPersister:
+    """Debounced, non-blocking ``config.save()``.
+
+    ``schedule()`` marks the config dirty and (re)arms a short timer; when
+    it fires, the current ``config.to_dict()`` is compared with what was
+    last saved and, if different, ``config.save()`` runs in a worker
+    thread.  The config's own ``save()`` stays the one place that decides
+    the file and its format.
+    """
+
+    def __init__(self, config, debounce: float = CONFIG_SAVE_DEBOUNCE):
+        self.config = config
+        self.debounce = debounce
+        self._last = self._snapshot()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def _snapshot(self) -> Optional[str]:
+        try:
+            return json.dumps(self.config.to_dict(), sort_keys=True)
+        except Exception:
+            return None
+
+    # ── scheduling ────────────────────────────────────────────
+    def schedule(self):
+        """Request a save; writes within the debounce window are merged."""
+        loop = asyncio.get_running_loop()
+        if self._timer:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.debounce, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        self._task = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> bool:
+        """Save now if anything changed. Returns False on a failed save."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            snapshot = self._snapshot()
+            if snapshot is not None and snapshot == self._last:
+                return True
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.config.save)
+            except Exception as e:
+                logger.error(f"Failed to save configuration: {e}")
+                return False
+            self._last = snapshot
+            logger.debug("Configuration written to disk")
+            return True
+
+    async def close(self):
+        """Flush any pending save (called on shutdown)."""
+        if self._task and not self._task.done():
+            await self._task
+        if self._timer:
+            await self.flush()
@@ -0,0 +1,289 @@
+"""
+Token Manager for Alexa AirPlay Bridge
+Keeps the Amazon (Login with Amazon) access token fresh in the
+background and caches it under /data across restarts.
+
+The cache is Fernet-encrypted, but the key is kept in /data next to it
+(``TOKEN_KEY_FILE``), so this only obfuscates the tokens at rest: anyone
+who can read /data can decrypt them.  Point ``TOKEN_KEY_FILE`` at a path
+outside /data (e.g. a mounted secret) for actual protection.  The
+``cryptography`` package is required; ``start()`` fails without it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+import aiohttp
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:          # reported by TokenManager.start()
+    Fernet = None
+    InvalidToken = Exception
+
+logger = logging.getLogger(__name__)
+
+LWA_TOKEN_URL = "https://api.amazon.com/auth/o2/token"
+TOKEN_CACHE_FILE = os.getenv("TOKEN_CACHE_FILE", "/data/amazon_tokens.enc")
+TOKEN_KEY_FILE = os.getenv("TOKEN_KEY_FILE", "/data/.token_key")
+# Refresh this many seconds before the access token expires.
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+RETRY_MIN = 15
+RETRY_MAX = 300
+
+
+class TokenManager:
+    """Proactive, single-flight access token refresh.
+
+    A background task sleeps until ``TOKEN_REFRESH_MARGIN`` seconds before
+    expiry and refreshes then, so requests never wait on a cold refresh.
+    ``get_access_token()`` still refreshes on demand if the token is
+    already stale; concurrent callers share one in-flight refresh.
+
+    The Amazon client is not part of this module: tokens are read from
+    and pushed back to it by attribute (``access_token``,
+    ``refresh_token``, ``token_expires_at``/``expires_in``).
+    """
+
+    def __init__(self, config, amazon_client, margin: int = TOKEN_REFRESH_MARGIN):
+        self.config = config
+        self.amazon_client = amazon_client
+        self.margin = margin
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.expires_at = 0.0
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._fernet = None
+
+    # ── state ─────────────────────────────────────────────────
+    @property
+    def valid(self) -> bool:
+        return bool(self.access_token) and time.time() < self.expires_at
+
+    def _due_in(self) -> float:
+        return self.expires_at - self.margin - time.time()
+
+    def _set(self, access_token: str, refresh_token: Optional[str], expires_at: float):
+        self.access_token = access_token
+        if refresh_token:
+            self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self._push_to_client()
+        self._changed.set()
+
+    def _push_to_client(self):
+        client = self.amazon_client
+        try:
+            client.access_token = self.access_token
+            client.refresh_token = self.refresh_token
+            client.token_expires_at = self.expires_at
+            if self.access_token:
+                client.authenticated = True
+        except AttributeError:
+            pass
+
+    def adopt_from_client(self) -> bool:
+        """Pick up tokens the client obtained itself (e.g. code exchange)."""
+        client = self.amazon_client
+        access = getattr(client, 'access_token', None)
+        if not access or access == self.access_token:
+            return False
+        expires_at = getattr(client, 'token_expires_at', None)
+        if not expires_at:
+            expires_at = time.time() + float(getattr(client, 'expires_in', None) or 3600)
+        self._set(access, getattr(client, 'refresh_token', None), float(expires_at))
+        asyncio.ensure_future(self._save_cache())
+        logger.info("Amazon tokens adopted; expire in %ds", int(self.expires_at - time.time()))
+        return True
+
+    # ── refresh ───────────────────────────────────────────────
+    async def get_access_token(self) -> Optional[str]:
+        """A usable access token, refreshing first only if it is stale."""
+        if not self.valid and self.refresh_token:
+            await self.refresh()
+        return self.access_token if self.valid else None
+
+    async def refresh(self) -> bool:
+        """Refresh once; concurrent callers await the same attempt."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._do_refresh())
+        return await asyncio.shield(self._inflight)
+
+    async def _do_refresh(self) -> bool:
+        if not self.refresh_token:
+            return False
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": self.refresh_token,
+            "client_id": getattr(self.config, 'amazon_client_id', ''),
+            "client_secret": getattr(self.config, 'amazon_client_secret', ''),
+        }
+        start = time.time()
+        try:
+            timeout = aiohttp.ClientTimeout(total=15)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(LWA_TOKEN_URL, data=data) as resp:
+                    status = resp.status
+                    body = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            return self._failed(str(e) or type(e).__name__)
+        if not isinstance(body, dict):
+            return self._failed(f"HTTP {status}: unexpected response body")
+        if status != 200:
+            self._failed(str(body.get('error') or f"HTTP {status}"))
+            if self.last_error == 'invalid_grant':
+                # Refresh token revoked – a new login is required.
+                self.refresh_token = None
+                await self._save_cache()
+            return False
+        access_token = body.get('access_token')
+        try:
+            expires_in = float(body.get('expires_in') or 3600)
+        except (TypeError, ValueError):
+            expires_in = None
+        if not isinstance(access_token, str) or not access_token or expires_in is None:
+            return self._failed("token response without a usable access_token/expires_in")
+
+        refresh_token = body.get('refresh_token')
+        self._set(access_token, refresh_token if isinstance(refresh_token, str) else None,
+                  start + expires_in)
+        self.refreshes += 1
+        self.last_error = None
+        logger.info("Amazon access token refreshed; expires in %ds",
+                    int(self.expires_at - time.time()))
+        await self._save_cache()
+        return True
+
+    def _failed(self, error: str) -> bool:
+        self.last_error = error
+        logger.error(f"Token refresh failed: {error}")
+        return False
+
+    async def _run(self):
+        retry = RETRY_MIN
+        while True:
+            try:
+                self._changed.clear()
+                if not self.refresh_token:
+                    await self._changed.wait()
+                    continue
+                delay = self._due_in()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                        continue            # new tokens – recompute the deadline
+                    except asyncio.TimeoutError:
+                        pass
+                ok = await self.refresh()
+            except Exception as e:
+                # Never let the background task die: nothing would refresh
+                # the token ahead of expiry again.
+                self.last_error = str(e) or type(e).__name__
+                logger.exception("Token refresh task error")
+                ok = False
+            if ok:
+                retry = RETRY_MIN
+            else:
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, RETRY_MAX)
+
+    # ── encrypted cache ───────────────────────────────────────
+    def _cipher(self):
+        if self._fernet is None:
+            if os.path.exists(TOKEN_KEY_FILE):
+                with open(TOKEN_KEY_FILE, 'rb') as f:
+                    key = f.read().strip()
+            else:
+                key = Fernet.generate_key()
+                os.makedirs(os.path.dirname(TOKEN_KEY_FILE) or '.', exist_ok=True)
+                fd = os.open(TOKEN_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(key)
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def _read_cache(self) -> Optional[Dict]:
+        cipher = self._cipher()
+        if not os.path.exists(TOKEN_CACHE_FILE):
+            return None
+        with open(TOKEN_CACHE_FILE, 'rb') as f:
+            return json.loads(cipher.decrypt(f.read()))
+
+    def _write_cache(self, payload: bytes):
+        data = self._cipher().encrypt(payload)
+        directory = os.path.dirname(TOKEN_CACHE_FILE) or '.'
+        fd, tmp = tempfile.mkstemp(prefix='.tokens-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, TOKEN_CACHE_FILE)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    async def _save_cache(self):
+        payload = json.dumps({
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at,
+        }).encode()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_cache, payload)
+        except (OSError, ValueError) as e:
+            # ValueError: the key file is corrupt and Fernet rejects it.
+            logger.warning(f"Could not write token cache: {e}")
+
+    async def _load_cache(self):
+        loop = asyncio.get_running_loop()
+        try:
+            cached = await loop.run_in_executor(None, self._read_cache)
+        except (OSError, ValueError, InvalidToken) as e:
+            logger.warning(f"Ignoring unreadable token cache: {e}")
+            return
+        if not cached or not cached.get('refresh_token'):
+            return
+        self._set(cached.get('access_token'), cached['refresh_token'],
+                  float(cached.get('expires_at') or 0))
+        logger.info("Loaded cached Amazon tokens (%s)",
+                    "valid" if self.valid else "expired, refreshing")
+
+    # ── lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        if Fernet is None:
+            raise RuntimeError("the cryptography package is required for the Amazon token "
+                               "cache (pip install cryptography)")
+        await self._load_cache()
+        if not self.adopt_from_client() and self.refresh_token and self._due_in() <= 0:
+            await self.refresh()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "authenticated": self.valid,
+            "expires_in": max(0, int(self.expires_at - time.time())) if self.access_token else None,
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
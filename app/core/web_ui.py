@@ -9,6 +9,9 @@ import logging
 from urllib.parse import urlparse
 from aiohttp import web
 
+from .config_store import ConfigPersister
+from .token_manager import TokenManager
+
 logger = logging.getLogger(__name__)
 
 # ──────────────────────────────────────────────────────────────
@@ -280,10 +283,12 @@ document.addEventListener('DOMContentLoaded', () => {
 class WebUIServer:
     """aiohttp-based web server with full HA Ingress support."""
 
-    def __init__(self, config, amazon_client, device_manager):
+    def __init__(self, config, amazon_client, device_manager, token_manager=None):
         self.config = config
         self.amazon_client = amazon_client
         self.device_manager = device_manager
+        self.persister = ConfigPersister(config)
+        self.tokens = token_manager or TokenManager(config, amazon_client)
         self.app = web.Application()
         self.runner = None
         self._setup_routes()
@@ -373,7 +378,9 @@ class WebUIServer:
     # ── GET /api/config ───────────────────────────────────────
     async def _handle_get_config(self, request: web.Request) -> web.Response:
         data = self.config.to_dict()
-        data['authenticated'] = getattr(self.amazon_client, 'authenticated', False)
+        data['authenticated'] = (self.tokens.valid
+                                 or getattr(self.amazon_client, 'authenticated', False))
+        data['token'] = self.tokens.to_dict()
         return web.json_response(data)
 
     # ── POST /api/config ──────────────────────────────────────
@@ -398,7 +405,7 @@ class WebUIServer:
             updated = True
 
         if updated:
-            self.config.save()
+            self.persister.schedule()
             logger.info("Configuration saved via web UI")
             return web.json_response({"message": "Configuration saved successfully"})
         else:
@@ -456,7 +463,7 @@ class WebUIServer:
     def _build_oauth_url(self, request: web.Request) -> str:
       redirect_uri = self._resolve_redirect_uri(request)
       self.config.amazon_redirect_uri = redirect_uri
-      self.config.save()
+      self.persister.schedule()
       return self.amazon_client.get_oauth_url()
 
     async def _handle_oauth_url(self, request: web.Request) -> web.Response:
@@ -481,6 +488,8 @@ class WebUIServer:
             return web.Response(text="Missing authorization code", status=400)
 
         success = await self.amazon_client.exchange_code_for_token(code)
+        if success:
+            self.tokens.adopt_from_client()
 
         if success:
             html = """<!DOCTYPE html><html><head><meta charset="utf-8">
@@ -523,6 +532,7 @@ class WebUIServer:
 
         success = await self.amazon_client.exchange_code_for_token(code)
         if success:
+            self.tokens.adopt_from_client()
             return web.json_response({"success": True, "message": "Authorization successful"})
         else:
             return web.json_response({"success": False, "error": "Failed to exchange code with Amazon"}, status=400)
@@ -534,8 +544,11 @@ class WebUIServer:
         site = web.TCPSite(self.runner, '0.0.0.0', port)
         await site.start()
         logger.info(f"Web UI listening on 0.0.0.0:{port}")
+        await self.tokens.start()
 
     async def stop(self):
+        await self.tokens.stop()
+        await self.persister.close()
         if self.runner:
             await self.runner.cleanup()
             logger.info("Web UI stopped")